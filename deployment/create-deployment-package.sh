@@ -19,11 +19,27 @@ cp deploy.sh "$PACKAGE_DIR/"
 cp spa-creator-stack.yaml "$PACKAGE_DIR/"
 cp spa-creator-policy.json "$PACKAGE_DIR/"
 cp spa-creator-lambda.py "$PACKAGE_DIR/"
+cp provisioning_engine.py "$PACKAGE_DIR/"
+cp inventory.py "$PACKAGE_DIR/"
+cp spa_templates.py "$PACKAGE_DIR/"
+cp aws_clients.py "$PACKAGE_DIR/"
+cp api_responses.py "$PACKAGE_DIR/"
+cp aws_metrics.py "$PACKAGE_DIR/"
+cp structured_log.py "$PACKAGE_DIR/"
 cp backend-list-bucket.py "$PACKAGE_DIR/"
 cp backend-upload-url.py "$PACKAGE_DIR/"
 cp backend-user-info.py "$PACKAGE_DIR/"
+cp backend-router.py "$PACKAGE_DIR/"
+cp manifest-indexer.py "$PACKAGE_DIR/"
 cp test-complete-flow.sh "$PACKAGE_DIR/"
 cp cleanup-resources.sh "$PACKAGE_DIR/"
+cp cleanup-resources.py "$PACKAGE_DIR/"
+cp cleanup_engine.py "$PACKAGE_DIR/"
+cp idempotency.py "$PACKAGE_DIR/"
+cp admission.py "$PACKAGE_DIR/"
+cp tenancy.py "$PACKAGE_DIR/"
+cp reconcile-manifest.sh "$PACKAGE_DIR/"
+cp fleet-inventory.py "$PACKAGE_DIR/"
 cp README.md "$PACKAGE_DIR/"
 cp DEPLOYMENT-GUIDE.md "$PACKAGE_DIR/"
 cp API-REFERENCE.md "$PACKAGE_DIR/"
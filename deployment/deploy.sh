@@ -41,9 +41,13 @@ echo ""
 ACCOUNT_ID=$(aws sts get-caller-identity --query Account --output text)
 REGION=$(aws configure get region || echo "us-east-1")
 
+# CONSOLIDATED_BACKEND=true deploys one routed backend function instead of three
+CONSOLIDATED_BACKEND="${CONSOLIDATED_BACKEND:-false}"
+
 echo "Deployment Configuration:"
 echo "  AWS Account: $ACCOUNT_ID"
 echo "  Region: $REGION"
+echo "  Consolidated backend: $CONSOLIDATED_BACKEND"
 echo ""
 
 read -p "Continue with deployment? (yes/no): " confirm
@@ -69,6 +73,7 @@ aws cloudformation create-stack \
   --stack-name servicenow-spa-creator \
   --template-body file://spa-creator-stack.yaml \
   --parameters ParameterKey=EnvironmentName,ParameterValue=sandbox \
+               ParameterKey=ConsolidatedBackend,ParameterValue="$CONSOLIDATED_BACKEND" \
   --capabilities CAPABILITY_NAMED_IAM > /dev/null
 
 aws cloudformation wait stack-create-complete \
@@ -106,7 +111,8 @@ echo "=========================================="
 
 # SPA Creator
 echo "Deploying SPA Creator Lambda..."
-zip -q spa-creator-lambda.zip spa-creator-lambda.py
+zip -q spa-creator-lambda.zip spa-creator-lambda.py provisioning_engine.py inventory.py cleanup_engine.py idempotency.py \
+  admission.py tenancy.py spa_templates.py aws_clients.py aws_metrics.py structured_log.py
 aws lambda update-function-code \
   --function-name sandbox-spa-creator \
   --zip-file fileb://spa-creator-lambda.zip > /dev/null
@@ -117,29 +123,49 @@ echo "✅ SPA Creator deployed"
 
 # Backend functions
 echo "Deploying Backend Lambda functions..."
-zip -q backend-list-bucket.zip backend-list-bucket.py
-aws lambda update-function-code \
-  --function-name sandbox-backend-list-bucket \
-  --zip-file fileb://backend-list-bucket.zip > /dev/null
-aws lambda update-function-configuration \
-  --function-name sandbox-backend-list-bucket \
-  --handler backend-list-bucket.lambda_handler > /dev/null
-
-zip -q backend-upload-url.zip backend-upload-url.py
-aws lambda update-function-code \
-  --function-name sandbox-backend-upload-url \
-  --zip-file fileb://backend-upload-url.zip > /dev/null
-aws lambda update-function-configuration \
-  --function-name sandbox-backend-upload-url \
-  --handler backend-upload-url.lambda_handler > /dev/null
+if [ "$CONSOLIDATED_BACKEND" == "true" ]; then
+  # One routed function serves every backend route
+  zip -q backend-router.zip backend-router.py backend-list-bucket.py backend-upload-url.py backend-user-info.py \
+    api_responses.py tenancy.py aws_clients.py aws_metrics.py structured_log.py
+  aws lambda update-function-code \
+    --function-name sandbox-backend-router \
+    --zip-file fileb://backend-router.zip > /dev/null
+  aws lambda update-function-configuration \
+    --function-name sandbox-backend-router \
+    --handler backend-router.lambda_handler > /dev/null
+else
+  zip -q backend-list-bucket.zip backend-list-bucket.py api_responses.py tenancy.py aws_clients.py aws_metrics.py structured_log.py
+  aws lambda update-function-code \
+    --function-name sandbox-backend-list-bucket \
+    --zip-file fileb://backend-list-bucket.zip > /dev/null
+  aws lambda update-function-configuration \
+    --function-name sandbox-backend-list-bucket \
+    --handler backend-list-bucket.lambda_handler > /dev/null
+
+  zip -q backend-upload-url.zip backend-upload-url.py api_responses.py tenancy.py aws_clients.py aws_metrics.py structured_log.py
+  aws lambda update-function-code \
+    --function-name sandbox-backend-upload-url \
+    --zip-file fileb://backend-upload-url.zip > /dev/null
+  aws lambda update-function-configuration \
+    --function-name sandbox-backend-upload-url \
+    --handler backend-upload-url.lambda_handler > /dev/null
+
+  zip -q backend-user-info.zip backend-user-info.py api_responses.py aws_clients.py aws_metrics.py structured_log.py
+  aws lambda update-function-code \
+    --function-name sandbox-backend-user-info \
+    --zip-file fileb://backend-user-info.zip > /dev/null
+  aws lambda update-function-configuration \
+    --function-name sandbox-backend-user-info \
+    --handler backend-user-info.lambda_handler > /dev/null
+fi
 
-zip -q backend-user-info.zip backend-user-info.py
+zip -q manifest-indexer.zip manifest-indexer.py aws_clients.py aws_metrics.py structured_log.py
 aws lambda update-function-code \
-  --function-name sandbox-backend-user-info \
-  --zip-file fileb://backend-user-info.zip > /dev/null
+  --function-name sandbox-manifest-indexer \
+  --zip-file fileb://manifest-indexer.zip > /dev/null
 aws lambda update-function-configuration \
-  --function-name sandbox-backend-user-info \
-  --handler backend-user-info.lambda_handler > /dev/null
+  --function-name sandbox-manifest-indexer \
+  --handler manifest-indexer.lambda_handler > /dev/null
 
 echo "✅ All Lambda functions deployed"
 echo ""
@@ -0,0 +1,238 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+# Token buckets and in-flight leases share the resources table with SPA records, in their own partitions
+RATE_PARTITION_PREFIX = 'rate#'
+IN_FLIGHT_PARTITION = 'admission#in-flight'
+IN_FLIGHT_COUNTER = {'username': IN_FLIGHT_PARTITION, 'createdAt': 'counter'}
+# Returned by acquire_slot when the in-flight cap is off; release_slot ignores it
+NO_LEASE = 'unlimited'
+# Bucket records nobody touched for a day expire through the table's ttl attribute
+RECORD_TTL_SECONDS = 86400
+# After a refused slot, this container refuses locally for this long instead of asking DynamoDB again
+SLOT_RETRY_SECONDS = 1.0
+# Expired leases (their holder timed out or crashed) are looked for at most this often
+RECLAIM_INTERVAL_SECONDS = 30.0
+DENIED_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+# Bucket key -> time.time() before which a request is refused without a DynamoDB call
+_denied = {}
+_slots_refused_until = 0.0
+_last_reclaim = 0.0
+
+
+def bucket_key(scope, identity):
+    return {'username': f'{RATE_PARTITION_PREFIX}{scope}#{identity}', 'createdAt': 'bucket'}
+
+
+def acquire_tokens(table, scope, identity, rate, burst, cost=1):
+    """
+    Take cost tokens from the (scope, identity) token bucket, which refills at
+    rate per second up to burst. Returns 0 when admitted, otherwise the seconds
+    until enough tokens will have accrued.
+
+    The bucket is stored as its theoretical arrival time (GCRA): tat is when it
+    will be full again, so it holds (burst - (tat - now) * rate) tokens. A take
+    is a single conditional UpdateItem that DynamoDB applies atomically, so
+    concurrent requests never overwrite each other and a request is only
+    refused when the tokens really are gone. A refusal is remembered in this
+    container until tokens are due, so a flood is shed without touching
+    DynamoDB at all.
+    """
+    if rate <= 0:
+        return 0
+    cost = min(cost, burst)
+    key = bucket_key(scope, identity)
+    name = key['username']
+    now = time.time()
+    with _lock:
+        denied_until = _denied.get(name, 0.0)
+    if denied_until > now:
+        return denied_until - now
+
+    # One now for both attempts: if the first finds tat >= now, the second
+    # can only fail because tat is past the limit, never because of a race
+    values = {
+        ':now': timestamp(now),
+        ':interval': timestamp(cost / rate),
+        ':ttl': int(now) + RECORD_TTL_SECONDS
+    }
+    try:
+        # Full bucket (tat in the past, or a new one): it empties by cost
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET tat = :full_tat, #ttl = :ttl',
+            ConditionExpression='attribute_not_exists(tat) OR tat < :now',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues=dict(values, **{':full_tat': timestamp(now + cost / rate)})
+        )
+        return 0
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    try:
+        # Partly spent: admitted while tat stays within burst of now
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET tat = tat + :interval, #ttl = :ttl',
+            ConditionExpression='tat BETWEEN :now AND :limit',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues=dict(values, **{':limit': timestamp(now + (burst - cost) / rate)})
+        )
+        return 0
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    # tat is past the limit, and never more than cost / rate past it
+    retry_after = cost / rate
+    remember_denied(name, now + retry_after)
+    return retry_after
+
+
+def refund_tokens(table, scope, identity, rate, cost=1):
+    """Give back cost tokens taken by acquire_tokens, for a request that was refused further on"""
+    if rate <= 0:
+        return
+    key = bucket_key(scope, identity)
+    with _lock:
+        _denied.pop(key['username'], None)
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET tat = tat - :interval',
+            ConditionExpression='attribute_exists(tat)',
+            ExpressionAttributeValues={':interval': timestamp(cost / rate)}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def timestamp(seconds):
+    return Decimal(str(round(seconds, 3)))
+
+
+def remember_denied(name, until):
+    with _lock:
+        if len(_denied) >= DENIED_CACHE_SIZE:
+            now = time.time()
+            for stale in [n for n, t in _denied.items() if t <= now]:
+                del _denied[stale]
+            if len(_denied) >= DENIED_CACHE_SIZE:
+                _denied.clear()
+        _denied[name] = until
+
+
+def acquire_slot(table, client, limit, lease_seconds):
+    """
+    Take one of limit provisioning slots shared by every container. Returns
+    (lease_id, 0) when admitted, or (None, retry_after) at the cap. The counter
+    and a lease record are written in one transaction, so a lease whose holder
+    never released it (a timed-out invocation) can be found and reclaimed once
+    it expires.
+    """
+    global _slots_refused_until
+    if limit <= 0:
+        return NO_LEASE, 0
+    now = time.time()
+    if _slots_refused_until > now:
+        return None, _slots_refused_until - now
+
+    for attempt in range(2):
+        lease_id = str(uuid.uuid4())
+        try:
+            client.transact_write_items(TransactItems=[
+                {
+                    'Update': {
+                        'TableName': table.name,
+                        'Key': serialize(IN_FLIGHT_COUNTER),
+                        'UpdateExpression': 'ADD inFlight :one',
+                        'ConditionExpression': 'attribute_not_exists(inFlight) OR inFlight < :limit',
+                        'ExpressionAttributeValues': serialize({':one': 1, ':limit': limit})
+                    }
+                },
+                {
+                    'Put': {
+                        'TableName': table.name,
+                        'Item': serialize({
+                            'username': IN_FLIGHT_PARTITION,
+                            'createdAt': f'lease#{lease_id}',
+                            # Not expiresAt: that is the expiry index's String sort key, and a Number there fails the write
+                            'leaseExpiresAt': int(now) + lease_seconds,
+                            'ttl': int(now) + lease_seconds + RECORD_TTL_SECONDS
+                        })
+                    }
+                }
+            ])
+            return lease_id, 0
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+        if attempt == 0 and not reclaim_expired(table, client):
+            break
+
+    _slots_refused_until = time.time() + SLOT_RETRY_SECONDS
+    return None, SLOT_RETRY_SECONDS
+
+
+def release_slot(table, client, lease_id):
+    """Give a slot back. The lease must still exist, so a reclaimed lease is never counted twice"""
+    if lease_id in (None, NO_LEASE):
+        return
+    try:
+        client.transact_write_items(TransactItems=[
+            {
+                'Delete': {
+                    'TableName': table.name,
+                    'Key': serialize({'username': IN_FLIGHT_PARTITION, 'createdAt': f'lease#{lease_id}'}),
+                    'ConditionExpression': 'attribute_exists(createdAt)'
+                }
+            },
+            {
+                'Update': {
+                    'TableName': table.name,
+                    'Key': serialize(IN_FLIGHT_COUNTER),
+                    'UpdateExpression': 'ADD inFlight :minus_one',
+                    'ExpressionAttributeValues': serialize({':minus_one': -1})
+                }
+            }
+        ])
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+
+
+def reclaim_expired(table, client):
+    """Release leases past their leaseExpiresAt. Returns how many; runs at most once per RECLAIM_INTERVAL_SECONDS"""
+    global _last_reclaim
+    now = time.time()
+    with _lock:
+        if now - _last_reclaim < RECLAIM_INTERVAL_SECONDS:
+            return 0
+        _last_reclaim = now
+
+    kwargs = {
+        'KeyConditionExpression': '#username = :partition AND begins_with(createdAt, :lease)',
+        'FilterExpression': 'leaseExpiresAt < :now',
+        'ExpressionAttributeNames': {'#username': 'username'},
+        'ExpressionAttributeValues': {':partition': IN_FLIGHT_PARTITION, ':lease': 'lease#', ':now': int(now)}
+    }
+    reclaimed = 0
+    while True:
+        response = table.query(**kwargs)
+        for item in response.get('Items', []):
+            release_slot(table, client, item['createdAt'][len('lease#'):])
+            reclaimed += 1
+        if 'LastEvaluatedKey' not in response:
+            return reclaimed
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def serialize(item):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    return {key: serializer.serialize(value) for key, value in item.items()}
@@ -0,0 +1,17 @@
+import json
+
+
+def create_response(status_code, body, methods='GET,OPTIONS', allow_headers='Content-Type', extra_headers=None):
+    """Create API Gateway response with CORS headers; a None body is sent empty (e.g. 304)"""
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': allow_headers,
+        'Access-Control-Allow-Methods': methods
+    }
+    headers.update(extra_headers or {})
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': '' if body is None else json.dumps(body, default=str)
+    }
@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+import aws_metrics
+import structured_log as log
+
+# Log how long each client took to create; pair with PYTHONPROFILEIMPORTTIME=1 for import times
+COLD_START_PROFILE = os.environ.get('COLD_START_PROFILE', 'false').lower() == 'true'
+
+# Handlers create the clients they list in prewarm() during init. Leaving them to first use only
+# moved importing boto3 and building clients (~300 ms) from init into the first request, and init
+# is where provisioned concurrency pays for it ahead of traffic. AWS_CLIENTS_PREWARM=false restores
+# creation on first use, e.g. for local harnesses that swap in stand-ins
+PREWARM = os.environ.get('AWS_CLIENTS_PREWARM', 'true').lower() == 'true'
+
+# Client tuning. AWS_RETRY_MODE and AWS_MAX_ATTEMPTS are the names botocore reads itself;
+# adaptive mode adds client-side rate limiting to the retries once throttling starts
+RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '8'))
+# Batch provisioning runs up to BATCH_MAX_CONCURRENCY users x PROVISIONING_MAX_WORKERS steps at once
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '15'))
+TCP_KEEPALIVE = os.environ.get('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+# S3 bucket-configuration calls are throttled far sooner than object calls. They are paced
+# process-wide (calls per second, 0 disables) so parallel provisioning slows down together
+# instead of failing step by step
+S3_CONTROL_PLANE_RATE = float(os.environ.get('S3_CONTROL_PLANE_RATE', '20'))
+S3_CONTROL_PLANE_BURST = int(os.environ.get('S3_CONTROL_PLANE_BURST', '20'))
+S3_CONTROL_PLANE_OPERATIONS = frozenset({
+    'CreateBucket', 'DeleteBucket', 'PutBucketTagging', 'PutBucketWebsite', 'PutPublicAccessBlock',
+    'PutBucketCors', 'PutBucketLifecycleConfiguration', 'PutBucketPolicy', 'PutBucketNotificationConfiguration'
+})
+
+# Creating clients from the default boto3 session is not thread-safe
+_lock = threading.RLock()
+_instances = {}
+creation_times = {}
+
+
+class TokenBucket:
+    """
+    Paces callers to rate per second, allowing bursts of up to burst calls.
+    Tokens are reserved up front, so concurrent callers queue in order instead
+    of polling. A throttle halves the rate (down to min_rate) and every
+    successful call wins a little of it back, so all threads sharing the bucket
+    back off together and recover gradually.
+    """
+
+    RECOVERY_STEP = 0.05
+
+    def __init__(self, rate, burst, min_rate=None):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.min_rate = min_rate or max(self.max_rate / 16, 0.5)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until it is due. Returns the seconds waited"""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.RECOVERY_STEP)
+
+
+s3_control_plane = TokenBucket(S3_CONTROL_PLANE_RATE, S3_CONTROL_PLANE_BURST) if S3_CONTROL_PLANE_RATE > 0 else None
+
+
+class Lazy:
+    """Stands in for a client, resource or table until prewarm() or first use creates it"""
+
+    __slots__ = ('_factory',)
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def resolve(self):
+        return self._factory()
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+
+def client(service_name, **config):
+    """Lazy boto3 client; config holds botocore Config options, e.g. signature_version='s3v4'"""
+    return Lazy(lambda: get_client(service_name, **config))
+
+
+def resource(service_name):
+    return Lazy(lambda: get_resource(service_name))
+
+
+def table(table_name):
+    return Lazy(lambda: get_table(table_name))
+
+
+def prewarm(*lazies):
+    """Create the given clients now, during init, unless AWS_CLIENTS_PREWARM=false"""
+    if PREWARM:
+        for lazy in lazies:
+            if isinstance(lazy, Lazy):
+                lazy.resolve()
+
+
+def get_client(service_name, **config):
+    """The client for a service, created on first call and shared by every later caller"""
+    key = ('client', service_name) + tuple(sorted(f"{name}={value!r}" for name, value in config.items()))
+    return memoized(key, lambda: create_client(service_name, config))
+
+
+def get_resource(service_name):
+    return memoized(('resource', service_name), lambda: create_resource(service_name))
+
+
+def get_table(table_name):
+    return memoized(('table', table_name), lambda: get_resource('dynamodb').Table(table_name))
+
+
+def memoized(key, create):
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+    with _lock:
+        if key not in _instances:
+            started = time.perf_counter()
+            _instances[key] = create()
+            elapsed = (time.perf_counter() - started) * 1000
+            creation_times[':'.join(key)] = elapsed
+            if COLD_START_PROFILE:
+                log.info('Created client', client=':'.join(key), durationMs=round(elapsed, 1))
+        return _instances[key]
+
+
+def client_config(**overrides):
+    """Shared tuning (retries, connection pool, timeouts, keep-alive) with per-client options on top"""
+    from botocore.config import Config
+    config = Config(
+        retries={'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS},
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        tcp_keepalive=TCP_KEEPALIVE
+    )
+    return config.merge(Config(**overrides)) if overrides else config
+
+
+def create_client(service_name, config):
+    # Imported here so a handler with prewarming off pays for boto3 (~200 ms) only once a client is needed
+    import boto3
+    client = boto3.client(service_name, config=client_config(**config))
+    return pace_control_plane(aws_metrics.instrument(client))
+
+
+def create_resource(service_name):
+    import boto3
+    resource = boto3.resource(service_name, config=client_config())
+    aws_metrics.instrument(resource.meta.client)
+    pace_control_plane(resource.meta.client)
+    return resource
+
+
+def pace_control_plane(client):
+    """Route an S3 client's bucket-configuration calls, retries included, through s3_control_plane"""
+    if s3_control_plane is None or client.meta.service_model.service_name != 's3':
+        return client
+    events = client.meta.events
+    events.register('before-sign.s3', before_control_plane_attempt, unique_id='control-plane-before-sign')
+    events.register('needs-retry.s3', after_control_plane_attempt, unique_id='control-plane-needs-retry')
+    return client
+
+
+def before_control_plane_attempt(operation_name, **kwargs):
+    # Fires for every attempt, retries included, and for presigning (never a control-plane call)
+    if operation_name in S3_CONTROL_PLANE_OPERATIONS:
+        s3_control_plane.acquire()
+
+
+def after_control_plane_attempt(response, operation, **kwargs):
+    if response is None or operation.name not in S3_CONTROL_PLANE_OPERATIONS:
+        return None
+    code = response[1].get('Error', {}).get('Code')
+    if code in aws_metrics.THROTTLE_ERROR_CODES or response[0].status_code in (429, 503):
+        s3_control_plane.throttled()
+    elif response[0].status_code < 300:
+        s3_control_plane.succeeded()
+    # Anything but None would be taken as the delay before a retry
+    return None
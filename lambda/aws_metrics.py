@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+import structured_log as log
+
+# Per-operation latency, retry and throttle metrics for the boto3 clients, gathered
+# through botocore's event hooks and written once per invocation
+AWS_METRICS = os.environ.get('AWS_METRICS', 'true').lower() == 'true'
+AWS_METRICS_NAMESPACE = os.environ.get('AWS_METRICS_NAMESPACE', 'SandboxSPA/AWSCalls')
+INSTRUMENTED_SERVICES = ('s3', 'dynamodb')
+
+# Histogram bucket upper bounds; EMF takes at most 100 distinct values per metric
+LATENCY_BUCKETS_MS = (1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750,
+                      1000, 1500, 2000, 3000, 5000, 10000)
+
+THROTTLE_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestThrottledException', 'TooManyRequestsException', 'SlowDown',
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded', 'TransactionInProgressException'
+}
+
+STARTED = 'aws_metrics_started'
+
+
+class OperationStats:
+    """Latency histogram and counters for one service operation"""
+
+    __slots__ = ('buckets', 'count', 'total_ms', 'min_ms', 'max_ms', 'retries', 'throttles', 'errors')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.retries = 0
+        self.throttles = 0
+        self.errors = 0
+
+    def add(self, elapsed_ms, retries=0, error=False):
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.min_ms = elapsed_ms if self.min_ms is None else min(self.min_ms, elapsed_ms)
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.retries += retries
+        self.errors += 1 if error else 0
+
+    def histogram(self):
+        """EMF histogram: each bucket is reported at its upper bound, overflow at the observed max"""
+        values, counts = [], []
+        for index, count in enumerate(self.buckets):
+            if count:
+                values.append(LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else round(self.max_ms, 1))
+                counts.append(count)
+        return {
+            'Values': values,
+            'Counts': counts,
+            'Min': round(self.min_ms or 0.0, 2),
+            'Max': round(self.max_ms, 2),
+            'Sum': round(self.total_ms, 2),
+            'Count': self.count
+        }
+
+
+class EmfExporter:
+    """Prints CloudWatch Embedded Metric Format lines, which Lambda's log ingestion turns into metrics"""
+
+    def export(self, function_name, operations):
+        timestamp = int(time.time() * 1000)
+        for (service, operation), stats in sorted(operations.items()):
+            print(json.dumps({
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': AWS_METRICS_NAMESPACE,
+                        'Dimensions': [['FunctionName', 'Service', 'Operation']],
+                        'Metrics': [
+                            {'Name': 'Latency', 'Unit': 'Milliseconds'},
+                            {'Name': 'Retries', 'Unit': 'Count'},
+                            {'Name': 'Throttles', 'Unit': 'Count'},
+                            {'Name': 'Errors', 'Unit': 'Count'}
+                        ]
+                    }]
+                },
+                'FunctionName': function_name,
+                'Service': service,
+                'Operation': operation,
+                'requestId': log.current_request.get('requestId'),
+                'Latency': stats.histogram(),
+                'Retries': stats.retries,
+                'Throttles': stats.throttles,
+                'Errors': stats.errors
+            }))
+
+
+class LocalExporter:
+    """Keeps exported invocations in memory, for offline replays and tests"""
+
+    def __init__(self):
+        self.invocations = []
+
+    def export(self, function_name, operations):
+        self.invocations.append({
+            'function': function_name,
+            'operations': {
+                f'{service}.{operation}': {
+                    'latency': stats.histogram(),
+                    'retries': stats.retries,
+                    'throttles': stats.throttles,
+                    'errors': stats.errors
+                }
+                for (service, operation), stats in sorted(operations.items())
+            }
+        })
+
+    def clear(self):
+        self.invocations.clear()
+
+
+exporter = EmfExporter()
+# Provisioning steps run on worker threads, so recording takes a lock
+_lock = threading.Lock()
+_operations = {}
+
+
+def set_exporter(new_exporter):
+    """Swap the exporter, e.g. set_exporter(LocalExporter()); returns the previous one"""
+    global exporter
+    previous, exporter = exporter, new_exporter
+    return previous
+
+
+def instrument(client):
+    """Register the metric hooks on a boto3 client (a resource's client is client.meta.client)"""
+    if not AWS_METRICS:
+        return client
+    service = client.meta.service_model.service_name
+    if service not in INSTRUMENTED_SERVICES:
+        return client
+    events = client.meta.events
+    events.register(f'before-call.{service}', before_call, unique_id=f'aws-metrics-before-{service}')
+    events.register(f'after-call.{service}', after_call, unique_id=f'aws-metrics-after-{service}')
+    events.register(f'needs-retry.{service}', needs_retry, unique_id=f'aws-metrics-retry-{service}')
+    return client
+
+
+def before_call(context, **kwargs):
+    context[STARTED] = time.perf_counter()
+
+
+def after_call(http_response, parsed, model, context, **kwargs):
+    started = context.pop(STARTED, None)
+    if started is None:
+        return
+    metadata = parsed.get('ResponseMetadata', {})
+    record(model.service_model.service_name, model.name, (time.perf_counter() - started) * 1000,
+           retries=metadata.get('RetryAttempts', 0), error=http_response.status_code >= 300)
+
+
+def needs_retry(response, operation, **kwargs):
+    """Seen after every attempt, so throttles that were retried away are counted too"""
+    if response is None:
+        return None
+    code = response[1].get('Error', {}).get('Code')
+    if code in THROTTLE_ERROR_CODES or response[0].status_code == 429:
+        with _lock:
+            operation_stats(operation.service_model.service_name, operation.name).throttles += 1
+    return None
+
+
+def operation_stats(service, operation):
+    stats = _operations.get((service, operation))
+    if stats is None:
+        stats = _operations[(service, operation)] = OperationStats()
+    return stats
+
+
+def record(service, operation, elapsed_ms, retries=0, error=False):
+    with _lock:
+        operation_stats(service, operation).add(elapsed_ms, retries, error)
+
+
+def flush(function_name):
+    """Export and reset what this invocation recorded; nothing is written when no call was made"""
+    global _operations
+    with _lock:
+        operations, _operations = _operations, {}
+    if operations:
+        exporter.export(function_name, operations)
+
+
+log.after_request(flush)
@@ -1,18 +1,64 @@
+import base64
+import hashlib
 import json
-import boto3
 import os
+import threading
+import time
+from collections import OrderedDict
 from botocore.exceptions import ClientError
+import api_responses
+import aws_clients
+import structured_log as log
+import tenancy
 
-s3 = boto3.client('s3')
+# Same config as backend-upload-url, so a backend router container shares one S3 client
+s3 = aws_clients.client('s3', signature_version='s3v4')
 
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE')
+table = aws_clients.table(DYNAMODB_TABLE)
+
+# Object manifest kept by the manifest indexer; when unset every listing goes to S3
+MANIFEST_TABLE = os.environ.get('MANIFEST_TABLE')
+manifest = aws_clients.table(MANIFEST_TABLE) if MANIFEST_TABLE else None
+aws_clients.prewarm(s3, table, manifest)
+
+# Shared website bucket of the prefix-per-user tenancy mode; requests for it must name a user's prefix
+SHARED_SPA_BUCKET = os.environ.get('SHARED_SPA_BUCKET')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# S3 page size is fixed so a cursor can point into the middle of a page
+LIST_PAGE_SIZE = 1000
+# Upper bound on keys examined per request when filters skip most of them
+MAX_SCAN_KEYS = int(os.environ.get('MAX_SCAN_KEYS', '5000'))
+SORT_FIELDS = {'name', 'size', 'lastModified'}
+
+# Warm-container listing cache, validated against the bucket's listing version
+LISTING_CACHE_TTL = int(os.environ.get('LISTING_CACHE_TTL', '60'))
+LISTING_CACHE_SIZE = int(os.environ.get('LISTING_CACHE_SIZE', '128'))
+listing_cache = OrderedDict()
+listing_cache_lock = threading.Lock()
+
+
+class BadRequest(Exception):
+    pass
+
+@log.request_handler('backend-list-bucket')
 def lambda_handler(event, context):
     """
-    List contents of an S3 bucket
-    Query parameter: ?bucket=bucket-name
+    List contents of an S3 bucket, one page at a time
+    Query parameters: ?bucket=bucket-name
+        &limit=100            entries per page (max 1000)
+        &cursor=...           nextCursor from the previous page
+        &prefix=docs/         only keys under this prefix; in the shared
+                              bucket it must start with the user's prefix
+        &delimiter=/          roll keys up into folders
+        &name=report          case-insensitive substring of the key
+        &minSize=1&maxSize=2  size range in bytes (files only)
+        &sort=-size           name | size | lastModified, '-' for descending,
+                              applied within the page (pages follow key order)
     """
     
-    print(f"Received event: {json.dumps(event)}")
-    
     try:
         # Get bucket name from query parameters
         query_params = event.get('queryStringParameters', {}) or {}
@@ -21,36 +67,37 @@ def lambda_handler(event, context):
         if not bucket_name:
             return create_response(400, {'error': 'Bucket name is required'})
         
-        # Verify bucket belongs to our environment (security check)
+        # Verify the bucket, or the prefix in the shared bucket, belongs to a user of our environment
         environment = os.environ.get('ENVIRONMENT_NAME', 'sandbox')
-        if not bucket_name.startswith(f"{environment}-spa-"):
+        scope = tenancy.resolve_scope(bucket_name, query_params.get('prefix'), environment, SHARED_SPA_BUCKET, table)
+        if scope is None:
             return create_response(403, {'error': 'Access denied to this bucket'})
         
-        print(f"Listing contents of bucket: {bucket_name}")
+        try:
+            options = parse_options(query_params)
+        except BadRequest as e:
+            return create_response(400, {'error': str(e)})
         
-        # List objects in bucket
-        response = s3.list_objects_v2(Bucket=bucket_name)
+        cache_key = (bucket_name,) + tuple(sorted(options.items()))
+        version, cacheable = get_listing_version(bucket_name, scope)
+        cached = get_cached_listing(cache_key, version) if cacheable else None
         
-        # Format file list
-        files = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                files.append({
-                    'name': obj['Key'],
-                    'size': obj['Size'],
-                    'lastModified': obj['LastModified'].isoformat(),
-                    'url': f"https://{bucket_name}.s3.amazonaws.com/{obj['Key']}"
-                })
+        if cached:
+            result, etag = cached
+            log.debug('Serving cached listing of bucket: %s', bucket_name)
+            log.annotate(bucket=bucket_name, cached=True)
+        else:
+            log.debug('Listing contents of bucket: %s', bucket_name)
+            result = build_listing(bucket_name, options)
+            etag = compute_etag(result)
+            if cacheable:
+                put_cached_listing(cache_key, version, result, etag)
+            log.annotate(bucket=bucket_name, cached=False, files=result['fileCount'], folders=len(result['folders']))
         
-        result = {
-            'success': True,
-            'bucket': bucket_name,
-            'fileCount': len(files),
-            'files': files
-        }
+        if etag_matches(event, etag):
+            return create_response(304, None, {'ETag': etag})
         
-        print(f"Found {len(files)} files in bucket")
-        return create_response(200, result)
+        return create_response(200, result, {'ETag': etag})
         
     except ClientError as e:
         error_code = e.response['Error']['Code']
@@ -59,22 +106,286 @@ def lambda_handler(event, context):
         elif error_code == 'AccessDenied':
             return create_response(403, {'error': 'Access denied'})
         else:
-            print(f"S3 Error: {e}")
+            log.error('S3 error: %s', e)
             return create_response(500, {'error': f'S3 error: {error_code}'})
     except Exception as e:
-        print(f"Error: {e}")
+        log.error('Error: %s', e)
         return create_response(500, {'error': str(e)})
 
 
-def create_response(status_code, body):
-    """Create API Gateway response with CORS headers"""
+def build_listing(bucket_name, options):
+    # The manifest has no folder roll-up, and cursors issued by S3 listings must stay on S3
+    if manifest is not None and not options['delimiter'] and not options['token']:
+        files, folders, next_cursor = list_manifest_page(bucket_name, options)
+    else:
+        files, folders, next_cursor = list_page(bucket_name, options)
+    
+    if options['sort']:
+        field = options['sort'].lstrip('-')
+        files.sort(key=lambda f: f[field], reverse=options['sort'].startswith('-'))
+    
+    return {
+        'success': True,
+        'bucket': bucket_name,
+        'prefix': options['prefix'],
+        'fileCount': len(files),
+        'files': files,
+        'folders': folders,
+        'nextCursor': next_cursor,
+        'hasMore': next_cursor is not None
+    }
+
+
+def compute_etag(result):
+    digest = hashlib.sha256(json.dumps(result, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(event, etag):
+    headers = event.get('headers') or {}
+    if_none_match = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), None)
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def get_listing_version(bucket_name, scope=''):
+    """
+    Returns (version, cacheable). The upload URL function bumps the version and
+    opens an upload window for every presigned POST; while a window is open
+    objects may still land, so listings bypass the cache. Users of the shared
+    bucket each have their own version, kept under their prefix (scope).
+    """
+    try:
+        response = table.get_item(
+            Key=tenancy.listing_version_key(bucket_name, scope),
+            ProjectionExpression='version, uploadWindowEndsAt'
+        )
+    except Exception as e:
+        log.warning('Error reading listing version: %s', e)
+        return None, False
+    
+    item = response.get('Item', {})
+    cacheable = time.time() >= float(item.get('uploadWindowEndsAt', 0))
+    return int(item.get('version', 0)), cacheable
+
+
+def get_cached_listing(cache_key, version):
+    with listing_cache_lock:
+        entry = listing_cache.get(cache_key)
+        if not entry:
+            return None
+        cached_version, expires_at, result, etag = entry
+        if cached_version != version or time.time() >= expires_at:
+            del listing_cache[cache_key]
+            return None
+        listing_cache.move_to_end(cache_key)
+        return result, etag
+
+
+def put_cached_listing(cache_key, version, result, etag):
+    with listing_cache_lock:
+        listing_cache[cache_key] = (version, time.time() + LISTING_CACHE_TTL, result, etag)
+        listing_cache.move_to_end(cache_key)
+        while len(listing_cache) > LISTING_CACHE_SIZE:
+            listing_cache.popitem(last=False)
+
+
+def parse_options(query_params):
+    try:
+        limit = int(query_params.get('limit') or DEFAULT_LIMIT)
+        min_size = int(query_params['minSize']) if query_params.get('minSize') else None
+        max_size = int(query_params['maxSize']) if query_params.get('maxSize') else None
+    except ValueError:
+        raise BadRequest('limit, minSize and maxSize must be integers')
+    
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f'limit must be between 1 and {MAX_LIMIT}')
+    
+    sort = query_params.get('sort')
+    if sort and sort.lstrip('-') not in SORT_FIELDS:
+        raise BadRequest(f"sort must be one of {', '.join(sorted(SORT_FIELDS))} (prefix '-' for descending)")
+    
+    token, skip, after = decode_cursor(query_params.get('cursor'))
+    if after is not None and (manifest is None or query_params.get('delimiter')):
+        raise BadRequest('Invalid cursor')
+    
     return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'GET,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
+        'limit': limit,
+        'prefix': query_params.get('prefix', ''),
+        'delimiter': query_params.get('delimiter'),
+        'name': (query_params.get('name') or '').lower(),
+        'min_size': min_size,
+        'max_size': max_size,
+        'sort': sort,
+        'token': token,
+        'skip': skip,
+        'after': after
+    }
+
+
+def encode_cursor(token=None, skip=0, after=None):
+    data = {'k': after} if after is not None else {'t': token, 's': skip}
+    raw = json.dumps(data).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    An S3 cursor is a ContinuationToken (None for the first S3 page) plus entries
+    to skip in that page; a manifest cursor is the last key returned.
+    Returns (token, skip, after).
+    """
+    if not cursor:
+        return None, 0, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if 'k' in data:
+            return None, 0, str(data['k'])
+        return data['t'], int(data['s']), None
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest('Invalid cursor')
+
+
+def list_page(bucket_name, options):
+    """
+    Collect up to `limit` matching entries, reading one S3 page at a time so
+    memory stays bounded. Returns (files, folders, next_cursor).
+    """
+    files = []
+    folders = []
+    token = options['token']
+    skip = options['skip']
+    scanned = 0
+    
+    while True:
+        kwargs = {'Bucket': bucket_name, 'MaxKeys': LIST_PAGE_SIZE, 'Prefix': options['prefix']}
+        if options['delimiter']:
+            kwargs['Delimiter'] = options['delimiter']
+        if token:
+            kwargs['ContinuationToken'] = token
+        
+        response = s3.list_objects_v2(**kwargs)
+        entries = page_entries(response)
+        
+        for index in range(skip, len(entries)):
+            scanned += 1
+            entry = entries[index]
+            if 'Prefix' in entry:
+                if matches_folder(entry, options):
+                    folders.append({'prefix': entry['Prefix']})
+            elif matches_file(entry, options):
+                files.append(format_file(bucket_name, entry))
+            
+            if len(files) + len(folders) == options['limit'] or scanned >= MAX_SCAN_KEYS:
+                if index + 1 < len(entries):
+                    return files, folders, encode_cursor(token, index + 1)
+                break
+        
+        if not response.get('IsTruncated'):
+            return files, folders, None
+        
+        token, skip = response['NextContinuationToken'], 0
+        if len(files) + len(folders) == options['limit'] or scanned >= MAX_SCAN_KEYS:
+            return files, folders, encode_cursor(token, 0)
+
+
+def list_manifest_page(bucket_name, options):
+    """
+    Collect up to `limit` matching files from the object manifest. Without
+    filters this is a single Query whatever the bucket size; filters and
+    tombstones of removed objects can take a few more, bounded by MAX_SCAN_KEYS.
+    Returns (files, folders, next_cursor).
+    """
+    files = []
+    scanned = 0
+    filtered = bool(options['name']) or options['min_size'] is not None or options['max_size'] is not None
+    
+    # `bucket`, `key` and `size` are DynamoDB reserved words
+    kwargs = {
+        'KeyConditionExpression': '#bucket = :bucket',
+        'FilterExpression': 'attribute_not_exists(#deleted)',
+        'ProjectionExpression': '#key, #size, lastModified',
+        'ExpressionAttributeNames': {'#bucket': 'bucket', '#key': 'key', '#size': 'size', '#deleted': 'deleted'},
+        'ExpressionAttributeValues': {':bucket': bucket_name}
+    }
+    if options['prefix']:
+        kwargs['KeyConditionExpression'] += ' AND begins_with(#key, :prefix)'
+        kwargs['ExpressionAttributeValues'][':prefix'] = options['prefix']
+    if options['after']:
+        kwargs['ExclusiveStartKey'] = {'bucket': bucket_name, 'key': options['after']}
+    
+    while True:
+        wanted = LIST_PAGE_SIZE if filtered else options['limit'] - len(files)
+        kwargs['Limit'] = max(1, min(wanted, MAX_SCAN_KEYS - scanned))
+        response = manifest.query(**kwargs)
+        scanned += response.get('ScannedCount', 0)
+        items = response.get('Items', [])
+        
+        for index, item in enumerate(items):
+            if matches_file({'Key': item['key'], 'Size': int(item['size'])}, options):
+                files.append(format_manifest_file(bucket_name, item))
+            if len(files) == options['limit'] and index + 1 < len(items):
+                return files, [], encode_cursor(after=item['key'])
+        
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            return files, [], None
+        if len(files) == options['limit'] or scanned >= MAX_SCAN_KEYS:
+            return files, [], encode_cursor(after=last_key['key'])
+        kwargs['ExclusiveStartKey'] = last_key
+
+
+def page_entries(response):
+    """Objects and common prefixes of one S3 page, merged back into key order"""
+    entries = response.get('Contents', []) + response.get('CommonPrefixes', [])
+    if response.get('CommonPrefixes'):
+        entries.sort(key=lambda e: e.get('Key', e.get('Prefix')))
+    return entries
+
+
+def matches_folder(entry, options):
+    if options['min_size'] is not None or options['max_size'] is not None:
+        return False
+    return options['name'] in entry['Prefix'].lower()
+
+
+def matches_file(obj, options):
+    if options['name'] and options['name'] not in obj['Key'].lower():
+        return False
+    if options['min_size'] is not None and obj['Size'] < options['min_size']:
+        return False
+    if options['max_size'] is not None and obj['Size'] > options['max_size']:
+        return False
+    return True
+
+
+def format_file(bucket_name, obj):
+    return {
+        'name': obj['Key'],
+        'size': obj['Size'],
+        'lastModified': obj['LastModified'].isoformat(),
+        'url': f"https://{bucket_name}.s3.amazonaws.com/{obj['Key']}"
+    }
+
+
+def format_manifest_file(bucket_name, item):
+    return {
+        'name': item['key'],
+        'size': int(item['size']),
+        'lastModified': item['lastModified'],
+        'url': f"https://{bucket_name}.s3.amazonaws.com/{item['key']}"
+    }
+
+
+def create_response(status_code, body, extra_headers=None):
+    """Create API Gateway response with CORS headers"""
+    headers = {
+        'Access-Control-Expose-Headers': 'ETag',
+        # Let browsers keep the listing but revalidate it (If-None-Match) every time
+        'Cache-Control': 'no-cache'
     }
+    headers.update(extra_headers or {})
+    return api_responses.create_response(status_code, body, methods='GET,OPTIONS',
+                                         allow_headers='Content-Type,If-None-Match', extra_headers=headers)
@@ -0,0 +1,69 @@
+import importlib.util
+import os
+import api_responses
+import structured_log as log
+
+HANDLER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_handler_module(name):
+    """The backend handler files have hyphens in their names, so they are loaded by path"""
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(HANDLER_DIR, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Importing the handlers is cheap (their clients are lazy); in one container they share
+# the clients from aws_clients and the listing cache stays warm across the dashboard session
+list_bucket = load_handler_module('backend-list-bucket')
+upload_url = load_handler_module('backend-upload-url')
+user_info = load_handler_module('backend-user-info')
+HANDLER_MODULES = (list_bucket, upload_url, user_info)
+
+ROUTES = {
+    ('GET', '/bucket-contents'): list_bucket,
+    ('POST', '/upload-url'): upload_url,
+    ('POST', '/multipart-upload'): upload_url,
+    ('POST', '/multipart-upload/complete'): upload_url,
+    ('POST', '/multipart-upload/abort'): upload_url,
+    ('GET', '/user-info'): user_info
+}
+
+
+@log.request_handler('backend-router')
+def lambda_handler(event, context):
+    """
+    Single backend API function, deployed in place of the list-bucket, upload-url
+    and user-info functions when the stack's ConsolidatedBackend parameter is true.
+    Dispatches on method and path to the same handlers.
+    """
+
+    method, path = resolve_route(event)
+    module = ROUTES.get((method, path))
+    if module is not None:
+        return module.lambda_handler(event, context)
+
+    allowed = sorted(route_method for route_method, route_path in ROUTES if route_path == path)
+    if allowed:
+        return api_responses.create_response(405, {'error': f'Method {method} not allowed on {path}'},
+                                             methods=','.join(allowed + ['OPTIONS']),
+                                             extra_headers={'Allow': ', '.join(allowed)})
+    log.warning('No route for %s %s', method, path)
+    return api_responses.create_response(404, {'error': f'Route not found: {method} {path}'})
+
+
+def resolve_route(event):
+    """(method, path) from the route key, or from the raw path without the stage prefix"""
+    request_context = event.get('requestContext') or {}
+    http = request_context.get('http') or {}
+    method = http.get('method') or event.get('httpMethod') or ''
+    route_key = event.get('routeKey') or ''
+    if route_key and route_key != '$default':
+        method, _, path = route_key.partition(' ')
+    else:
+        path = event.get('rawPath') or http.get('path') or ''
+        stage = request_context.get('stage')
+        if stage and stage != '$default' and path.startswith(f'/{stage}/'):
+            path = path[len(stage) + 1:]
+    return method.upper(), path.rstrip('/') or '/'
@@ -1,24 +1,66 @@
 import json
-import boto3
+import math
 import os
+import time
 from botocore.exceptions import ClientError
-from botocore.config import Config
+import api_responses
+import aws_clients
+import structured_log as log
+import tenancy
 
-# Configure boto3 with signature version 4
-config = Config(signature_version='s3v4')
-s3 = boto3.client('s3', config=config)
+# Presign with signature version 4
+s3 = aws_clients.client('s3', signature_version='s3v4')
 
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE')
+table = aws_clients.table(DYNAMODB_TABLE)
+aws_clients.prewarm(s3, table)
+
+# Shared website bucket of the prefix-per-user tenancy mode; requests for it must name a user's prefix
+SHARED_SPA_BUCKET = os.environ.get('SHARED_SPA_BUCKET')
+
+UPLOAD_URL_EXPIRES_IN = 300  # 5 minutes
+MAX_UPLOAD_BYTES = 10485760  # 10MB per presigned POST
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get('UPLOAD_BATCH_MAX_FILES', '100'))
+
+# Multipart uploads: one presigned UploadPart URL per part, each signed for its exact size
+MULTIPART_URL_EXPIRES_IN = int(os.environ.get('MULTIPART_URL_EXPIRES_IN', '3600'))
+MULTIPART_MAX_BYTES = int(os.environ.get('MULTIPART_MAX_BYTES', str(5 * 1024 ** 3)))
+# Keeps the initiate response well under the 6MB Lambda payload limit
+MULTIPART_MAX_PARTS = 1000
+MIN_PART_SIZE = 5 * 1024 ** 2  # S3 minimum for every part but the last
+MAX_PART_SIZE = 5 * 1024 ** 3
+
+# S3 errors caused by the caller rather than by us
+CLIENT_ERROR_STATUS = {
+    'NoSuchUpload': 404,
+    'InvalidPart': 400,
+    'InvalidPartOrder': 400,
+    'EntityTooSmall': 400
+}
+
+@log.request_handler('backend-upload-url')
 def lambda_handler(event, context):
     """
-    Generate presigned URL for S3 upload
-    Body: {"bucket": "bucket-name", "filename": "file.txt", "contentType": "text/plain"}
+    Generate presigned URLs for S3 uploads
+    POST /upload-url                 {"bucket", "filename", "contentType"} - presigned POST, up to 10MB
+                                     {"bucket", "files": [{"filename", "contentType"}, ...]} - one per file
+    POST /multipart-upload           {"bucket", "filename", "contentType", "fileSize", "partSize"}
+    POST /multipart-upload/complete  {"bucket", "key", "uploadId", "parts": [{"partNumber", "etag"}]}
+    POST /multipart-upload/abort     {"bucket", "key", "uploadId"}
+    Requests for the shared bucket also carry the user's "prefix"; keys are created under it.
     """
     
-    print(f"Received event: {json.dumps(event)}")
-    
     try:
         # Parse request body
         body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event.get('body', {})
+        
+        route = event.get('routeKey') or event.get('rawPath') or ''
+        if '/multipart-upload' in route:
+            return handle_multipart(route, body)
+        
+        if isinstance(body.get('files'), list):
+            return handle_batch(body)
+        
         bucket_name = body.get('bucket')
         filename = body.get('filename')
         content_type = body.get('contentType', 'application/octet-stream')
@@ -26,29 +68,20 @@ def lambda_handler(event, context):
         if not bucket_name or not filename:
             return create_response(400, {'error': 'Bucket name and filename are required'})
         
-        # Verify bucket belongs to our environment (security check)
-        environment = os.environ.get('ENVIRONMENT_NAME', 'sandbox')
-        if not bucket_name.startswith(f"{environment}-spa-"):
+        # Verify the bucket, or the prefix in the shared bucket, belongs to a user of our environment
+        scope = get_scope(bucket_name, body)
+        if scope is None:
             return create_response(403, {'error': 'Access denied to this bucket'})
         
-        # Sanitize filename (remove path traversal attempts)
-        filename = filename.split('/')[-1]  # Get only filename, no directories
+        filename = sanitize_filename(filename)
+        if not filename:
+            return create_response(400, {'error': 'Invalid filename'})
         
-        print(f"Generating presigned URL for: {bucket_name}/{filename}")
+        log.debug('Generating presigned URL for: %s/%s%s', bucket_name, scope, filename)
         
-        # Generate presigned POST instead of PUT for better compatibility
-        presigned_post = s3.generate_presigned_post(
-            Bucket=bucket_name,
-            Key=filename,
-            Fields={
-                'Content-Type': content_type
-            },
-            Conditions=[
-                {'Content-Type': content_type},
-                ['content-length-range', 1, 10485760]  # 1 byte to 10MB
-            ],
-            ExpiresIn=300  # 5 minutes
-        )
+        presigned_post = presign_post(bucket_name, scope + filename, content_type)
+        
+        invalidate_listing_cache(bucket_name, scope)
         
         result = {
             'success': True,
@@ -56,30 +89,262 @@ def lambda_handler(event, context):
             'fields': presigned_post['fields'],
             'bucket': bucket_name,
             'filename': filename,
-            'expiresIn': 300,
+            'key': scope + filename,
+            'expiresIn': UPLOAD_URL_EXPIRES_IN,
             'method': 'POST'
         }
         
-        print(f"Presigned POST URL generated successfully")
+        log.annotate(bucket=bucket_name, files=1)
         return create_response(200, result)
         
     except ClientError as e:
-        print(f"S3 Error: {e}")
-        return create_response(500, {'error': f'S3 error: {e.response["Error"]["Code"]}'})
+        error_code = e.response['Error']['Code']
+        log.error('S3 error: %s', e)
+        return create_response(CLIENT_ERROR_STATUS.get(error_code, 500), {'error': f'S3 error: {error_code}'})
     except Exception as e:
-        print(f"Error: {e}")
+        log.error('Error: %s', e)
         return create_response(500, {'error': str(e)})
 
 
+def get_scope(bucket_name, body):
+    """Key prefix the request may write under ('' for a user's own bucket), or None when denied"""
+    environment = os.environ.get('ENVIRONMENT_NAME', 'sandbox')
+    return tenancy.resolve_scope(bucket_name, body.get('prefix'), environment, SHARED_SPA_BUCKET, table)
+
+
+def sanitize_filename(filename):
+    # Remove path traversal attempts: keep only the file name, no directories
+    return str(filename).split('/')[-1]
+
+
+def presign_post(bucket_name, key, content_type):
+    # Generate presigned POST instead of PUT for better compatibility
+    return s3.generate_presigned_post(
+        Bucket=bucket_name,
+        Key=key,
+        Fields={
+            'Content-Type': content_type
+        },
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, MAX_UPLOAD_BYTES]
+        ],
+        ExpiresIn=UPLOAD_URL_EXPIRES_IN
+    )
+
+
+def handle_batch(body):
+    """Presigned POSTs for several files in one response; bad entries fail on their own"""
+    bucket_name = body.get('bucket')
+    entries = body['files']
+    
+    if not bucket_name:
+        return create_response(400, {'error': 'Bucket name is required'})
+    
+    scope = get_scope(bucket_name, body)
+    if scope is None:
+        return create_response(403, {'error': 'Access denied to this bucket'})
+    
+    if not entries:
+        return create_response(400, {'error': 'files must not be empty'})
+    if len(entries) > UPLOAD_BATCH_MAX_FILES:
+        return create_response(400, {'error': f'At most {UPLOAD_BATCH_MAX_FILES} files per request'})
+    
+    log.annotate(bucket=bucket_name, files=len(entries))
+    
+    seen = set()
+    results = [presign_entry(bucket_name, scope, entry, seen) for entry in entries]
+    succeeded = sum(1 for result in results if result['success'])
+    
+    if succeeded:
+        invalidate_listing_cache(bucket_name, scope)
+    
+    return create_response(200 if succeeded == len(results) else 207, {
+        'success': succeeded == len(results),
+        'bucket': bucket_name,
+        'requested': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'expiresIn': UPLOAD_URL_EXPIRES_IN,
+        'method': 'POST',
+        'results': results
+    })
+
+
+def presign_entry(bucket_name, scope, entry, seen):
+    filename = entry.get('filename') if isinstance(entry, dict) else None
+    result = {'filename': filename, 'key': None, 'success': False, 'uploadUrl': None, 'fields': None, 'error': None}
+    
+    if not filename:
+        result['error'] = 'filename is required'
+        return result
+    
+    filename = sanitize_filename(filename)
+    result['filename'] = filename
+    if not filename:
+        result['error'] = 'Invalid filename'
+    elif filename in seen:
+        # Both uploads would land on the same key
+        result['error'] = 'Duplicate filename'
+    if result['error']:
+        return result
+    seen.add(filename)
+    
+    try:
+        presigned_post = presign_post(bucket_name, scope + filename,
+                                      str(entry.get('contentType') or 'application/octet-stream'))
+    except ClientError as e:
+        result['error'] = f'S3 error: {e.response["Error"]["Code"]}'
+        return result
+    
+    result.update(success=True, key=scope + filename, uploadUrl=presigned_post['url'], fields=presigned_post['fields'])
+    return result
+
+
+def handle_multipart(route, body):
+    bucket_name = body.get('bucket')
+    if not bucket_name:
+        return create_response(400, {'error': 'Bucket name is required'})
+    
+    scope = get_scope(bucket_name, body)
+    if scope is None:
+        return create_response(403, {'error': 'Access denied to this bucket'})
+    
+    if route.endswith('/complete'):
+        return complete_multipart_upload(bucket_name, scope, body)
+    if route.endswith('/abort'):
+        return abort_multipart_upload(bucket_name, scope, body)
+    return initiate_multipart_upload(bucket_name, scope, body)
+
+
+def initiate_multipart_upload(bucket_name, scope, body):
+    """Start a multipart upload and presign an UploadPart URL for every part"""
+    filename = sanitize_filename(body.get('filename') or '')
+    content_type = body.get('contentType', 'application/octet-stream')
+    if not filename:
+        return create_response(400, {'error': 'Filename is required'})
+    
+    try:
+        file_size = int(body.get('fileSize'))
+        part_size = int(body.get('partSize', MIN_PART_SIZE))
+    except (TypeError, ValueError):
+        return create_response(400, {'error': 'fileSize and partSize must be integers'})
+    
+    if not 1 <= file_size <= MULTIPART_MAX_BYTES:
+        return create_response(400, {'error': f'fileSize must be between 1 and {MULTIPART_MAX_BYTES} bytes'})
+    if not MIN_PART_SIZE <= part_size <= MAX_PART_SIZE:
+        return create_response(400, {'error': f'partSize must be between {MIN_PART_SIZE} and {MAX_PART_SIZE} bytes'})
+    
+    part_count = math.ceil(file_size / part_size)
+    if part_count > MULTIPART_MAX_PARTS:
+        return create_response(400, {'error': f'At most {MULTIPART_MAX_PARTS} parts; use a larger partSize'})
+    
+    log.annotate(bucket=bucket_name, parts=part_count)
+    key = scope + filename
+    upload = s3.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)
+    upload_id = upload['UploadId']
+    
+    parts = []
+    for part_number in range(1, part_count + 1):
+        size = min(part_size, file_size - (part_number - 1) * part_size)
+        url = s3.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': bucket_name,
+                'Key': key,
+                'UploadId': upload_id,
+                'PartNumber': part_number,
+                # Signed, so S3 rejects a part of any other size
+                'ContentLength': size
+            },
+            ExpiresIn=MULTIPART_URL_EXPIRES_IN
+        )
+        parts.append({'partNumber': part_number, 'size': size, 'url': url})
+    
+    return create_response(200, {
+        'success': True,
+        'bucket': bucket_name,
+        'key': key,
+        'uploadId': upload_id,
+        'partSize': part_size,
+        'partCount': part_count,
+        'parts': parts,
+        'expiresIn': MULTIPART_URL_EXPIRES_IN,
+        'method': 'PUT'
+    })
+
+
+def complete_multipart_upload(bucket_name, scope, body):
+    filename = sanitize_filename(body.get('key') or '')
+    upload_id = body.get('uploadId')
+    parts = body.get('parts')
+    if not filename or not upload_id or not isinstance(parts, list) or not parts:
+        return create_response(400, {'error': 'key, uploadId and parts are required'})
+    
+    try:
+        completed = sorted(
+            ({'PartNumber': int(part['partNumber']), 'ETag': str(part['etag'])} for part in parts),
+            key=lambda part: part['PartNumber']
+        )
+    except (KeyError, TypeError, ValueError):
+        return create_response(400, {'error': 'Every part needs a partNumber and an etag'})
+    
+    key = scope + filename
+    response = s3.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': completed}
+    )
+    
+    # The object only becomes visible now, so no upload window is needed
+    invalidate_listing_cache(bucket_name, scope, upload_window=None)
+    
+    log.annotate(bucket=bucket_name, parts=len(completed))
+    return create_response(200, {
+        'success': True,
+        'bucket': bucket_name,
+        'key': key,
+        'etag': response.get('ETag')
+    })
+
+
+def abort_multipart_upload(bucket_name, scope, body):
+    filename = sanitize_filename(body.get('key') or '')
+    upload_id = body.get('uploadId')
+    if not filename or not upload_id:
+        return create_response(400, {'error': 'key and uploadId are required'})
+    
+    key = scope + filename
+    s3.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    
+    log.annotate(bucket=bucket_name, aborted=True)
+    return create_response(200, {'success': True, 'bucket': bucket_name, 'key': key, 'aborted': True})
+
+
+def invalidate_listing_cache(bucket_name, scope='', upload_window=UPLOAD_URL_EXPIRES_IN):
+    """
+    Bump the listing version of the bucket (or of the user's prefix in the
+    shared bucket) so cached listings in the list function are dropped, and
+    keep them uncached for upload_window seconds while a presigned POST may
+    still land (None leaves the window alone).
+    """
+    update_expression = 'ADD version :one'
+    values = {':one': 1}
+    if upload_window is not None:
+        update_expression += ' SET uploadWindowEndsAt = :window_end'
+        values[':window_end'] = int(time.time()) + upload_window
+    
+    try:
+        table.update_item(
+            Key=tenancy.listing_version_key(bucket_name, scope),
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        log.warning('Error bumping listing version: %s', e)
+
+
 def create_response(status_code, body):
     """Create API Gateway response with CORS headers"""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
+    return api_responses.create_response(status_code, body, methods='POST,OPTIONS')
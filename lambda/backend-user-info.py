@@ -1,21 +1,53 @@
+import base64
 import json
-import boto3
 import os
+import threading
+import time
+from collections import OrderedDict
 from botocore.exceptions import ClientError
-
-dynamodb = boto3.resource('dynamodb')
+import api_responses
+import aws_clients
+import structured_log as log
 
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE')
-table = dynamodb.Table(DYNAMODB_TABLE)
+table = aws_clients.table(DYNAMODB_TABLE)
+aws_clients.prewarm(table)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+# Upper bound on queries per request when a status filter skips most items
+MAX_QUERY_PAGES = int(os.environ.get('USER_INFO_MAX_QUERY_PAGES', '5'))
+# Attributes a caller may project; several are DynamoDB reserved words, so all go through placeholders
+RESOURCE_FIELDS = {'username', 'createdAt', 'bucketName', 'prefix', 'websiteUrl', 'region', 'environment', 'status'}
+
+# Warm-container cache of query results, validated against the user's resources version,
+# which the SPA creator bumps whenever it writes one of the user's resources
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '30'))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '256'))
+# For this long after its version was last confirmed, an entry is served without reading the version
+USER_CACHE_VERSION_TTL = float(os.environ.get('USER_CACHE_VERSION_TTL', '5'))
+user_cache = OrderedDict()
+user_cache_lock = threading.Lock()
+# Misses in progress; concurrent requests for the same page wait for the first one's query
+in_flight = {}
+cache_stats = {'hits': 0, 'misses': 0}
 
+
+class BadRequest(Exception):
+    pass
+
+@log.request_handler('backend-user-info')
 def lambda_handler(event, context):
     """
-    Get user information from DynamoDB
-    Query parameter: ?username=john.doe
+    Get a user's resources from DynamoDB, newest first, one page at a time
+    Query parameters: ?username=john.doe
+        &limit=10                 resources per page (max 100)
+        &cursor=...               nextCursor from the previous page
+        &fields=bucketName,status only these attributes of each resource
+        &status=active            only resources with this status
+        &consistent=true          strongly consistent read
     """
     
-    print(f"Received event: {json.dumps(event)}")
-    
     try:
         # Get username from query parameters
         query_params = event.get('queryStringParameters', {}) or {}
@@ -24,50 +56,196 @@ def lambda_handler(event, context):
         if not username:
             return create_response(400, {'error': 'Username is required'})
         
-        print(f"Querying user info for: {username}")
+        try:
+            options = parse_options(username, query_params)
+        except BadRequest as e:
+            return create_response(400, {'error': str(e)})
         
-        # Query DynamoDB for user's resources
-        response = table.query(
-            KeyConditionExpression='username = :username',
-            ExpressionAttributeValues={
-                ':username': username
-            },
-            ScanIndexForward=False,  # Sort by createdAt descending (newest first)
-            Limit=10  # Get last 10 resources
-        )
-        
-        items = response.get('Items', [])
+        items, last_key, cache_status = cached_query(username, options)
         
-        if not items:
-            return create_response(404, {'error': 'No resources found for this user'})
+        # An empty first page without filters means the user has nothing; any other empty page is just empty
+        if not items and last_key is None and options['start_key'] is None and not options['status']:
+            return create_response(404, {'error': 'No resources found for this user'}, {'X-Cache': cache_status})
         
+        next_cursor = encode_cursor(last_key) if last_key else None
         result = {
             'success': True,
             'username': username,
             'resourceCount': len(items),
-            'resources': items
+            'resources': items,
+            'nextCursor': next_cursor,
+            'hasMore': next_cursor is not None
         }
         
-        print(f"Found {len(items)} resources for user")
-        return create_response(200, result)
+        log.annotate(resources=len(items), hasMore=next_cursor is not None, cache=cache_status,
+                     cacheHits=cache_stats['hits'], cacheMisses=cache_stats['misses'])
+        return create_response(200, result, {'X-Cache': cache_status})
         
     except ClientError as e:
-        print(f"DynamoDB Error: {e}")
+        log.error('DynamoDB error: %s', e)
         return create_response(500, {'error': f'Database error: {e.response["Error"]["Code"]}'})
     except Exception as e:
-        print(f"Error: {e}")
+        log.error('Error: %s', e)
         return create_response(500, {'error': str(e)})
 
 
-def create_response(status_code, body):
-    """Create API Gateway response with CORS headers"""
+def parse_options(username, query_params):
+    try:
+        limit = int(query_params.get('limit') or DEFAULT_LIMIT)
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f'limit must be between 1 and {MAX_LIMIT}')
+    
+    fields = [f.strip() for f in (query_params.get('fields') or '').split(',') if f.strip()]
+    unknown = [f for f in fields if f not in RESOURCE_FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    
     return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'GET,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
+        'limit': limit,
+        'fields': list(dict.fromkeys(fields)),
+        'status': query_params.get('status'),
+        'consistent': (query_params.get('consistent') or '').lower() == 'true',
+        'start_key': decode_cursor(username, query_params.get('cursor'))
+    }
+
+
+def cached_query(username, options):
+    """
+    Read-through cache around query_resources. Returns (items, last_key, status),
+    status being HIT, MISS or BYPASS (consistent reads, or no readable version).
+    An entry whose version was confirmed within USER_CACHE_VERSION_TTL is a
+    hit with no DynamoDB call at all; after that, one GetItem of the version
+    revalidates it.
+    """
+    if options['consistent']:
+        return query_resources(username, options) + ('BYPASS',)
+    
+    cache_key = (username, options['limit'], tuple(options['fields']), options['status'],
+                 (options['start_key'] or {}).get('createdAt'))
+    with user_cache_lock:
+        entry = user_cache.get(cache_key)
+        now = time.time()
+        if entry and now < entry[1] and now < entry[3]:
+            user_cache.move_to_end(cache_key)
+            cache_stats['hits'] += 1
+            return entry[2] + ('HIT',)
+    
+    version = get_resources_version(username)
+    if version is None:
+        log.debug('Querying user info for: %s', username)
+        return query_resources(username, options) + ('BYPASS',)
+    
+    while True:
+        with user_cache_lock:
+            entry = user_cache.get(cache_key)
+            if entry and entry[0] == version and time.time() < entry[1]:
+                user_cache[cache_key] = entry[:3] + (time.time() + USER_CACHE_VERSION_TTL,)
+                user_cache.move_to_end(cache_key)
+                cache_stats['hits'] += 1
+                return entry[2] + ('HIT',)
+            if entry:
+                del user_cache[cache_key]
+            flight = in_flight.get(cache_key)
+            if flight is None:
+                flight = in_flight[cache_key] = threading.Event()
+                break
+        # Another request is querying this page; use its result once it lands
+        flight.wait()
+    
+    try:
+        with user_cache_lock:
+            cache_stats['misses'] += 1
+        log.debug('Querying user info for: %s', username)
+        result = query_resources(username, options)
+        put_cached_query(cache_key, version, result)
+        return result + ('MISS',)
+    finally:
+        with user_cache_lock:
+            del in_flight[cache_key]
+        flight.set()
+
+
+def get_resources_version(username):
+    """The user's resources version, or None when it cannot be read (the cache is then skipped)"""
+    try:
+        response = table.get_item(
+            Key={'username': f"user#{username}", 'createdAt': 'resources-version'},
+            ProjectionExpression='version'
+        )
+    except Exception as e:
+        log.warning('Error reading resources version: %s', e)
+        return None
+    return int(response.get('Item', {}).get('version', 0))
+
+
+def put_cached_query(cache_key, version, result):
+    with user_cache_lock:
+        now = time.time()
+        # (version, expires at, result, version trusted until)
+        user_cache[cache_key] = (version, now + USER_CACHE_TTL, result, now + USER_CACHE_VERSION_TTL)
+        user_cache.move_to_end(cache_key)
+        while len(user_cache) > USER_CACHE_SIZE:
+            user_cache.popitem(last=False)
+
+
+def query_resources(username, options):
+    """
+    Collect up to `limit` resources, continuing past pages the status filter
+    emptied. Returns (items, last_evaluated_key).
+    """
+    names = {}
+    values = {':username': username}
+    kwargs = {
+        'KeyConditionExpression': 'username = :username',
+        'ScanIndexForward': False,  # Sort by createdAt descending (newest first)
+        'ConsistentRead': options['consistent']
     }
+    if options['fields']:
+        projection = []
+        for i, field in enumerate(options['fields']):
+            names[f'#p{i}'] = field
+            projection.append(f'#p{i}')
+        kwargs['ProjectionExpression'] = ', '.join(projection)
+    if options['status']:
+        names['#status'] = 'status'
+        values[':status'] = options['status']
+        kwargs['FilterExpression'] = '#status = :status'
+    if names:
+        kwargs['ExpressionAttributeNames'] = names
+    kwargs['ExpressionAttributeValues'] = values
+    
+    items = []
+    last_key = options['start_key']
+    for _ in range(MAX_QUERY_PAGES):
+        if last_key:
+            kwargs['ExclusiveStartKey'] = last_key
+        # Limit caps items evaluated, so a filtered page can come back short
+        response = table.query(Limit=options['limit'] - len(items), **kwargs)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if last_key is None or len(items) >= options['limit']:
+            break
+    return items, last_key
+
+
+def encode_cursor(last_key):
+    raw = json.dumps({'c': last_key['createdAt']}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(username, cursor):
+    """The cursor holds the sort key only; the partition key always comes from ?username"""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {'username': username, 'createdAt': str(data['c'])}
+    except (ValueError, KeyError, TypeError):
+        raise BadRequest('Invalid cursor')
+
+
+def create_response(status_code, body, extra_headers=None):
+    """Create API Gateway response with CORS headers"""
+    return api_responses.create_response(status_code, body, methods='GET,OPTIONS', extra_headers=extra_headers)
@@ -0,0 +1,238 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+import inventory
+import tenancy
+
+# DeleteObjects takes at most 1000 keys per call
+DELETE_BATCH_SIZE = 1000
+
+
+class CleanupError(Exception):
+    pass
+
+
+class Checkpoint:
+    """
+    Buckets already torn down, one name per line in an append-only file, so an
+    interrupted run can resume where it stopped without redoing finished buckets.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, bucket_name):
+        return bucket_name in self.done
+
+    def mark_done(self, bucket_name):
+        with self.lock:
+            self.done.add(bucket_name)
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(bucket_name + '\n')
+
+    def clear(self):
+        """Forget the run once it has finished cleanly"""
+        with self.lock:
+            self.done.clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def find_targets(table, environment='sandbox', status=None, total_segments=8, max_workers=8):
+    """
+    Buckets recorded in the resources table (pool buckets included), each with
+    the keys of the rows that describe it. SPAs in the shared bucket are
+    targets of their own, named '{bucket}/{prefix}', and a bucket holding any
+    of them is never a target as a whole. Returns (targets, skipped), where
+    skipped lists recorded buckets outside the environment's naming scheme,
+    which are never touched.
+    """
+    prefix = f'{environment}-spa-'
+    targets, skipped, shared = {}, [], set()
+    pages = inventory.scan_resources(table, status=status, total_segments=total_segments,
+                                     max_workers=max_workers, include_pool=True)
+    for page in pages:
+        for item in page:
+            bucket_name = item['bucketName']
+            if not bucket_name.startswith(prefix):
+                skipped.append(bucket_name)
+                continue
+            target = bucket_name
+            if item.get('prefix') is not None:
+                if not tenancy.is_user_prefix(item['prefix']):
+                    skipped.append(f"{bucket_name}/{item['prefix']}")
+                    continue
+                shared.add(bucket_name)
+                target = f"{bucket_name}/{item['prefix']}"
+            targets.setdefault(target, []).append({'username': item['username'], 'createdAt': item['createdAt']})
+    for bucket_name in shared & targets.keys():
+        skipped.append(bucket_name)
+        del targets[bucket_name]
+    return targets, skipped
+
+
+def empty_bucket(s3, bucket_name, dry_run=False, prefix=''):
+    """
+    Delete every object version and delete marker (under prefix, when given),
+    DELETE_BATCH_SIZE at a time. Unversioned buckets list each object as its
+    'null' version, so one path covers both. Returns the number of versions
+    deleted (or found, in a dry run).
+    """
+    kwargs = {'Bucket': bucket_name, 'MaxKeys': DELETE_BATCH_SIZE, 'Prefix': prefix}
+    count = 0
+    while True:
+        response = s3.list_object_versions(**kwargs)
+        batch = [
+            {'Key': entry['Key'], 'VersionId': entry['VersionId']}
+            for entry in response.get('Versions', []) + response.get('DeleteMarkers', [])
+        ]
+        if batch and not dry_run:
+            result = s3.delete_objects(Bucket=bucket_name, Delete={'Objects': batch, 'Quiet': True})
+            errors = result.get('Errors', [])
+            if errors:
+                raise CleanupError(f"{len(errors)} objects not deleted from {bucket_name}: {errors[0].get('Code')}")
+        count += len(batch)
+        if not response.get('IsTruncated'):
+            return count
+        kwargs['KeyMarker'] = response.get('NextKeyMarker')
+        kwargs['VersionIdMarker'] = response.get('NextVersionIdMarker')
+
+
+def delete_bucket_rows(table, manifest, bucket_name, row_keys, prefix=''):
+    """
+    Resource rows, the listing-version record and the object manifest entries
+    of a bucket, or of one prefix in the shared bucket (and its tenant record)
+    """
+    with table.batch_writer() as batch:
+        for key in row_keys:
+            batch.delete_item(Key=key)
+        batch.delete_item(Key=tenancy.listing_version_key(bucket_name, prefix))
+        if prefix:
+            batch.delete_item(Key=tenancy.tenant_key(bucket_name, prefix))
+
+    if manifest is None:
+        return
+    kwargs = {
+        'KeyConditionExpression': '#bucket = :bucket',
+        'ExpressionAttributeNames': {'#bucket': 'bucket', '#key': 'key'},
+        'ExpressionAttributeValues': {':bucket': bucket_name},
+        'ProjectionExpression': '#bucket, #key'
+    }
+    if prefix:
+        kwargs['KeyConditionExpression'] += ' AND begins_with(#key, :prefix)'
+        kwargs['ExpressionAttributeValues'][':prefix'] = prefix
+    with manifest.batch_writer() as batch:
+        while True:
+            response = manifest.query(**kwargs)
+            for item in response.get('Items', []):
+                batch.delete_item(Key={'bucket': item['bucket'], 'key': item['key']})
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def teardown_bucket(s3, table, manifest, bucket_name, row_keys, dry_run=False, prefix=''):
+    """
+    Empty and delete one bucket, then drop its rows. With a prefix only that
+    user's objects in the shared bucket go, and the bucket stays.
+    Returns the number of object versions.
+    """
+    if '/' in bucket_name or (prefix and not tenancy.is_user_prefix(prefix)):
+        raise CleanupError(f'Refusing to tear down {bucket_name}/{prefix}: not a bucket or a user prefix')
+    try:
+        versions = empty_bucket(s3, bucket_name, dry_run, prefix)
+        if not dry_run and not prefix:
+            s3.delete_bucket(Bucket=bucket_name)
+    except ClientError as e:
+        # Already gone (e.g. removed by an earlier, interrupted run): only its rows are left
+        if e.response['Error']['Code'] != 'NoSuchBucket':
+            raise
+        versions = 0
+    if not dry_run:
+        delete_bucket_rows(table, manifest, bucket_name, row_keys, prefix)
+    return versions
+
+
+def teardown(s3, table, targets, manifest=None, max_workers=16, dry_run=False, checkpoint=None, on_progress=None):
+    """
+    Tear down the buckets in targets ({bucket_name: [row keys]}, or
+    '{bucket}/{prefix}' for a user of the shared bucket) on a pool of
+    max_workers threads, skipping any the checkpoint has already seen finish.
+    on_progress(bucket_name, versions, error) is called after each bucket.
+    Returns a summary; a failed bucket does not stop the others.
+    """
+    checkpoint = checkpoint or Checkpoint()
+    pending = {name: keys for name, keys in targets.items() if name not in checkpoint}
+    summary = {
+        'buckets': len(targets),
+        'resumed': len(targets) - len(pending),
+        'deleted': 0,
+        'objectVersions': 0,
+        'rows': 0,
+        'failed': {},
+        'dryRun': dry_run
+    }
+    lock = threading.Lock()
+
+    def run(item):
+        bucket_name, row_keys = item
+        try:
+            name, _, prefix = bucket_name.partition('/')
+            versions = teardown_bucket(s3, table, manifest, name, row_keys, dry_run, prefix)
+        except Exception as e:
+            with lock:
+                summary['failed'][bucket_name] = str(e)
+            if on_progress:
+                on_progress(bucket_name, None, e)
+            return
+        if not dry_run:
+            checkpoint.mark_done(bucket_name)
+        with lock:
+            summary['deleted'] += 1
+            summary['objectVersions'] += versions
+            summary['rows'] += len(row_keys)
+        if on_progress:
+            on_progress(bucket_name, versions, None)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+            list(executor.map(run, pending.items()))
+    return summary
+
+
+def purge_records(table, dry_run=False):
+    """
+    Delete the bookkeeping rows left once every bucket is gone: provisioning
+    jobs (job#), per-user resources versions (user#), listing versions
+    (bucket#), the expiry reaper's cursor (reaper#), idempotency keys (idem#)
+    and admission control's token buckets and leases (rate#, admission#).
+    Returns the number of rows.
+    """
+    kwargs = {
+        'FilterExpression': 'begins_with(#username, :job) OR begins_with(#username, :user) '
+                            'OR begins_with(#username, :bucket) OR begins_with(#username, :reaper) '
+                            'OR begins_with(#username, :idem) OR begins_with(#username, :rate) '
+                            'OR begins_with(#username, :admission)',
+        'ProjectionExpression': '#username, createdAt',
+        'ExpressionAttributeNames': {'#username': 'username'},
+        'ExpressionAttributeValues': {':job': 'job#', ':user': 'user#', ':bucket': 'bucket#', ':reaper': 'reaper#',
+                                      ':idem': 'idem#', ':rate': 'rate#', ':admission': 'admission#'}
+    }
+    count = 0
+    with table.batch_writer() as batch:
+        while True:
+            response = table.scan(**kwargs)
+            for item in response.get('Items', []):
+                if not dry_run:
+                    batch.delete_item(Key={'username': item['username'], 'createdAt': item['createdAt']})
+                count += 1
+            if 'LastEvaluatedKey' not in response:
+                return count
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+# Keys share the resources table with SPA records, in their own partitions
+KEY_PARTITION_PREFIX = 'idem#'
+RECORD_SORT_KEY = 'request'
+HEADER = 'idempotency-key'
+BODY_FIELD = 'idempotencyKey'
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+
+def get_key(event, body):
+    """
+    Idempotency key from the Idempotency-Key header or the idempotencyKey body
+    field; None when the request has neither. Raises ValueError when malformed.
+    """
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    key = headers[HEADER] if HEADER in headers else body.get(BODY_FIELD)
+    if key is None:
+        return None
+    if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'Idempotency key must be a non-empty string of at most {MAX_KEY_LENGTH} characters')
+    return key.strip()
+
+
+def fingerprint(body):
+    """Hash of the request body, so a key reused for a different request can be told apart"""
+    request = {name: value for name, value in body.items() if name != BODY_FIELD}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def record_key(key):
+    return {'username': f'{KEY_PARTITION_PREFIX}{key}', 'createdAt': RECORD_SORT_KEY}
+
+
+def claim(table, key, request_hash, ttl_seconds, lock_seconds):
+    """
+    Claim the key. Returns (token, None) when this call owns the request, or
+    (None, record) when another call already claimed or completed it. The
+    record is read first, so a retry of a finished request costs one read; the
+    claim itself is a conditional put. An in-progress claim whose lock has
+    lapsed (its caller timed out or crashed) is taken over.
+    """
+    for _ in range(2):
+        record = get(table, key)
+        now = int(time.time())
+        if record and not (record['status'] == IN_PROGRESS and record.get('lockedUntil', 0) < now):
+            return None, record
+        token = str(uuid.uuid4())
+        try:
+            table.put_item(
+                Item=dict(
+                    record_key(key),
+                    status=IN_PROGRESS,
+                    requestHash=request_hash,
+                    ownerToken=token,
+                    startedAt=datetime.utcnow().isoformat(),
+                    lockedUntil=now + lock_seconds,
+                    ttl=now + ttl_seconds
+                ),
+                ConditionExpression='attribute_not_exists(username) OR (#status = :in_progress AND lockedUntil < :now)',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':in_progress': IN_PROGRESS, ':now': now}
+            )
+            return token, None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        # Claimed by a concurrent call between the read and the put: read theirs
+    return None, get(table, key)
+
+
+def get(table, key):
+    return table.get_item(Key=record_key(key), ConsistentRead=True).get('Item')
+
+
+def wait_for(table, key, timeout, interval=0.2):
+    """
+    Poll an in-progress record until it completes, is released or timeout
+    seconds pass. Returns the last record seen (None once released).
+    """
+    deadline = time.monotonic() + timeout
+    record = get(table, key)
+    while record and record['status'] == IN_PROGRESS and time.monotonic() < deadline:
+        time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+        interval = min(interval * 2, 2.0)
+        record = get(table, key)
+    return record
+
+
+def complete(table, key, token, status_code, body):
+    """Store the response for replay; only the owner of the claim may"""
+    table.update_item(
+        Key=record_key(key),
+        UpdateExpression='SET #status = :completed, statusCode = :status_code, responseBody = :body, '
+                         'completedAt = :now REMOVE lockedUntil, ownerToken',
+        ConditionExpression='ownerToken = :token',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':completed': COMPLETED,
+            ':status_code': status_code,
+            ':body': body,
+            ':now': datetime.utcnow().isoformat(),
+            ':token': token
+        }
+    )
+
+
+def release(table, key, token):
+    """Give the key up after a failure, so a retry starts afresh"""
+    table.delete_item(
+        Key=record_key(key),
+        ConditionExpression='ownerToken = :token',
+        ExpressionAttributeValues={':token': token}
+    )
@@ -0,0 +1,160 @@
+import csv
+import io
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Columns of an inventory row, in CSV order; prefix is only set for SPAs in the shared bucket
+INVENTORY_FIELDS = ('username', 'createdAt', 'bucketName', 'websiteUrl', 'region', 'environment', 'status', 'prefix')
+FORMATS = ('ndjson', 'csv')
+# Unclaimed pool buckets share the table but belong to nobody yet
+BUCKET_POOL_PARTITION = 'bucket-pool'
+# Pages waiting for the consumer, per worker; bounds memory however large the table is
+PAGES_BUFFERED_PER_WORKER = 2
+
+_DONE = object()
+
+
+def resource_filter(environment=None, status=None, include_pool=False):
+    """Resource records only: job and version records lack a bucket, pool records live in their own partition"""
+    from boto3.dynamodb.conditions import Attr
+    condition = Attr('bucketName').exists() & Attr('websiteUrl').exists()
+    if not include_pool:
+        # Both the pool partition and its pending partition, bucket-pool#pending
+        condition &= ~Attr('username').begins_with(BUCKET_POOL_PARTITION)
+    if environment:
+        condition &= Attr('environment').eq(environment)
+    if status:
+        condition &= Attr('status').eq(status)
+    return condition
+
+
+def scan_resources(table, environment=None, status=None, total_segments=8, max_workers=8, page_size=None,
+                   include_pool=False):
+    """
+    Yield pages (lists of items) of every resource record, scanning
+    total_segments segments in parallel on max_workers threads. Pages arrive
+    in no particular order. Workers block while the consumer is behind, so at
+    most a few pages per worker are held in memory at once.
+    """
+    kwargs = {
+        'FilterExpression': resource_filter(environment, status, include_pool),
+        'ProjectionExpression': ', '.join(f'#f{i}' for i in range(len(INVENTORY_FIELDS))),
+        'ExpressionAttributeNames': {f'#f{i}': field for i, field in enumerate(INVENTORY_FIELDS)}
+    }
+    if page_size:
+        kwargs['Limit'] = page_size
+
+    workers = max(1, min(max_workers, total_segments))
+    pages = queue.Queue(maxsize=workers * PAGES_BUFFERED_PER_WORKER)
+    stop = threading.Event()
+
+    def put(page):
+        # Give up instead of blocking forever once the consumer has gone away
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def scan_segment(segment):
+        try:
+            scan_kwargs = dict(kwargs, Segment=segment, TotalSegments=total_segments)
+            while not stop.is_set():
+                response = table.scan(**scan_kwargs)
+                items = response.get('Items', [])
+                if items and not put(items):
+                    return
+                if 'LastEvaluatedKey' not in response:
+                    break
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inventory-scan')
+    try:
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def inventory_row(item):
+    return {field: item.get(field) for field in INVENTORY_FIELDS}
+
+
+def format_chunks(pages, fmt='ndjson'):
+    """Turn pages of items into text chunks, one per page (CSV starts with its header)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=INVENTORY_FIELDS, lineterminator='\n')
+        writer.writeheader()
+        yield buffer.getvalue()
+    for page in pages:
+        if fmt == 'ndjson':
+            yield ''.join(json.dumps(inventory_row(item), default=str) + '\n' for item in page)
+        else:
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=INVENTORY_FIELDS, lineterminator='\n')
+            writer.writerows(inventory_row(item) for item in page)
+            yield buffer.getvalue()
+
+
+def upload_chunks(s3, bucket, key, chunks, content_type, part_size=8 * 1024 ** 2):
+    """
+    Stream text chunks into one S3 object, uploading a multipart part each time
+    part_size bytes have been buffered; a small export is a single PutObject.
+    Returns the number of bytes written.
+    """
+    buffer = bytearray()
+    parts = []
+    upload_id = None
+    written = 0
+    try:
+        for chunk in chunks:
+            buffer += chunk.encode('utf-8')
+            if len(buffer) < part_size:
+                continue
+            if upload_id is None:
+                upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+            part_number = len(parts) + 1
+            response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                      Body=bytes(buffer))
+            parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+            written += len(buffer)
+            buffer = bytearray()
+
+        if upload_id is None:
+            s3.put_object(Bucket=bucket, Key=key, Body=bytes(buffer), ContentType=content_type)
+            return len(buffer)
+
+        # The last part may be smaller than S3's 5 MiB minimum
+        if buffer or not parts:
+            part_number = len(parts) + 1
+            response = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                      Body=bytes(buffer))
+            parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+            written += len(buffer)
+        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        return written
+    except Exception:
+        if upload_id is not None:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
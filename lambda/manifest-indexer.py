@@ -0,0 +1,203 @@
+import os
+import time
+from datetime import datetime
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+import aws_clients
+import structured_log as log
+
+s3 = aws_clients.client('s3')
+
+ENVIRONMENT_NAME = os.environ.get('ENVIRONMENT_NAME', 'sandbox')
+MANIFEST_TABLE = os.environ.get('MANIFEST_TABLE')
+# Removed objects leave a tombstone so a late, older ObjectCreated event cannot resurrect them
+TOMBSTONE_TTL = int(os.environ.get('MANIFEST_TOMBSTONE_TTL', '86400'))
+# S3 sequencers are hex strings of varying length; padded they compare correctly as strings
+SEQUENCER_WIDTH = 32
+
+manifest = aws_clients.table(MANIFEST_TABLE)
+aws_clients.prewarm(s3, manifest)
+
+# `bucket`, `key` and `size` are DynamoDB reserved words, so expressions use placeholders
+NEWER_THAN_STORED = 'attribute_not_exists(#sequencer) OR #sequencer < :sequencer'
+
+
+@log.request_handler('manifest-indexer')
+def lambda_handler(event, context):
+    """
+    Keep the per-bucket object manifest in step with S3.
+    S3 notification events: {"Records": [...]} (ObjectCreated:* / ObjectRemoved:*)
+    Reconcile command:      {"reconcile": {"buckets": ["sandbox-spa-..."]}}
+    """
+
+    if 'reconcile' in event:
+        buckets = event['reconcile'].get('buckets') or []
+        results = [reconcile_bucket(bucket) for bucket in buckets if is_managed_bucket(bucket)]
+        log.annotate(reconciled=len(results))
+        return {'reconciled': results}
+
+    counts = {'indexed': 0, 'removed': 0, 'stale': 0, 'ignored': 0}
+    for record in event.get('Records', []):
+        counts[apply_record(record)] += 1
+
+    log.annotate(records=len(event.get('Records', [])), **counts)
+    return counts
+
+
+def is_managed_bucket(bucket_name):
+    return bucket_name.startswith(f"{ENVIRONMENT_NAME}-spa-")
+
+
+def apply_record(record):
+    """Apply one S3 event record; returns indexed, removed, stale or ignored"""
+    event_name = record.get('eventName', '')
+    bucket_name = record['s3']['bucket']['name']
+    if not is_managed_bucket(bucket_name):
+        return 'ignored'
+
+    obj = record['s3']['object']
+    key = unquote_plus(obj['key'])
+    sequencer = obj.get('sequencer', '').rjust(SEQUENCER_WIDTH, '0')
+
+    if event_name.startswith('ObjectCreated:'):
+        return index_object(bucket_name, key, obj, sequencer, record.get('eventTime'))
+    if event_name.startswith('ObjectRemoved:'):
+        return remove_object(bucket_name, key, sequencer)
+    return 'ignored'
+
+
+def index_object(bucket_name, key, obj, sequencer, event_time):
+    # The event carries size and ETag but not the content type
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            # Already gone again; its ObjectRemoved event will follow
+            log.warning('Object disappeared before indexing: s3://%s/%s', bucket_name, key)
+            return 'stale'
+        raise
+
+    item = {
+        'bucket': bucket_name,
+        'key': key,
+        'size': obj.get('size', head['ContentLength']),
+        'etag': obj.get('eTag') or head['ETag'].strip('"'),
+        'contentType': head.get('ContentType', 'binary/octet-stream'),
+        'lastModified': format_timestamp(event_time) if event_time else head['LastModified'].isoformat(),
+        'sequencer': sequencer
+    }
+    return 'indexed' if write_if_newer(item) else 'stale'
+
+
+def remove_object(bucket_name, key, sequencer):
+    item = {
+        'bucket': bucket_name,
+        'key': key,
+        'deleted': True,
+        'sequencer': sequencer,
+        'expiresAt': int(time.time()) + TOMBSTONE_TTL
+    }
+    return 'removed' if write_if_newer(item) else 'stale'
+
+
+def write_if_newer(item):
+    """Events can arrive out of order; only apply one that is newer than what is stored"""
+    try:
+        manifest.put_item(
+            Item=item,
+            ConditionExpression=NEWER_THAN_STORED,
+            ExpressionAttributeNames={'#sequencer': 'sequencer'},
+            ExpressionAttributeValues={':sequencer': item['sequencer']}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            log.warning('Skipping out-of-order event for s3://%s/%s', item['bucket'], item['key'])
+            return False
+        raise
+
+
+def format_timestamp(event_time):
+    """S3 event times carry milliseconds; listings report whole seconds like LastModified"""
+    parsed = datetime.fromisoformat(event_time.replace('Z', '+00:00'))
+    return parsed.replace(microsecond=0).isoformat()
+
+
+def reconcile_bucket(bucket_name):
+    """
+    Rebuild a bucket's manifest from a full listing. S3 and the manifest both
+    return keys in the same (UTF-8 byte) order, so the two are merged page by
+    page and memory stays flat however large the bucket is.
+    """
+    stats = {'bucket': bucket_name, 'listed': 0, 'added': 0, 'updated': 0, 'removed': 0}
+    listed = iter_bucket_objects(bucket_name)
+    indexed = iter_manifest_items(bucket_name)
+    obj = next(listed, None)
+    item = next(indexed, None)
+
+    with manifest.batch_writer() as batch:
+        while obj is not None or item is not None:
+            if item is None or (obj is not None and obj['Key'] < item['key']):
+                batch.put_item(Item=manifest_item(bucket_name, obj))
+                stats['added'] += 1
+            elif obj is None or item['key'] < obj['Key']:
+                if not item.get('deleted'):
+                    batch.delete_item(Key={'bucket': bucket_name, 'key': item['key']})
+                    stats['removed'] += 1
+                item = next(indexed, None)
+                continue
+            else:
+                if is_drifted(item, obj):
+                    batch.put_item(Item=manifest_item(bucket_name, obj))
+                    stats['updated'] += 1
+                item = next(indexed, None)
+            stats['listed'] += 1
+            obj = next(listed, None)
+
+    log.info('Reconciled manifest', **stats)
+    return stats
+
+
+def is_drifted(item, obj):
+    return (
+        item.get('deleted', False)
+        or item.get('etag') != obj['ETag'].strip('"')
+        or int(item.get('size', -1)) != obj['Size']
+    )
+
+
+def iter_bucket_objects(bucket_name):
+    kwargs = {'Bucket': bucket_name}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        yield from response.get('Contents', [])
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def iter_manifest_items(bucket_name):
+    kwargs = {
+        'KeyConditionExpression': '#bucket = :bucket',
+        'ExpressionAttributeNames': {'#bucket': 'bucket'},
+        'ExpressionAttributeValues': {':bucket': bucket_name}
+    }
+    while True:
+        response = manifest.query(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def manifest_item(bucket_name, obj):
+    """Manifest entry for a listed object. No sequencer: any later event supersedes it."""
+    head = s3.head_object(Bucket=bucket_name, Key=obj['Key'])
+    return {
+        'bucket': bucket_name,
+        'key': obj['Key'],
+        'size': obj['Size'],
+        'etag': obj['ETag'].strip('"'),
+        'contentType': head.get('ContentType', 'binary/octet-stream'),
+        'lastModified': obj['LastModified'].isoformat()
+    }
@@ -0,0 +1,146 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from botocore.exceptions import ClientError
+import structured_log as log
+
+# Error codes worth retrying - everything else (e.g. BucketAlreadyExists) fails fast
+RETRYABLE_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'SlowDown',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'InternalError',
+    'ServiceUnavailable',
+    'OperationAborted',
+    'RequestTimeout',
+    'NoSuchBucket'  # freshly created buckets can take a moment to become visible
+}
+
+
+class Step:
+    """A single provisioning step and the steps it depends on"""
+
+    def __init__(self, name, func, depends_on=(), retries=2):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.retries = retries
+
+
+class ProvisioningError(Exception):
+    """Raised when one or more steps failed; dependents of failed steps are skipped"""
+
+    def __init__(self, failures, skipped, completed):
+        self.failures = failures
+        self.skipped = skipped
+        self.completed = completed
+        details = '; '.join(f"{name}: {error}" for name, error in failures.items())
+        message = f"{len(failures)} provisioning step(s) failed ({details})"
+        if skipped:
+            message += f"; skipped: {', '.join(skipped)}"
+        super().__init__(message)
+
+    def to_dict(self):
+        return {
+            'failedSteps': {name: str(error) for name, error in self.failures.items()},
+            'skippedSteps': self.skipped,
+            'completedSteps': self.completed
+        }
+
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def notify(on_step, name, state):
+    if on_step is None:
+        return
+    try:
+        on_step(name, state)
+    except Exception as e:
+        log.warning('Progress callback failed for step %s: %s', name, e)
+
+
+def run_step(step, backoff=0.2, on_step=None):
+    """Run a step, retrying transient failures with exponential backoff"""
+    notify(on_step, step.name, 'started')
+    try:
+        result = retry_step(step, backoff)
+    except Exception:
+        notify(on_step, step.name, 'failed')
+        raise
+    notify(on_step, step.name, 'succeeded')
+    return result
+
+
+def retry_step(step, backoff):
+    attempt = 0
+    while True:
+        try:
+            return step.func()
+        except Exception as e:
+            if attempt >= step.retries or not is_retryable(e):
+                raise
+            delay = backoff * (2 ** attempt)
+            log.warning('Step %s failed (%s), retrying in %.1fs', step.name, e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def run_steps(steps, max_workers=4, on_step=None):
+    """
+    Run steps as a dependency graph on a bounded thread pool.
+    Every step starts as soon as all of its dependencies have completed.
+    on_step(name, state) is called from the worker threads with
+    'started', 'succeeded' or 'failed'.
+    Returns {step name: result}; raises ProvisioningError if anything failed.
+    """
+    by_name = {step.name: step for step in steps}
+    for step in steps:
+        for dep in step.depends_on:
+            if dep not in by_name:
+                raise ValueError(f"Step {step.name} depends on unknown step {dep}")
+
+    results = {}
+    failures = {}
+    skipped = []
+    pending = list(steps)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for step in list(pending):
+                    if any(dep in failures or dep in skipped for dep in step.depends_on):
+                        pending.remove(step)
+                        skipped.append(step.name)
+                        changed = True
+                    elif all(dep in results for dep in step.depends_on):
+                        pending.remove(step)
+                        running[executor.submit(run_step, step, on_step=on_step)] = step
+
+            if not running:
+                # Nothing can make progress - the remaining steps form a cycle
+                if pending:
+                    raise ValueError(f"Dependency cycle between steps: {[s.name for s in pending]}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    results[step.name] = future.result()
+                except Exception as e:
+                    log.error('Step %s failed: %s', step.name, e)
+                    failures[step.name] = e
+
+    if failures:
+        raise ProvisioningError(failures, skipped, list(results))
+
+    return results
@@ -1,73 +1,1138 @@
 import json
-import boto3
+import math
 import os
+import queue
+import random
+import re
+import threading
+import time
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from botocore.exceptions import ClientError
+from provisioning_engine import Step, run_steps, ProvisioningError
+import admission
+import cleanup_engine
+import idempotency
+import inventory
+import spa_templates
+import tenancy
+import aws_clients
+import structured_log as log
 
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+s3 = aws_clients.client('s3')
+# Inventory download links are signed with SigV4, like the backend's upload URLs
+s3_presigner = aws_clients.client('s3', signature_version='s3v4')
+dynamodb = aws_clients.resource('dynamodb')
+lambda_client = aws_clients.client('lambda')
 
 ENVIRONMENT_NAME = os.environ.get('ENVIRONMENT_NAME', 'sandbox')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE')
 BACKEND_API_URL = os.environ.get('BACKEND_API_URL')
 AWS_REGION = os.environ['AWS_REGION']
+PROVISIONING_MAX_WORKERS = int(os.environ.get('PROVISIONING_MAX_WORKERS', '6'))
+PROVISIONING_STEP_RETRIES = int(os.environ.get('PROVISIONING_STEP_RETRIES', '2'))
+BATCH_MAX_USERS = int(os.environ.get('BATCH_MAX_USERS', '200'))
+BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', '8'))
+# 'lambda' re-invokes this function asynchronously; 'local' works jobs off an in-process queue
+JOB_DISPATCH_MODE = os.environ.get('JOB_DISPATCH_MODE', 'lambda')
+# 'bucket' gives every SPA a bucket of its own; 'prefix' gives it users/{user}-{id}/ in SHARED_SPA_BUCKET
+SPA_TENANCY_MODE = os.environ.get('SPA_TENANCY_MODE', tenancy.BUCKET_MODE)
+# Shared website bucket the stack creates fully configured (hosting, public read, CORS, notifications)
+SHARED_SPA_BUCKET = os.environ.get('SHARED_SPA_BUCKET')
+# Number of pre-configured buckets to keep ready for claiming; 0 disables the pool
+BUCKET_POOL_TARGET_SIZE = int(os.environ.get('BUCKET_POOL_TARGET_SIZE', '0'))
+BUCKET_POOL_PARTITION = 'bucket-pool'
+# Pool buckets being built, or whose build failed; only ready ones are in BUCKET_POOL_PARTITION
+BUCKET_POOL_PENDING_PARTITION = 'bucket-pool#pending'
+# Available pool buckets a claim reads; it takes one at random so concurrent claims rarely collide
+BUCKET_POOL_CLAIM_CANDIDATES = 10
+# Upload pages gzip-encoded (Content-Encoding: gzip)
+GZIP_UPLOADS = os.environ.get('GZIP_UPLOADS', 'true').lower() == 'true'
+# Shared bucket for the dashboard CSS/JS; when unset the assets are inlined into index.html
+SHARED_ASSETS_BUCKET = os.environ.get('SHARED_ASSETS_BUCKET')
+SHARED_ASSETS_URL = os.environ.get('SHARED_ASSETS_URL')
+# Manifest indexer function notified of object changes; when unset buckets get no notifications
+MANIFEST_INDEXER_ARN = os.environ.get('MANIFEST_INDEXER_ARN')
+# Private bucket fleet inventory exports are written to; when unset GET /inventory is unavailable
+INVENTORY_BUCKET = os.environ.get('INVENTORY_BUCKET')
+INVENTORY_SCAN_SEGMENTS = int(os.environ.get('INVENTORY_SCAN_SEGMENTS', '16'))
+INVENTORY_SCAN_WORKERS = int(os.environ.get('INVENTORY_SCAN_WORKERS', '8'))
+INVENTORY_URL_EXPIRES_IN = int(os.environ.get('INVENTORY_URL_EXPIRES_IN', '900'))
+# Object manifest the reaper clears along with an expired bucket; optional
+MANIFEST_TABLE = os.environ.get('MANIFEST_TABLE')
+# Resources with an expiresAt carry expiryPartition, so only they appear in this sparse index
+EXPIRY_INDEX = os.environ.get('EXPIRY_INDEX', 'expiry-index')
+EXPIRY_PARTITION = 'expiring'
+# Work done by one scheduled reaper run: buckets per parallel batch, and in total
+REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', '25'))
+REAPER_MAX_BUCKETS = int(os.environ.get('REAPER_MAX_BUCKETS', '200'))
+REAPER_MAX_WORKERS = int(os.environ.get('REAPER_MAX_WORKERS', '8'))
+# No new batch is started with less than this much of the invocation left
+REAPER_TIME_RESERVE_MS = int(os.environ.get('REAPER_TIME_RESERVE_MS', '60000'))
+# A teardown claimed longer ago than this was cut short and may be taken over
+REAPER_CLAIM_TIMEOUT_SECONDS = 900
+REAPER_CURSOR_KEY = {'username': 'reaper#expired', 'createdAt': 'cursor'}
+# Stored responses to idempotent create requests are replayed for this long
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+# A claim outliving the function timeout belongs to an attempt that died; a retry takes it over
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '330'))
+# How long a duplicate waits for the first attempt before reporting it still in progress
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10'))
+# Admission control: token buckets per username and per caller (rates per second, 0 disables)
+ADMISSION_USER_RATE = float(os.environ.get('ADMISSION_USER_RATE', '0.2'))
+ADMISSION_USER_BURST = int(os.environ.get('ADMISSION_USER_BURST', '5'))
+# A full batch (BATCH_MAX_USERS) must fit in one caller burst
+ADMISSION_CALLER_RATE = float(os.environ.get('ADMISSION_CALLER_RATE', '5'))
+ADMISSION_CALLER_BURST = int(os.environ.get('ADMISSION_CALLER_BURST', str(max(BATCH_MAX_USERS, 50))))
+# Provisioning requests and jobs running at once across all containers (0 disables)
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '50'))
+# A slot outliving the function timeout belongs to an invocation that died and is reclaimed
+ADMISSION_LEASE_SECONDS = int(os.environ.get('ADMISSION_LEASE_SECONDS', '330'))
+# How long a queued job waits for a slot before giving up
+ADMISSION_JOB_WAIT_SECONDS = float(os.environ.get('ADMISSION_JOB_WAIT_SECONDS', '60'))
+RESERVED_PREFIXES = ('job#', 'bucket#', 'user#', 'reaper#', f'{BUCKET_POOL_PARTITION}#',
+                     idempotency.KEY_PARTITION_PREFIX, admission.RATE_PARTITION_PREFIX, 'admission#')
 
-table = dynamodb.Table(DYNAMODB_TABLE)
+table = aws_clients.table(DYNAMODB_TABLE)
+manifest_table = aws_clients.table(MANIFEST_TABLE) if MANIFEST_TABLE else None
+aws_clients.prewarm(s3, dynamodb, table)
 
+local_job_queue = queue.Queue()
+local_worker_lock = threading.Lock()
+local_worker = None
+
+shared_assets_lock = threading.Lock()
+shared_assets_published = False
+shared_error_page_published = False
+
+@log.request_handler('spa-creator')
 def lambda_handler(event, context):
     """Main handler for SPA Creator Lambda"""
     
-    print(f"Received event: {json.dumps(event)}")
+    # Asynchronous invocation carrying a queued provisioning job
+    if 'spaJob' in event:
+        return run_job(event['spaJob'])
+    
+    # Scheduled pool maintenance
+    if event.get('poolAction') == 'refill':
+        return refill_pool(int(event.get('targetSize', BUCKET_POOL_TARGET_SIZE)))
+    
+    # Scheduled teardown of SPAs past their expiresAt
+    if event.get('reaperAction') == 'reap':
+        return reap_expired(context)
     
     try:
-        body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event.get('body', {})
-        username = body.get('username')
-        
-        if not username:
-            return create_response(400, {'error': 'Username is required'})
+        if get_http_method(event) == 'GET':
+            if get_route_path(event) == '/inventory':
+                return export_inventory(event)
+            return get_job_status(event)
         
-        sanitized_username = sanitize_username(username)
-        unique_id = str(uuid.uuid4())[:8]
-        bucket_name = f"{ENVIRONMENT_NAME}-spa-{sanitized_username}-{unique_id}"
+        body = json.loads(event.get('body', '{}')) if isinstance(event.get('body'), str) else event.get('body', {})
         
-        print(f"Creating SPA for user: {username}, bucket: {bucket_name}")
+        try:
+            idempotency_key = idempotency.get_key(event, body)
+        except ValueError as e:
+            return create_response(400, {'error': str(e)})
         
-        create_s3_bucket(bucket_name)
-        configure_static_website(bucket_name)
-        configure_cors(bucket_name)  # ADD CORS CONFIGURATION
-        set_bucket_policy(bucket_name)
-        website_url = upload_spa_files(bucket_name, username, sanitized_username)
-        track_resource(username, bucket_name, website_url)
+        caller = get_caller(event)
+        if idempotency_key:
+            return run_idempotent(idempotency_key, body, caller)
+        return handle_create(body, caller)
         
-        response_data = {
-            'success': True,
+    except ProvisioningError as e:
+        error_message = f"Error creating SPA: {str(e)}"
+        log.error(error_message)
+        return create_response(500, {'error': error_message, **e.to_dict()})
+    except Exception as e:
+        error_message = f"Error creating SPA: {str(e)}"
+        log.error(error_message)
+        return create_response(500, {'error': error_message})
+
+
+def handle_create(body, caller=None):
+    """Single, batch or asynchronous create request, once admitted"""
+    try:
+        expires_at = parse_expires_at(body.get('expiresAt'))
+    except ValueError as e:
+        return create_response(400, {'error': str(e)})
+    
+    if 'usernames' in body:
+        try:
+            usernames, concurrency = validate_batch(body.get('usernames'), body.get('maxConcurrency'))
+        except ValueError as e:
+            return create_response(400, {'error': str(e)})
+        # Each user's own bucket is charged as that user is provisioned, see provision_batch_user
+        shed = admit(caller, cost=len(usernames))
+        if shed:
+            return shed
+        lease_id, retry_after = acquire_provisioning_slot()
+        if lease_id is None:
+            return shed_response('in-flight', retry_after)
+        try:
+            return handle_batch(usernames, concurrency, expires_at)
+        finally:
+            release_provisioning_slot(lease_id)
+    
+    username = body.get('username')
+    
+    if not username:
+        return create_response(400, {'error': 'Username is required'})
+    
+    if is_reserved_username(username):
+        return create_response(400, {'error': 'Username is reserved'})
+    
+    shed = admit(caller, username)
+    if shed:
+        return shed
+    
+    # A queued job takes its provisioning slot when it runs
+    if body.get('async'):
+        return submit_job(username, expires_at)
+    
+    lease_id, retry_after = acquire_provisioning_slot()
+    if lease_id is None:
+        return shed_response('in-flight', retry_after)
+    try:
+        bucket_name, website_url = provision_spa(username, expires_at=expires_at)
+    finally:
+        release_provisioning_slot(lease_id)
+    
+    response_data = build_success_response(username, bucket_name, website_url, expires_at)
+    
+    log.annotate(username=username, bucket=bucket_name)
+    return create_response(200, response_data)
+
+
+def get_caller(event):
+    """Who is calling: the authorizer's identity when the route has one, otherwise the source IP"""
+    request_context = event.get('requestContext', {})
+    authorizer = request_context.get('authorizer') or {}
+    identity = (
+        (authorizer.get('iam') or {}).get('userArn')
+        or ((authorizer.get('jwt') or {}).get('claims') or {}).get('sub')
+        or (authorizer.get('lambda') or {}).get('principalId')
+    )
+    return (
+        identity
+        or request_context.get('http', {}).get('sourceIp')
+        or request_context.get('identity', {}).get('sourceIp')
+        or 'unknown'
+    )
+
+
+def admit(caller, username=None, cost=1):
+    """
+    Charge the request to the username's and the caller's token buckets.
+    Returns a 429 response when either is empty, otherwise None; a request
+    the caller's bucket sheds gets the user's token back.
+    """
+    if username:
+        retry_after = admit_user(username)
+        if retry_after:
+            return shed_response('user', retry_after)
+    if caller:
+        retry_after = admission.acquire_tokens(table, 'caller', caller, ADMISSION_CALLER_RATE,
+                                               ADMISSION_CALLER_BURST, cost)
+        if retry_after:
+            if username:
+                admission.refund_tokens(table, 'user', username, ADMISSION_USER_RATE)
+            return shed_response('caller', retry_after)
+    return None
+
+
+def admit_user(username):
+    """Take a token from the username's bucket; returns 0, or the seconds until one is due"""
+    return admission.acquire_tokens(table, 'user', username, ADMISSION_USER_RATE, ADMISSION_USER_BURST)
+
+
+def shed_response(reason, retry_after):
+    log.annotate(shed=reason, retryAfter=round(retry_after, 1))
+    shed = shed_details(reason, retry_after)
+    return create_response(429, shed, {'Retry-After': str(shed['retryAfter'])})
+
+
+def shed_details(reason, retry_after):
+    messages = {
+        'user': 'Too many SPA requests for this user',
+        'caller': 'Too many SPA requests from this caller',
+        'in-flight': 'Too many SPAs are being provisioned right now'
+    }
+    seconds = max(1, math.ceil(retry_after))
+    return {'error': f"{messages[reason]}; retry in {seconds}s", 'retryAfter': seconds}
+
+
+def acquire_provisioning_slot():
+    return admission.acquire_slot(table, dynamodb.meta.client, ADMISSION_MAX_IN_FLIGHT, ADMISSION_LEASE_SECONDS)
+
+
+def release_provisioning_slot(lease_id):
+    try:
+        admission.release_slot(table, dynamodb.meta.client, lease_id)
+    except Exception as e:
+        # The lease expires and is reclaimed
+        log.warning('Error releasing provisioning slot %s: %s', lease_id, e)
+
+
+def run_idempotent(key, body, caller=None):
+    """
+    Handle a create request at most once per idempotency key. The first call
+    claims the key and stores its response; a retry of a finished request gets
+    that response back, and a retry arriving while the first call is still
+    provisioning waits up to IDEMPOTENCY_WAIT_SECONDS for it. A call that is
+    shed or fails with a server error gives the key up, so the next retry starts afresh.
+    """
+    log.annotate(idempotencyKey=key)
+    request_hash = idempotency.fingerprint(body)
+    token, record = idempotency.claim(table, key, request_hash, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LOCK_SECONDS)
+    
+    if token is None:
+        if record and record.get('requestHash') != request_hash:
+            return create_response(422, {'error': 'Idempotency key was already used for a different request'})
+        if record and record['status'] == idempotency.IN_PROGRESS:
+            record = idempotency.wait_for(table, key, IDEMPOTENCY_WAIT_SECONDS)
+            if record is None:
+                # The first attempt failed and let the key go: this retry takes over
+                return run_idempotent(key, body, caller)
+        if record and record['status'] == idempotency.COMPLETED:
+            log.annotate(idempotentReplay=True)
+            response = create_response(int(record['statusCode']), None, {'Idempotent-Replayed': 'true'})
+            response['body'] = record['responseBody']
+            return response
+        return create_response(409, {
+            'error': 'A request with this idempotency key is still in progress',
+            'status': idempotency.IN_PROGRESS,
+            'startedAt': record.get('startedAt') if record else None
+        }, {'Retry-After': str(max(1, round(IDEMPOTENCY_WAIT_SECONDS)))})
+    
+    try:
+        response = handle_create(body, caller)
+    except Exception:
+        release_idempotency_key(key, token)
+        raise
+    
+    if response['statusCode'] == 429:
+        release_idempotency_key(key, token)
+        return response
+    try:
+        idempotency.complete(table, key, token, response['statusCode'], response['body'])
+    except Exception as e:
+        log.warning('Error storing response for idempotency key %s: %s', key, e)
+    return response
+
+
+def release_idempotency_key(key, token):
+    try:
+        idempotency.release(table, key, token)
+    except Exception as e:
+        log.warning('Error releasing idempotency key %s: %s', key, e)
+
+
+def is_reserved_username(username):
+    """Pool, job, bucket and bookkeeping records share the table's username partition key"""
+    return username == BUCKET_POOL_PARTITION or username.startswith(RESERVED_PREFIXES)
+
+
+def parse_expires_at(value):
+    """Normalise an optional ISO 8601 expiresAt to the naive UTC form createdAt uses"""
+    if value is None:
+        return None
+    try:
+        expires_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('expiresAt must be an ISO 8601 timestamp, e.g. 2026-01-31T18:00:00Z')
+    if expires_at.tzinfo:
+        expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+    if expires_at <= datetime.utcnow():
+        raise ValueError('expiresAt must be in the future')
+    return expires_at.isoformat(timespec='seconds')
+
+
+def get_http_method(event):
+    return event.get('requestContext', {}).get('http', {}).get('method') or event.get('httpMethod')
+
+
+def get_route_path(event):
+    route_key = event.get('routeKey') or ''
+    if ' ' in route_key:
+        return route_key.partition(' ')[2]
+    # rawPath carries the stage prefix, e.g. /prod/inventory
+    return '/' + (event.get('rawPath') or '').rstrip('/').rsplit('/', 1)[-1]
+
+
+def build_success_response(username, bucket_name, website_url, expires_at=None):
+    response = {
+        'success': True,
+        'username': username,
+        'bucketName': bucket_name,
+        **prefix_field(bucket_name, website_url),
+        'websiteUrl': website_url,
+        'apiEndpoint': BACKEND_API_URL,
+        'region': AWS_REGION,
+        'createdAt': datetime.utcnow().isoformat(),
+        'message': f'SPA created successfully! Visit {website_url} to see your personal dashboard.'
+    }
+    if expires_at:
+        response['expiresAt'] = expires_at
+    return response
+
+
+def submit_job(username, expires_at=None):
+    """Record a pending job, hand it to a worker and acknowledge with 202 straight away"""
+    job_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    job = {'jobId': job_id, 'createdAt': now, 'username': username}
+    if expires_at:
+        job['expiresAt'] = expires_at
+    
+    # Jobs live in their own partition so they never show up in a user's resources
+    table.put_item(Item={
+        'username': f"job#{job_id}",
+        'createdAt': now,
+        'recordType': 'job',
+        'jobId': job_id,
+        'requestedUsername': username,
+        'status': 'pending',
+        'currentStep': 'queued',
+        'completedSteps': [],
+        'updatedAt': now
+    })
+    
+    try:
+        dispatch_job(job)
+    except Exception as e:
+        update_job(job, status='failed', currentStep='dispatch', error=f"Could not dispatch job: {e}")
+        raise
+    
+    log.info('Provisioning job %s queued for user: %s', job_id, username)
+    return create_response(202, {
+        'success': True,
+        'jobId': job_id,
+        'username': username,
+        'status': 'pending',
+        'statusPath': f"/provisioning-status?jobId={job_id}"
+    })
+
+
+def dispatch_job(job):
+    if JOB_DISPATCH_MODE == 'local':
+        start_local_worker()
+        local_job_queue.put(job)
+        return
+    
+    lambda_client.invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'spaJob': job})
+    )
+
+
+def start_local_worker():
+    global local_worker
+    with local_worker_lock:
+        if local_worker is None or not local_worker.is_alive():
+            local_worker = threading.Thread(target=work_local_queue, name='spa-job-worker', daemon=True)
+            local_worker.start()
+
+
+def work_local_queue():
+    while True:
+        job = local_job_queue.get()
+        try:
+            run_job(job)
+        finally:
+            local_job_queue.task_done()
+
+
+def run_job(job):
+    """Work off a queued job, recording progress on the job record"""
+    log.info('Running provisioning job %s for user: %s', job['jobId'], job['username'])
+    try:
+        lease_id = wait_for_provisioning_slot(ADMISSION_JOB_WAIT_SECONDS)
+    except Exception as e:
+        # Never leave the job pending: its poller would wait forever
+        log.error('Provisioning job %s could not take a slot: %s', job['jobId'], e)
+        update_job(job, status='failed', error=f'Error creating SPA: {str(e)}')
+        return {'jobId': job['jobId'], 'status': 'failed'}
+    if lease_id is None:
+        update_job(job, status='failed', error='Provisioning capacity exhausted; submit the request again later')
+        return {'jobId': job['jobId'], 'status': 'failed'}
+    try:
+        return provision_job(job)
+    finally:
+        release_provisioning_slot(lease_id)
+
+
+def wait_for_provisioning_slot(timeout):
+    """Jobs have no caller waiting on them, so they queue for a slot instead of being shed"""
+    deadline = time.monotonic() + timeout
+    while True:
+        lease_id, retry_after = acquire_provisioning_slot()
+        if lease_id is not None or time.monotonic() + retry_after > deadline:
+            return lease_id
+        time.sleep(retry_after + random.uniform(0, retry_after))
+
+
+def provision_job(job):
+    update_job(job, status='running', currentStep='create_bucket')
+    
+    def on_step(name, state):
+        if state == 'started':
+            update_job(job, currentStep=name)
+        elif state == 'succeeded':
+            table.update_item(
+                Key=job_key(job),
+                UpdateExpression='SET completedSteps = list_append(completedSteps, :step)',
+                ExpressionAttributeValues={':step': [name]}
+            )
+    
+    try:
+        expires_at = job.get('expiresAt')
+        bucket_name, website_url = provision_spa(job['username'], on_step=on_step, expires_at=expires_at)
+        result = build_success_response(job['username'], bucket_name, website_url, expires_at)
+        update_job(job, status='succeeded', currentStep='done', result=result)
+        return {'jobId': job['jobId'], 'status': 'succeeded'}
+    except Exception as e:
+        log.error('Provisioning job %s failed: %s', job['jobId'], e)
+        details = e.to_dict() if isinstance(e, ProvisioningError) else {}
+        update_job(job, status='failed', error=f"Error creating SPA: {str(e)}", **details)
+        return {'jobId': job['jobId'], 'status': 'failed'}
+
+
+def job_key(job):
+    return {'username': f"job#{job['jobId']}", 'createdAt': job['createdAt']}
+
+
+def update_job(job, **fields):
+    fields['updatedAt'] = datetime.utcnow().isoformat()
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    values = {f":v{i}": value for i, value in enumerate(fields.values())}
+    try:
+        table.update_item(
+            Key=job_key(job),
+            UpdateExpression='SET ' + ', '.join(f"#f{i} = :v{i}" for i in range(len(fields))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        log.warning('Error updating job %s: %s', job['jobId'], e)
+
+
+def export_inventory(event):
+    """
+    Write every provisioned SPA to a private S3 object for CMDB reconciliation
+    and return a presigned link to it. The table is read with a parallel
+    segmented Scan and streamed out in parts, so memory stays flat.
+    Query parameters: ?format=ndjson|csv&environment=sandbox&status=active
+    """
+    if not INVENTORY_BUCKET:
+        return create_response(503, {'error': 'Inventory export is not configured'})
+    # The route requires IAM auth; refuse anything API Gateway did not sign off on
+    authorizer = event.get('requestContext', {}).get('authorizer') or {}
+    if not (authorizer.get('iam') or {}).get('userArn'):
+        return create_response(403, {'error': 'Inventory export requires a signed request'})
+    
+    query_params = event.get('queryStringParameters', {}) or {}
+    fmt = query_params.get('format', 'ndjson')
+    if fmt not in inventory.FORMATS:
+        return create_response(400, {'error': f"format must be one of {', '.join(inventory.FORMATS)}"})
+    
+    counted = {'resources': 0}
+    
+    def counting(pages):
+        for page in pages:
+            counted['resources'] += len(page)
+            yield page
+    
+    started_at = datetime.utcnow()
+    key = f"inventory/{started_at.strftime('%Y/%m/%d/%H%M%S')}-{str(uuid.uuid4())[:8]}.{fmt}"
+    pages = inventory.scan_resources(
+        table,
+        environment=query_params.get('environment'),
+        status=query_params.get('status'),
+        total_segments=INVENTORY_SCAN_SEGMENTS,
+        max_workers=INVENTORY_SCAN_WORKERS
+    )
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    size = inventory.upload_chunks(s3, INVENTORY_BUCKET, key, inventory.format_chunks(counting(pages), fmt),
+                                   content_type)
+    
+    log.annotate(resources=counted['resources'], bytes=size)
+    return create_response(200, {
+        'success': True,
+        'format': fmt,
+        'resourceCount': counted['resources'],
+        'bytes': size,
+        'key': key,
+        'downloadUrl': s3_presigner.generate_presigned_url(
+            'get_object', Params={'Bucket': INVENTORY_BUCKET, 'Key': key}, ExpiresIn=INVENTORY_URL_EXPIRES_IN
+        ),
+        'expiresIn': INVENTORY_URL_EXPIRES_IN,
+        'generatedAt': started_at.isoformat()
+    })
+
+
+def get_job_status(event):
+    query_params = event.get('queryStringParameters', {}) or {}
+    job_id = query_params.get('jobId')
+    
+    if not job_id:
+        return create_response(400, {'error': 'jobId is required'})
+    
+    response = table.query(
+        KeyConditionExpression='username = :job',
+        ExpressionAttributeValues={':job': f"job#{job_id}"},
+        Limit=1
+    )
+    items = response.get('Items', [])
+    
+    if not items:
+        return create_response(404, {'error': 'Job not found'})
+    
+    job = items[0]
+    return create_response(200, {
+        'success': True,
+        'jobId': job_id,
+        'username': job.get('requestedUsername'),
+        'status': job.get('status'),
+        'currentStep': job.get('currentStep'),
+        'completedSteps': job.get('completedSteps', []),
+        'failedSteps': job.get('failedSteps'),
+        'skippedSteps': job.get('skippedSteps'),
+        'result': job.get('result'),
+        'error': job.get('error'),
+        'createdAt': job.get('createdAt'),
+        'updatedAt': job.get('updatedAt')
+    })
+
+
+def validate_batch(usernames, max_concurrency=None):
+    """
+    Check a batch before it is admitted, so a malformed one costs no tokens.
+    Returns the distinct usernames, in order, and the worker count; raises
+    ValueError with the message for a 400.
+    """
+    if not isinstance(usernames, list) or not usernames or not all(isinstance(u, str) and u for u in usernames):
+        raise ValueError('usernames must be a non-empty list of usernames')
+    
+    reserved = [u for u in usernames if is_reserved_username(u)]
+    if reserved:
+        raise ValueError(f"Reserved usernames: {', '.join(reserved)}")
+    
+    usernames = list(dict.fromkeys(usernames))  # drop duplicates, keep order
+    if len(usernames) > BATCH_MAX_USERS:
+        raise ValueError(f'At most {BATCH_MAX_USERS} usernames per request')
+    
+    try:
+        concurrency = int(max_concurrency or BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise ValueError('maxConcurrency must be an integer')
+    return usernames, max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(usernames)))
+
+
+def handle_batch(usernames, concurrency, expires_at=None):
+    """Provision SPAs for a validated list of usernames and report a result per user"""
+    
+    log.info('Creating SPAs for %s users (concurrency %s)', len(usernames), concurrency)
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda username: provision_batch_user(username, expires_at), usernames))
+    
+    failed = sum(1 for r in results if not r['success'])
+    response_data = {
+        'success': failed == 0,
+        'requested': len(results),
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'apiEndpoint': BACKEND_API_URL,
+        'region': AWS_REGION,
+        'results': results
+    }
+    if expires_at:
+        response_data['expiresAt'] = expires_at
+    
+    log.info('Batch complete: %s succeeded, %s failed', response_data['succeeded'], failed)
+    return create_response(200 if failed == 0 else 207, response_data)
+
+
+def provision_batch_user(username, expires_at=None):
+    try:
+        # A batch is held to the same per-user limit as single requests; a user over it fails alone
+        retry_after = admit_user(username)
+        if retry_after:
+            return {
+                'username': username,
+                'success': False,
+                'bucketName': None,
+                'websiteUrl': None,
+                **shed_details('user', retry_after)
+            }
+        bucket_name, website_url = provision_spa(username, expires_at=expires_at)
+        return {
             'username': username,
+            'success': True,
             'bucketName': bucket_name,
+            **prefix_field(bucket_name, website_url),
             'websiteUrl': website_url,
-            'apiEndpoint': BACKEND_API_URL,
-            'region': AWS_REGION,
-            'createdAt': datetime.utcnow().isoformat(),
-            'message': f'SPA created successfully! Visit {website_url} to see your personal dashboard.'
+            'error': None
         }
+    except Exception as e:
+        log.error('Error creating SPA for %s: %s', username, e)
+        result = {
+            'username': username,
+            'success': False,
+            'bucketName': None,
+            'websiteUrl': None,
+            'error': str(e)
+        }
+        if isinstance(e, ProvisioningError):
+            result.update(e.to_dict())
+        return result
+
+
+def provision_spa(username, on_step=None, expires_at=None):
+    """
+    Claim a pre-warmed bucket or create and configure a fresh one, or in the
+    prefix tenancy mode give the user a prefix in the shared bucket, and
+    record it in DynamoDB. Returns (bucket_name, website_url).
+    
+    A fresh bucket's record is written as 'provisioning' before the bucket is
+    created and marked 'failed' if a step fails, so a bucket left behind by a
+    failure or a timeout is always tracked and cleanup-resources can find it.
+    """
+    sanitized_username = sanitize_username(username)
+    
+    if SPA_TENANCY_MODE == tenancy.PREFIX_MODE:
+        return provision_prefix(username, sanitized_username, on_step, expires_at)
+    
+    if BUCKET_POOL_TARGET_SIZE > 0:
+        claimed = claim_pool_bucket(username, sanitized_username, on_step, expires_at)
+        if claimed:
+            return claimed
+        log.info('Bucket pool is empty, provisioning a fresh bucket')
+    
+    unique_id = str(uuid.uuid4())[:8]
+    bucket_name = f"{ENVIRONMENT_NAME}-spa-{sanitized_username}-{unique_id}"
+    
+    log.debug('Creating SPA for user: %s, bucket: %s', username, bucket_name)
+    
+    resource_item = build_resource_item(username, bucket_name, website_url_for(bucket_name), expires_at,
+                                        status='provisioning')
+    table.put_item(Item=resource_item)
+    try:
+        results = run_steps(
+            build_provisioning_steps(bucket_name, username, sanitized_username),
+            max_workers=PROVISIONING_MAX_WORKERS,
+            on_step=on_step
+        )
+    except ProvisioningError:
+        mark_resource_failed(resource_item)
+        raise
+    mark_resource_active(resource_item)
+    return bucket_name, results['upload_index']
+
+
+def provision_prefix(username, sanitized_username, on_step=None, expires_at=None):
+    """
+    Give the user a prefix of the shared bucket, which is configured once for
+    everybody: provisioning is the user's index.html, the prefix's tenant
+    record and the resource record. Returns (bucket_name, website_url).
+    """
+    if not SHARED_SPA_BUCKET:
+        raise ValueError('SHARED_SPA_BUCKET must be set in the prefix tenancy mode')
+    
+    prefix = tenancy.user_prefix(sanitized_username, str(uuid.uuid4())[:8])
+    log.debug('Creating SPA for user: %s, prefix: %s/%s', username, SHARED_SPA_BUCKET, prefix)
+    
+    retries = PROVISIONING_STEP_RETRIES
+    results = run_steps([
+        Step('shared_assets', publish_shared_assets, retries=retries),
+        Step('shared_error_page', publish_shared_error_page, retries=retries),
+        Step('upload_index', lambda: upload_index_html(SHARED_SPA_BUCKET, username, prefix), ['shared_assets'], retries)
+    ], max_workers=2, on_step=on_step)
+    
+    # The backends only serve a prefix of the shared bucket that has this record
+    table.put_item(Item=dict(tenancy.tenant_key(SHARED_SPA_BUCKET, prefix), owner=username))
+    track_resource(username, SHARED_SPA_BUCKET, results['upload_index'], expires_at, prefix)
+    return SHARED_SPA_BUCKET, results['upload_index']
+
+
+def prefix_field(bucket_name, website_url):
+    """{'prefix': ...} for an SPA in the shared bucket, whose website URL ends with its prefix; else {}"""
+    if not SHARED_SPA_BUCKET or bucket_name != SHARED_SPA_BUCKET:
+        return {}
+    return {'prefix': website_url[len(website_url_for(bucket_name)) + 1:]}
+
+
+def claim_pool_bucket(username, sanitized_username, on_step=None, expires_at=None):
+    """
+    Atomically claim an available pool bucket and record it for the user in a
+    single transaction, then upload the personalised index.html and retag.
+    The claim deletes the pool row, so the pool partition only ever holds
+    available buckets and a claim reads a handful of rows, however many
+    buckets were claimed before. Returns (bucket_name, website_url), or None
+    when the pool is empty.
+    """
+    candidates = list_available_pool_buckets(BUCKET_POOL_CLAIM_CANDIDATES)
+    # Spread concurrent claims over the pool instead of racing for the oldest bucket
+    random.shuffle(candidates)
+    
+    for candidate in candidates:
+        bucket_name = candidate['bucketName']
+        resource_item = build_resource_item(username, bucket_name, candidate['websiteUrl'], expires_at)
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=[
+                {
+                    'Delete': {
+                        'TableName': DYNAMODB_TABLE,
+                        'Key': serialize_item({'username': BUCKET_POOL_PARTITION, 'createdAt': candidate['createdAt']}),
+                        'ConditionExpression': '#status = :available',
+                        'ExpressionAttributeNames': {'#status': 'status'},
+                        'ExpressionAttributeValues': serialize_item({':available': 'available'})
+                    }
+                },
+                {
+                    'Put': {
+                        'TableName': DYNAMODB_TABLE,
+                        'Item': serialize_item(resource_item)
+                    }
+                },
+                {
+                    'Update': {
+                        'TableName': DYNAMODB_TABLE,
+                        'Key': serialize_item(resources_version_key(username)),
+                        'UpdateExpression': 'ADD version :one',
+                        'ExpressionAttributeValues': serialize_item({':one': 1})
+                    }
+                }
+            ])
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                continue  # somebody else claimed it first
+            raise
         
-        print(f"SPA created successfully: {json.dumps(response_data)}")
-        return create_response(200, response_data)
-        
+        log.info('Claimed pool bucket %s for user: %s', bucket_name, username)
+        retries = PROVISIONING_STEP_RETRIES
+        try:
+            results = run_steps([
+                Step('shared_assets', publish_shared_assets, retries=retries),
+                Step('upload_index', lambda: upload_index_html(bucket_name, username), ['shared_assets'], retries),
+                Step('tag_bucket', lambda: tag_bucket(bucket_name, owner=sanitized_username), retries=retries)
+            ], max_workers=2, on_step=on_step)
+        except ProvisioningError:
+            mark_resource_failed(resource_item)
+            raise
+        return bucket_name, results['upload_index']
+    
+    return None
+
+
+def list_available_pool_buckets(limit=None):
+    """Rows of the pool partition, oldest first: at most limit of them, or all when limit is None"""
+    from boto3.dynamodb.conditions import Key
+    items = []
+    kwargs = {'KeyConditionExpression': Key('username').eq(BUCKET_POOL_PARTITION)}
+    while True:
+        if limit:
+            kwargs['Limit'] = limit - len(items)
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response or (limit and len(items) >= limit):
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def refill_pool(target_size):
+    """Create and configure pool buckets until target_size are available"""
+    rows = list_available_pool_buckets()
+    # Claims used to mark rows 'claimed' and leave them in the partition; their buckets belong to users now
+    legacy = [row for row in rows if row.get('status') != 'available']
+    if legacy:
+        with table.batch_writer() as batch:
+            for row in legacy:
+                batch.delete_item(Key={'username': row['username'], 'createdAt': row['createdAt']})
+    available = len(rows) - len(legacy)
+    missing = max(0, target_size - available)
+    log.info('Bucket pool: %s available, target %s, creating %s', available, target_size, missing)
+    
+    if missing == 0:
+        return {'available': available, 'created': 0, 'failed': 0}
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(missing, BATCH_MAX_CONCURRENCY))) as executor:
+        created = sum(executor.map(lambda _: create_pool_bucket(), range(missing)))
+    
+    return {
+        'available': available + created,
+        'created': created,
+        'failed': missing - created
+    }
+
+
+def create_pool_bucket():
+    """
+    Create and configure one pool bucket. Its row is written first, as
+    'provisioning' in the pending partition, so a bucket left behind by a
+    timeout or a failed step is always tracked and cleanup-resources can find
+    it. Once configured, the row moves to the pool partition, where claims
+    look. Returns True once the bucket is available.
+    """
+    bucket_name = f"{ENVIRONMENT_NAME}-spa-pool-{str(uuid.uuid4())[:8]}"
+    item = {
+        'username': BUCKET_POOL_PENDING_PARTITION,
+        'createdAt': f"{datetime.utcnow().isoformat()}#{bucket_name}",
+        'bucketName': bucket_name,
+        'websiteUrl': website_url_for(bucket_name),
+        'region': AWS_REGION,
+        'environment': ENVIRONMENT_NAME,
+        'status': 'provisioning'
+    }
+    try:
+        table.put_item(Item=item)
     except Exception as e:
-        error_message = f"Error creating SPA: {str(e)}"
-        print(error_message)
-        return create_response(500, {'error': error_message})
+        log.error('Error recording pool bucket %s: %s', bucket_name, e)
+        return False
+    
+    try:
+        run_steps(build_bucket_steps(bucket_name), max_workers=PROVISIONING_MAX_WORKERS)
+    except Exception as e:
+        log.error('Error creating pool bucket %s: %s', bucket_name, e)
+        try:
+            table.update_item(
+                Key={'username': item['username'], 'createdAt': item['createdAt']},
+                UpdateExpression='SET #status = :failed',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':failed': 'failed'}
+            )
+        except Exception as e:
+            log.warning('Error marking pool bucket %s failed: %s', bucket_name, e)
+        return False
+    
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=[
+            {
+                'Put': {
+                    'TableName': DYNAMODB_TABLE,
+                    'Item': serialize_item(dict(item, username=BUCKET_POOL_PARTITION, status='available'))
+                }
+            },
+            {
+                'Delete': {
+                    'TableName': DYNAMODB_TABLE,
+                    'Key': serialize_item({'username': item['username'], 'createdAt': item['createdAt']})
+                }
+            }
+        ])
+    except Exception as e:
+        # The pending row still tracks the bucket
+        log.warning('Error making pool bucket %s available: %s', bucket_name, e)
+        return False
+    return True
+
+
+def reap_expired(context=None):
+    """
+    Tear down SPAs whose expiresAt has passed. Only expiring resources have an
+    entry in the sparse expiry index, so due items come from a Query rather than
+    a table scan. Buckets are torn down REAPER_BATCH_SIZE at a time in parallel,
+    up to REAPER_MAX_BUCKETS per run; the index position is saved after every
+    batch so the next run carries on from there, and a run that reaches the end
+    starts over, picking up anything that failed.
+    """
+    from boto3.dynamodb.conditions import Key
+    now = datetime.utcnow().isoformat()
+    cursor = load_reaper_cursor()
+    summary = {'examined': 0, 'deleted': 0, 'skipped': 0, 'failed': 0}
+
+    while summary['examined'] < REAPER_MAX_BUCKETS:
+        if context and context.get_remaining_time_in_millis() < REAPER_TIME_RESERVE_MS:
+            break
+        kwargs = {
+            'IndexName': EXPIRY_INDEX,
+            'KeyConditionExpression': Key('expiryPartition').eq(EXPIRY_PARTITION) & Key('expiresAt').lte(now),
+            'Limit': min(REAPER_BATCH_SIZE, REAPER_MAX_BUCKETS - summary['examined'])
+        }
+        if cursor:
+            kwargs['ExclusiveStartKey'] = cursor
+        response = table.query(**kwargs)
+        due = response.get('Items', [])
+
+        if due:
+            with ThreadPoolExecutor(max_workers=max(1, min(REAPER_MAX_WORKERS, len(due)))) as executor:
+                outcomes = list(executor.map(lambda item: reap_resource(item, now), due))
+            summary['examined'] += len(due)
+            for outcome in outcomes:
+                summary[outcome] += 1
+            bump_resources_version(*dict.fromkeys(
+                item['username'] for item, outcome in zip(due, outcomes) if outcome == 'deleted'
+            ))
+
+        cursor = response.get('LastEvaluatedKey')
+        if cursor != kwargs.get('ExclusiveStartKey'):
+            save_reaper_cursor(cursor)
+        if not cursor:
+            break
+
+    log.annotate(**summary)
+    log.info('Reaper: %s deleted, %s skipped, %s failed', summary['deleted'], summary['skipped'], summary['failed'])
+    return dict(summary, complete=cursor is None)
+
+
+def reap_resource(item, now):
+    """
+    Claim one expired resource with a conditional update, tear its bucket down
+    and mark the row deleted. A claim fails when the expiry was moved, the row
+    was already reaped or another run is still working on it.
+    Returns 'deleted', 'skipped' or 'failed'.
+    """
+    key = {'username': item['username'], 'createdAt': item['createdAt']}
+    bucket_name = item.get('bucketName', '')
+    prefix = item.get('prefix')
+    if not bucket_name.startswith(f"{ENVIRONMENT_NAME}-spa-"):
+        log.warning('Not reaping %s: not an %s-spa-* bucket', bucket_name, ENVIRONMENT_NAME)
+        return 'skipped'
+    # Only ever the user's own prefix of the shared bucket, never the bucket
+    if (prefix is not None or bucket_name == SHARED_SPA_BUCKET) and not tenancy.is_user_prefix(prefix):
+        log.warning('Not reaping %s/%s: not a user prefix', bucket_name, prefix)
+        return 'skipped'
+
+    started = datetime.utcnow().isoformat()
+    stale = (datetime.utcnow() - timedelta(seconds=REAPER_CLAIM_TIMEOUT_SECONDS)).isoformat()
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET #status = :deleting, reapStartedAt = :started',
+            ConditionExpression='attribute_exists(expiryPartition) AND expiresAt <= :now AND '
+                                '(#status <> :deleting OR attribute_not_exists(reapStartedAt) OR reapStartedAt < :stale)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':deleting': 'deleting', ':started': started, ':now': now, ':stale': stale}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return 'skipped'
+        log.error('Error claiming %s for teardown: %s', bucket_name, e)
+        return 'failed'
+
+    try:
+        cleanup_engine.teardown_bucket(s3, table, manifest_table, bucket_name, [], prefix=prefix or '')
+        table.update_item(
+            Key=key,
+            UpdateExpression='SET #status = :deleted, deletedAt = :deleted_at REMOVE expiryPartition, reapStartedAt',
+            ConditionExpression='reapStartedAt = :started',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':deleted': 'deleted', ':deleted_at': datetime.utcnow().isoformat(),
+                                       ':started': started}
+        )
+    except Exception as e:
+        log.error('Error reaping expired SPA %s: %s', bucket_name, e)
+        release_reap_claim(key, started)
+        return 'failed'
+
+    log.info('Reaped expired SPA %s%s for user: %s', bucket_name, f'/{prefix}' if prefix else '', item['username'])
+    return 'deleted'
+
+
+def release_reap_claim(key, started):
+    """Let the next run retry a failed teardown straight away instead of waiting for the claim to go stale"""
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression='REMOVE reapStartedAt',
+            ConditionExpression='reapStartedAt = :started',
+            ExpressionAttributeValues={':started': started}
+        )
+    except Exception as e:
+        log.warning('Error releasing teardown claim on %s: %s', key['username'], e)
+
+
+def load_reaper_cursor():
+    item = table.get_item(Key=REAPER_CURSOR_KEY, ConsistentRead=True).get('Item') or {}
+    return item.get('lastKey')
+
+
+def save_reaper_cursor(cursor):
+    """Persist where the next run starts in the expiry index; None starts it from the oldest expiry"""
+    if cursor:
+        table.put_item(Item=dict(REAPER_CURSOR_KEY, lastKey=cursor, updatedAt=datetime.utcnow().isoformat()))
+    else:
+        table.delete_item(Key=REAPER_CURSOR_KEY)
+
+
+def serialize_item(item):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    return {key: serializer.serialize(value) for key, value in item.items()}
+
+
+def mark_resource_active(item):
+    try:
+        table.update_item(
+            Key={'username': item['username'], 'createdAt': item['createdAt']},
+            UpdateExpression='SET #status = :active',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':active': 'active'}
+        )
+    except Exception as e:
+        log.error('Error marking resource active in DynamoDB: %s', e)
+    bump_resources_version(item['username'])
+
+
+def mark_resource_failed(item):
+    try:
+        table.update_item(
+            Key={'username': item['username'], 'createdAt': item['createdAt']},
+            UpdateExpression='SET #status = :failed',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':failed': 'failed'}
+        )
+    except Exception as e:
+        log.warning('Error marking resource failed in DynamoDB: %s', e)
+    bump_resources_version(item['username'])
 
 
 def sanitize_username(username):
-    import re
     sanitized = re.sub(r'[^a-z0-9-]', '-', username.lower())
     sanitized = re.sub(r'-+', '-', sanitized)
     sanitized = sanitized.strip('-')
     return sanitized[:30]
 
 
+def build_provisioning_steps(bucket_name, username, sanitized_username):
+    """Full dependency graph for a fresh user bucket"""
+    retries = PROVISIONING_STEP_RETRIES
+    return build_bucket_steps(bucket_name, owner=sanitized_username) + [
+        Step('shared_assets', publish_shared_assets, retries=retries),
+        Step('upload_index', lambda: upload_index_html(bucket_name, username),
+             [upload_dependency(), 'shared_assets'], retries)
+    ]
+
+
+def build_bucket_steps(bucket_name, owner=None):
+    """
+    Bucket setup shared by fresh and pooled buckets. Everything hangs off bucket
+    creation except the bucket policy, which S3 rejects until the public access
+    block is lifted, and the uploads, which wait for object notifications so the
+    manifest indexer sees them.
+    """
+    retries = PROVISIONING_STEP_RETRIES
+    steps = [
+        Step('create_bucket', lambda: create_s3_bucket(bucket_name), retries=retries),
+        Step('tag_bucket', lambda: tag_bucket(bucket_name, owner), ['create_bucket'], retries),
+        Step('website', lambda: configure_static_website(bucket_name), ['create_bucket'], retries),
+        Step('public_access', lambda: configure_public_access(bucket_name), ['create_bucket'], retries),
+        Step('cors', lambda: configure_cors(bucket_name), ['create_bucket'], retries),
+        Step('lifecycle', lambda: configure_lifecycle(bucket_name), ['create_bucket'], retries),
+        Step('bucket_policy', lambda: set_bucket_policy(bucket_name), ['public_access'], retries),
+        Step('upload_error', lambda: upload_error_html(bucket_name), [upload_dependency()], retries)
+    ]
+    if MANIFEST_INDEXER_ARN:
+        steps.append(Step('notifications', lambda: configure_notifications(bucket_name), ['create_bucket'], retries))
+    return steps
+
+
+def upload_dependency():
+    return 'notifications' if MANIFEST_INDEXER_ARN else 'create_bucket'
+
+
 def create_s3_bucket(bucket_name):
     try:
         if AWS_REGION == 'us-east-1':
@@ -78,22 +1143,33 @@ def create_s3_bucket(bucket_name):
                 CreateBucketConfiguration={'LocationConstraint': AWS_REGION}
             )
         
+        log.debug('S3 bucket created: %s', bucket_name)
+        return f"s3://{bucket_name}"
+        
+    except ClientError as e:
+        log.error('Error creating S3 bucket: %s', e)
+        raise
+
+
+def tag_bucket(bucket_name, owner=None):
+    """Tag a user's bucket, or an unclaimed pool bucket when owner is None"""
+    tags = [
+        {'Key': 'Environment', 'Value': ENVIRONMENT_NAME},
+        {'Key': 'Purpose', 'Value': 'User SPA' if owner else 'User SPA Pool'},
+        {'Key': 'ManagedBy', 'Value': 'ServiceNow-AWS-Integration'}
+    ]
+    if owner:
+        tags.append({'Key': 'Owner', 'Value': owner})
+    
+    try:
         s3.put_bucket_tagging(
             Bucket=bucket_name,
-            Tagging={
-                'TagSet': [
-                    {'Key': 'Environment', 'Value': ENVIRONMENT_NAME},
-                    {'Key': 'Purpose', 'Value': 'User SPA'},
-                    {'Key': 'ManagedBy', 'Value': 'ServiceNow-AWS-Integration'}
-                ]
-            }
+            Tagging={'TagSet': tags}
         )
-        
-        print(f"S3 bucket created: {bucket_name}")
-        return f"s3://{bucket_name}"
+        log.debug('Bucket tagged: %s', bucket_name)
         
     except ClientError as e:
-        print(f"Error creating S3 bucket: {e}")
+        log.error('Error tagging S3 bucket: %s', e)
         raise
 
 
@@ -107,6 +1183,15 @@ def configure_static_website(bucket_name):
             }
         )
         
+        log.debug('Static website hosting configured for: %s', bucket_name)
+        
+    except ClientError as e:
+        log.error('Error configuring static website: %s', e)
+        raise
+
+
+def configure_public_access(bucket_name):
+    try:
         s3.put_public_access_block(
             Bucket=bucket_name,
             PublicAccessBlockConfiguration={
@@ -117,10 +1202,57 @@ def configure_static_website(bucket_name):
             }
         )
         
-        print(f"Static website hosting configured for: {bucket_name}")
+        log.debug('Public access block lifted for: %s', bucket_name)
         
     except ClientError as e:
-        print(f"Error configuring static website: {e}")
+        log.error('Error configuring public access block: %s', e)
+        raise
+
+
+def configure_lifecycle(bucket_name):
+    """Discard the parts of multipart uploads that were never completed or aborted"""
+    try:
+        s3.put_bucket_lifecycle_configuration(
+            Bucket=bucket_name,
+            LifecycleConfiguration={
+                'Rules': [
+                    {
+                        'ID': 'abort-incomplete-multipart-uploads',
+                        'Filter': {'Prefix': ''},
+                        'Status': 'Enabled',
+                        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1}
+                    }
+                ]
+            }
+        )
+        
+        log.debug('Lifecycle rules configured for: %s', bucket_name)
+        
+    except ClientError as e:
+        log.error('Error configuring lifecycle rules: %s', e)
+        raise
+
+
+def configure_notifications(bucket_name):
+    """Send object created/removed events to the manifest indexer"""
+    try:
+        s3.put_bucket_notification_configuration(
+            Bucket=bucket_name,
+            NotificationConfiguration={
+                'LambdaFunctionConfigurations': [
+                    {
+                        'Id': 'object-manifest',
+                        'LambdaFunctionArn': MANIFEST_INDEXER_ARN,
+                        'Events': ['s3:ObjectCreated:*', 's3:ObjectRemoved:*']
+                    }
+                ]
+            }
+        )
+        
+        log.debug('Object notifications configured for: %s', bucket_name)
+        
+    except ClientError as e:
+        log.error('Error configuring object notifications: %s', e)
         raise
 
 
@@ -144,10 +1276,10 @@ def configure_cors(bucket_name):
             CORSConfiguration=cors_configuration
         )
         
-        print(f"CORS configured for: {bucket_name}")
+        log.debug('CORS configured for: %s', bucket_name)
         
     except ClientError as e:
-        print(f"Error configuring CORS: {e}")
+        log.error('Error configuring CORS: %s', e)
         raise
 
 
@@ -170,419 +1302,181 @@ def set_bucket_policy(bucket_name):
             Bucket=bucket_name,
             Policy=json.dumps(policy)
         )
-        print(f"Bucket policy set for: {bucket_name}")
+        log.debug('Bucket policy set for: %s', bucket_name)
         
     except ClientError as e:
-        print(f"Error setting bucket policy: {e}")
+        log.error('Error setting bucket policy: %s', e)
         raise
 
 
-def upload_spa_files(bucket_name, username, sanitized_username):
-    html_content = generate_html(username, sanitized_username, bucket_name)
+def upload_index_html(bucket_name, username, prefix=''):
+    html_content = spa_templates.render_dashboard(
+        username, bucket_name, AWS_REGION, ENVIRONMENT_NAME, BACKEND_API_URL,
+        assets_base_url=SHARED_ASSETS_URL if SHARED_ASSETS_BUCKET else None, prefix=prefix
+    )
     
     try:
+        if GZIP_UPLOADS:
+            body, encoding = spa_templates.compress(html_content), {'ContentEncoding': 'gzip'}
+        else:
+            body, encoding = html_content.encode('utf-8'), {}
+        
         s3.put_object(
             Bucket=bucket_name,
-            Key='index.html',
-            Body=html_content,
+            Key=f'{prefix}index.html',
+            Body=body,
             ContentType='text/html',
-            CacheControl='no-cache'
+            CacheControl='no-cache',
+            **encoding
         )
         
-        error_html = generate_error_html()
+        log.debug('index.html uploaded to: %s/%s', bucket_name, prefix)
+        
+        return website_url_for(bucket_name, prefix)
+        
+    except ClientError as e:
+        log.error('Error uploading index.html: %s', e)
+        raise
+
+
+def upload_error_html(bucket_name):
+    try:
+        if GZIP_UPLOADS:
+            body, encoding = spa_templates.ERROR_PAGE_GZIP, {'ContentEncoding': 'gzip'}
+        else:
+            body, encoding = spa_templates.ERROR_PAGE_BYTES, {}
+        
         s3.put_object(
             Bucket=bucket_name,
             Key='error.html',
-            Body=error_html,
-            ContentType='text/html'
+            Body=body,
+            ContentType='text/html',
+            **encoding
         )
         
-        print(f"SPA files uploaded to: {bucket_name}")
-        
-        website_url = f"http://{bucket_name}.s3-website-{AWS_REGION}.amazonaws.com"
-        return website_url
+        log.debug('error.html uploaded to: %s', bucket_name)
         
     except ClientError as e:
-        print(f"Error uploading SPA files: {e}")
+        log.error('Error uploading error.html: %s', e)
         raise
 
 
-def generate_html(username, sanitized_username, bucket_name):
-    """Generate enhanced HTML with full interactive features"""
-    
-    html = f'''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{username}'s AWS Dashboard</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-            color: #333;
-        }}
-        .container {{ max-width: 1200px; margin: 0 auto; }}
-        .header {{
-            background: white;
-            border-radius: 12px;
-            padding: 30px;
-            margin-bottom: 20px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }}
-        .header h1 {{ color: #667eea; margin-bottom: 10px; }}
-        .header .subtitle {{ color: #666; font-size: 14px; }}
-        .info-card, .action-section {{
-            background: white;
-            border-radius: 12px;
-            padding: 25px;
-            margin-bottom: 20px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }}
-        .info-card h2, .action-section h2 {{ color: #667eea; margin-bottom: 15px; font-size: 20px; }}
-        .info-item {{
-            display: flex;
-            justify-content: space-between;
-            padding: 10px 0;
-            border-bottom: 1px solid #eee;
-        }}
-        .info-item:last-child {{ border-bottom: none; }}
-        .info-label {{ font-weight: 600; color: #555; }}
-        .info-value {{
-            color: #888;
-            font-family: 'Courier New', monospace;
-            font-size: 14px;
-            word-break: break-all;
-        }}
-        .button {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 14px;
-            font-weight: 600;
-            transition: transform 0.2s, box-shadow 0.2s;
-            margin-right: 10px;
-            margin-bottom: 10px;
-        }}
-        .button:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 6px 12px rgba(102, 126, 234, 0.4);
-        }}
-        .button:disabled {{
-            opacity: 0.6;
-            cursor: not-allowed;
-            transform: none;
-        }}
-        #fileList {{
-            margin-top: 20px;
-            background: #f8f9fa;
-            border-radius: 8px;
-            padding: 15px;
-            min-height: 100px;
-        }}
-        .file-item {{
-            padding: 12px;
-            background: white;
-            margin-bottom: 8px;
-            border-radius: 6px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            border-left: 3px solid #667eea;
-        }}
-        .file-info {{ flex: 1; }}
-        .file-name {{ font-weight: 600; color: #333; }}
-        .file-meta {{
-            font-size: 12px;
-            color: #888;
-            margin-top: 4px;
-        }}
-        .status {{
-            display: inline-block;
-            padding: 8px 16px;
-            border-radius: 20px;
-            font-size: 12px;
-            font-weight: 600;
-            margin-top: 15px;
-        }}
-        .status.success {{ background: #d4edda; color: #155724; }}
-        .status.error {{ background: #f8d7da; color: #721c24; }}
-        .status.loading {{ background: #d1ecf1; color: #0c5460; }}
-        .upload-area {{
-            border: 2px dashed #ccc;
-            border-radius: 8px;
-            padding: 40px;
-            text-align: center;
-            background: #f8f9fa;
-            cursor: pointer;
-            transition: all 0.3s;
-            margin-bottom: 15px;
-        }}
-        .upload-area:hover {{
-            border-color: #667eea;
-            background: #f0f4ff;
-        }}
-        .upload-area.dragover {{
-            border-color: #667eea;
-            background: #e8f0ff;
-            transform: scale(1.02);
-        }}
-        .upload-icon {{ font-size: 48px; margin-bottom: 10px; }}
-        #fileInput {{ display: none; }}
-        .empty-state {{
-            text-align: center;
-            padding: 40px;
-            color: #888;
-        }}
-        .footer {{
-            text-align: center;
-            color: white;
-            margin-top: 40px;
-            font-size: 14px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>👋 Welcome, {username}!</h1>
-            <p class="subtitle">Your Personal AWS Resource Dashboard</p>
-        </div>
-        
-        <div class="info-card">
-            <h2>📊 Resource Information</h2>
-            <div class="info-item">
-                <span class="info-label">Username:</span>
-                <span class="info-value">{username}</span>
-            </div>
-            <div class="info-item">
-                <span class="info-label">S3 Bucket:</span>
-                <span class="info-value">{bucket_name}</span>
-            </div>
-            <div class="info-item">
-                <span class="info-label">Region:</span>
-                <span class="info-value">{AWS_REGION}</span>
-            </div>
-            <div class="info-item">
-                <span class="info-label">Environment:</span>
-                <span class="info-value">{ENVIRONMENT_NAME}</span>
-            </div>
-        </div>
-        
-        <div class="action-section">
-            <h2>📁 Bucket Contents</h2>
-            <button class="button" onclick="loadBucketContents()">🔄 Refresh File List</button>
-            <div id="fileList">
-                <div class="empty-state">Click "Refresh File List" to load files...</div>
-            </div>
-        </div>
-        
-        <div class="action-section">
-            <h2>⬆️ Upload File</h2>
-            <div class="upload-area" id="uploadArea" onclick="document.getElementById('fileInput').click()">
-                <div class="upload-icon">📤</div>
-                <p style="font-size: 18px; margin-bottom: 10px; font-weight: 600;">Drop a file here or click to upload</p>
-                <p style="color: #888; font-size: 14px;">Upload files to your S3 bucket (max 10MB)</p>
-            </div>
-            <input type="file" id="fileInput" onchange="uploadFile(this.files[0])">
-            <div id="uploadStatus"></div>
-        </div>
-        
-        <div class="footer">
-            <p>🚀 Powered by ServiceNow-AWS Integration</p>
-            <p style="margin-top: 10px; opacity: 0.8;">Created via API Gateway & Lambda</p>
-        </div>
-    </div>
-    
-    <script>
-        const bucketName = '{bucket_name}';
-        const backendAPI = '{BACKEND_API_URL}';
-        
-        async function loadBucketContents() {{
-            const fileList = document.getElementById('fileList');
-            fileList.innerHTML = '<div class="status loading">⏳ Loading files...</div>';
-            
-            try {{
-                const response = await fetch(`${{backendAPI}}/bucket-contents?bucket=${{bucketName}}`);
-                const data = await response.json();
-                
-                if (data.files && data.files.length > 0) {{
-                    fileList.innerHTML = data.files.map(file => `
-                        <div class="file-item">
-                            <div class="file-info">
-                                <div class="file-name">📄 ${{file.name}}</div>
-                                <div class="file-meta">${{formatBytes(file.size)}} • ${{formatDate(file.lastModified)}}</div>
-                            </div>
-                        </div>
-                    `).join('');
-                }} else {{
-                    fileList.innerHTML = '<div class="empty-state">No files yet. Upload your first file below!</div>';
-                }}
-            }} catch (error) {{
-                console.error('Error loading files:', error);
-                fileList.innerHTML = '<div class="status error">❌ Error loading files</div>';
-            }}
-        }}
+def publish_shared_assets():
+    """
+    Make sure the content-addressed dashboard CSS/JS exist in the shared assets
+    bucket. Keys change whenever the content does, so each container checks once.
+    """
+    global shared_assets_published
+    if not SHARED_ASSETS_BUCKET or shared_assets_published:
+        return
+    
+    with shared_assets_lock:
+        if shared_assets_published:
+            return
         
-        async function uploadFile(file) {{
-            if (!file) return;
-            
-            const uploadStatus = document.getElementById('uploadStatus');
-            uploadStatus.innerHTML = '<div class="status loading">⏳ Uploading ' + file.name + '...</div>';
+        for asset in spa_templates.SHARED_ASSETS:
+            try:
+                s3.head_object(Bucket=SHARED_ASSETS_BUCKET, Key=asset.key)
+                continue
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                    log.warning('Error checking shared asset %s: %s', asset.key, e)
+                    raise
             
-            try {{
-                console.log('Getting presigned POST...');
-                const postResponse = await fetch(`${{backendAPI}}/upload-url`, {{
-                    method: 'POST',
-                    headers: {{'Content-Type': 'application/json'}},
-                    body: JSON.stringify({{
-                        bucket: bucketName,
-                        filename: file.name,
-                        contentType: file.type || 'application/octet-stream'
-                    }})
-                }});
-                
-                if (!postResponse.ok) {{
-                    throw new Error('Failed to get upload URL');
-                }}
-                
-                const postData = await postResponse.json();
-                console.log('Got presigned POST, uploading to S3...');
-                
-                const formData = new FormData();
-                Object.keys(postData.fields).forEach(key => {{
-                    formData.append(key, postData.fields[key]);
-                }});
-                formData.append('file', file);
-                
-                const uploadResponse = await fetch(postData.uploadUrl, {{
-                    method: 'POST',
-                    body: formData
-                }});
-                
-                if (uploadResponse.ok || uploadResponse.status === 204) {{
-                    console.log('Upload successful!');
-                    uploadStatus.innerHTML = '<div class="status success">✅ File uploaded successfully!</div>';
-                    setTimeout(() => {{
-                        loadBucketContents();
-                        uploadStatus.innerHTML = '';
-                    }}, 1500);
-                }} else {{
-                    throw new Error('Upload failed: ' + uploadResponse.statusText);
-                }}
-                
-            }} catch (error) {{
-                console.error('Upload error:', error);
-                uploadStatus.innerHTML = `<div class="status error">❌ ${{error.message}}</div>`;
-            }}
-        }}
-        
-        const uploadArea = document.getElementById('uploadArea');
-        
-        uploadArea.addEventListener('dragover', (e) => {{
-            e.preventDefault();
-            uploadArea.classList.add('dragover');
-        }});
-        
-        uploadArea.addEventListener('dragleave', () => {{
-            uploadArea.classList.remove('dragover');
-        }});
-        
-        uploadArea.addEventListener('drop', (e) => {{
-            e.preventDefault();
-            uploadArea.classList.remove('dragover');
-            const file = e.dataTransfer.files[0];
-            if (file) uploadFile(file);
-        }});
-        
-        function formatBytes(bytes) {{
-            if (bytes === 0) return '0 Bytes';
-            const k = 1024;
-            const sizes = ['Bytes', 'KB', 'MB', 'GB'];
-            const i = Math.floor(Math.log(bytes) / Math.log(k));
-            return Math.round(bytes / Math.pow(k, i) * 100) / 100 + ' ' + sizes[i];
-        }}
-        
-        function formatDate(dateString) {{
-            const date = new Date(dateString);
-            return date.toLocaleDateString() + ' ' + date.toLocaleTimeString();
-        }}
+            s3.put_object(
+                Bucket=SHARED_ASSETS_BUCKET,
+                Key=asset.key,
+                Body=asset.gzip_body,
+                ContentType=asset.content_type,
+                ContentEncoding='gzip',
+                CacheControl='public, max-age=31536000, immutable'
+            )
+            log.info('Shared asset uploaded: %s', asset.key)
         
-        window.addEventListener('load', () => {{
-            console.log('Dashboard loaded for bucket:', bucketName);
-            loadBucketContents();
-        }});
-    </script>
-</body>
-</html>'''
-    
-    return html
-
-
-def generate_error_html():
-    return '''<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <title>Error - Page Not Found</title>
-    <style>
-        body {
-            font-family: Arial, sans-serif;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            height: 100vh;
-            margin: 0;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            text-align: center;
-        }
-        h1 { font-size: 72px; margin: 0; }
-        p { font-size: 24px; margin: 20px 0; }
-        a { color: white; text-decoration: underline; }
-    </style>
-</head>
-<body>
-    <div>
-        <h1>404</h1>
-        <p>Page Not Found</p>
-        <a href="index.html">← Back to Dashboard</a>
-    </div>
-</body>
-</html>'''
-
-
-def track_resource(username, bucket_name, website_url):
-    try:
-        item = {
-            'username': username,
-            'createdAt': datetime.utcnow().isoformat(),
-            'bucketName': bucket_name,
-            'websiteUrl': website_url,
-            'region': AWS_REGION,
-            'environment': ENVIRONMENT_NAME,
-            'status': 'active'
-        }
-        table.put_item(Item=item)
-        print(f"Resource tracked in DynamoDB: {username}")
+        shared_assets_published = True
+
+
+def publish_shared_error_page():
+    """The shared bucket's website error document; each container checks once that it is there"""
+    global shared_error_page_published
+    if shared_error_page_published:
+        return
+    
+    with shared_assets_lock:
+        if shared_error_page_published:
+            return
+        try:
+            s3.head_object(Bucket=SHARED_SPA_BUCKET, Key='error.html')
+        except ClientError as e:
+            # A role without s3:ListBucket gets 403 for a missing key; the page is small, so publish it anyway
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound', '403', 'AccessDenied'):
+                log.warning('Error checking the shared error page: %s', e)
+                raise
+            upload_error_html(SHARED_SPA_BUCKET)
+        shared_error_page_published = True
+
+
+def website_url_for(bucket_name, prefix=''):
+    """Website endpoint of a bucket; S3 serves a prefix's index.html at /{prefix}"""
+    url = f"http://{bucket_name}.s3-website-{AWS_REGION}.amazonaws.com"
+    return f"{url}/{prefix}" if prefix else url
+
+
+def build_resource_item(username, bucket_name, website_url, expires_at=None, prefix=None, status='active'):
+    item = {
+        'username': username,
+        'createdAt': datetime.utcnow().isoformat(),
+        'bucketName': bucket_name,
+        'websiteUrl': website_url,
+        'region': AWS_REGION,
+        'environment': ENVIRONMENT_NAME,
+        'status': status
+    }
+    if prefix:
+        item['prefix'] = prefix
+    if expires_at:
+        item['expiresAt'] = expires_at
+        item['expiryPartition'] = EXPIRY_PARTITION
+    return item
+
+
+def track_resource(username, bucket_name, website_url, expires_at=None, prefix=None):
+    try:
+        table.put_item(Item=build_resource_item(username, bucket_name, website_url, expires_at, prefix))
+        log.debug('Resource tracked in DynamoDB: %s', username)
     except Exception as e:
-        print(f"Error tracking resource in DynamoDB: {e}")
+        log.error('Error tracking resource in DynamoDB: %s', e)
+    bump_resources_version(username)
+
 
+def resources_version_key(username):
+    return {'username': f"user#{username}", 'createdAt': 'resources-version'}
 
-def create_response(status_code, body):
+
+def bump_resources_version(*usernames):
+    """Invalidate the user-info function's cached results for these users"""
+    for username in usernames:
+        try:
+            table.update_item(
+                Key=resources_version_key(username),
+                UpdateExpression='ADD version :one',
+                ExpressionAttributeValues={':one': 1}
+            )
+        except Exception as e:
+            log.warning('Error bumping resources version for %s: %s', username, e)
+
+
+def create_response(status_code, body, extra_headers=None):
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': 'Content-Type,Idempotency-Key',
+        'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
+    }
+    if extra_headers:
+        headers.update(extra_headers)
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
+        'headers': headers,
         'body': json.dumps(body, default=str)
     }
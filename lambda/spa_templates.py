@@ -0,0 +1,617 @@
+import gzip
+import hashlib
+import html
+import json
+import re
+from functools import lru_cache
+
+# Dashboard shell. {{name_html}} fields are HTML-escaped, {{name_js}} fields
+# become JavaScript string literals (quotes included). The styles and script
+# markers are filled with DASHBOARD_CSS / DASHBOARD_JS, either inline or as
+# links to the shared content-addressed assets.
+DASHBOARD_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{{username_html}}'s AWS Dashboard</title>
+    <!-- dashboard-styles -->
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>👋 Welcome, {{username_html}}!</h1>
+            <p class="subtitle">Your Personal AWS Resource Dashboard</p>
+        </div>
+        
+        <div class="info-card">
+            <h2>📊 Resource Information</h2>
+            <div class="info-item">
+                <span class="info-label">Username:</span>
+                <span class="info-value">{{username_html}}</span>
+            </div>
+            <div class="info-item">
+                <span class="info-label">S3 Bucket:</span>
+                <span class="info-value">{{location_html}}</span>
+            </div>
+            <div class="info-item">
+                <span class="info-label">Region:</span>
+                <span class="info-value">{{region_html}}</span>
+            </div>
+            <div class="info-item">
+                <span class="info-label">Environment:</span>
+                <span class="info-value">{{environment_html}}</span>
+            </div>
+        </div>
+        
+        <div class="action-section">
+            <h2>📁 Bucket Contents</h2>
+            <button class="button" onclick="loadBucketContents()">🔄 Refresh File List</button>
+            <div id="fileList">
+                <div class="empty-state">Click "Refresh File List" to load files...</div>
+            </div>
+            <button class="button" id="loadMore" style="display: none; margin-top: 15px;" onclick="loadBucketContents(true)">⬇️ Load More</button>
+        </div>
+        
+        <div class="action-section">
+            <h2>⬆️ Upload Files</h2>
+            <div class="upload-area" id="uploadArea" onclick="document.getElementById('fileInput').click()">
+                <div class="upload-icon">📤</div>
+                <p style="font-size: 18px; margin-bottom: 10px; font-weight: 600;">Drop files here or click to upload</p>
+                <p style="color: #888; font-size: 14px;">Upload one or more files to your S3 bucket</p>
+            </div>
+            <input type="file" id="fileInput" multiple onchange="uploadFiles(this.files); this.value = ''">
+            <div id="uploadStatus"></div>
+        </div>
+        
+        <div class="footer">
+            <p>🚀 Powered by ServiceNow-AWS Integration</p>
+            <p style="margin-top: 10px; opacity: 0.8;">Created via API Gateway & Lambda</p>
+        </div>
+    </div>
+    
+    <script>
+        window.SPA_CONFIG = {bucketName: {{bucket_name_js}}, prefix: {{prefix_js}}, backendAPI: {{backend_api_js}}};
+    </script>
+    <!-- dashboard-script -->
+</body>
+</html>'''
+
+DASHBOARD_CSS = '''* { margin: 0; padding: 0; box-sizing: border-box; }
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+    padding: 20px;
+    color: #333;
+}
+.container { max-width: 1200px; margin: 0 auto; }
+.header {
+    background: white;
+    border-radius: 12px;
+    padding: 30px;
+    margin-bottom: 20px;
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+.header h1 { color: #667eea; margin-bottom: 10px; }
+.header .subtitle { color: #666; font-size: 14px; }
+.info-card, .action-section {
+    background: white;
+    border-radius: 12px;
+    padding: 25px;
+    margin-bottom: 20px;
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+.info-card h2, .action-section h2 { color: #667eea; margin-bottom: 15px; font-size: 20px; }
+.info-item {
+    display: flex;
+    justify-content: space-between;
+    padding: 10px 0;
+    border-bottom: 1px solid #eee;
+}
+.info-item:last-child { border-bottom: none; }
+.info-label { font-weight: 600; color: #555; }
+.info-value {
+    color: #888;
+    font-family: 'Courier New', monospace;
+    font-size: 14px;
+    word-break: break-all;
+}
+.button {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    border: none;
+    padding: 12px 24px;
+    border-radius: 8px;
+    cursor: pointer;
+    font-size: 14px;
+    font-weight: 600;
+    transition: transform 0.2s, box-shadow 0.2s;
+    margin-right: 10px;
+    margin-bottom: 10px;
+}
+.button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 12px rgba(102, 126, 234, 0.4);
+}
+.button:disabled {
+    opacity: 0.6;
+    cursor: not-allowed;
+    transform: none;
+}
+#fileList {
+    margin-top: 20px;
+    background: #f8f9fa;
+    border-radius: 8px;
+    padding: 15px;
+    min-height: 100px;
+}
+.file-item {
+    padding: 12px;
+    background: white;
+    margin-bottom: 8px;
+    border-radius: 6px;
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    border-left: 3px solid #667eea;
+}
+.file-info { flex: 1; }
+.file-name { font-weight: 600; color: #333; }
+.file-meta {
+    font-size: 12px;
+    color: #888;
+    margin-top: 4px;
+}
+.status {
+    display: inline-block;
+    padding: 8px 16px;
+    border-radius: 20px;
+    font-size: 12px;
+    font-weight: 600;
+    margin-top: 15px;
+}
+.status.success { background: #d4edda; color: #155724; }
+.status.error { background: #f8d7da; color: #721c24; }
+.status.loading { background: #d1ecf1; color: #0c5460; }
+.upload-area {
+    border: 2px dashed #ccc;
+    border-radius: 8px;
+    padding: 40px;
+    text-align: center;
+    background: #f8f9fa;
+    cursor: pointer;
+    transition: all 0.3s;
+    margin-bottom: 15px;
+}
+.upload-area:hover {
+    border-color: #667eea;
+    background: #f0f4ff;
+}
+.upload-area.dragover {
+    border-color: #667eea;
+    background: #e8f0ff;
+    transform: scale(1.02);
+}
+.upload-icon { font-size: 48px; margin-bottom: 10px; }
+#fileInput { display: none; }
+.empty-state {
+    text-align: center;
+    padding: 40px;
+    color: #888;
+}
+.footer {
+    text-align: center;
+    color: white;
+    margin-top: 40px;
+    font-size: 14px;
+}
+'''
+
+DASHBOARD_JS = '''const bucketName = window.SPA_CONFIG.bucketName;
+// Set when this SPA lives under its own prefix of the shared bucket
+const prefix = window.SPA_CONFIG.prefix || '';
+const backendAPI = window.SPA_CONFIG.backendAPI;
+// Every backend request names the bucket, and the prefix in the shared bucket
+const scope = prefix ? {bucket: bucketName, prefix} : {bucket: bucketName};
+
+const PAGE_SIZE = 50;
+let nextCursor = null;
+
+async function loadBucketContents(append = false) {
+    const fileList = document.getElementById('fileList');
+    const loadMore = document.getElementById('loadMore');
+    if (!append) {
+        nextCursor = null;
+        fileList.innerHTML = '<div class="status loading">⏳ Loading files...</div>';
+    }
+    loadMore.disabled = true;
+
+    try {
+        let url = `${backendAPI}/bucket-contents?bucket=${encodeURIComponent(bucketName)}&limit=${PAGE_SIZE}`;
+        if (prefix) {
+            url += `&prefix=${encodeURIComponent(prefix)}`;
+        }
+        if (append && nextCursor) {
+            url += `&cursor=${encodeURIComponent(nextCursor)}`;
+        }
+        const response = await fetch(url);
+        const data = await response.json();
+        const items = (data.files || []).map(renderFile).join('');
+
+        if (append) {
+            fileList.insertAdjacentHTML('beforeend', items);
+        } else if (items) {
+            fileList.innerHTML = items;
+        } else {
+            fileList.innerHTML = '<div class="empty-state">No files yet. Upload your first file below!</div>';
+        }
+
+        nextCursor = data.nextCursor || null;
+        loadMore.style.display = nextCursor ? 'inline-block' : 'none';
+    } catch (error) {
+        console.error('Error loading files:', error);
+        fileList.innerHTML = '<div class="status error">❌ Error loading files</div>';
+    } finally {
+        loadMore.disabled = false;
+    }
+}
+
+function renderFile(file) {
+    return `
+        <div class="file-item">
+            <div class="file-info">
+                <div class="file-name">📄 ${escapeHtml(file.name.slice(prefix.length))}</div>
+                <div class="file-meta">${formatBytes(file.size)} • ${formatDate(file.lastModified)}</div>
+            </div>
+        </div>
+    `;
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Files above the presigned POST limit go up as parallel multipart parts
+const SINGLE_UPLOAD_LIMIT = 10 * 1024 * 1024;
+const PART_SIZE = 8 * 1024 * 1024;
+const MAX_PARTS = 1000;
+const PART_CONCURRENCY = 4;
+const PART_ATTEMPTS = 3;
+// Files uploading at the same time
+const UPLOAD_CONCURRENCY = 4;
+
+async function uploadFiles(fileList) {
+    const files = Array.from(fileList || []);
+    if (!files.length) return;
+
+    const uploadStatus = document.getElementById('uploadStatus');
+    uploadStatus.innerHTML = files.map((file, index) =>
+        `<div class="status loading" id="upload-${index}">⏳ ${escapeHtml(file.name)}: waiting...</div>`
+    ).join('');
+    const setStatus = (index, state, text) => {
+        const row = document.getElementById(`upload-${index}`);
+        row.className = `status ${state}`;
+        row.innerHTML = `${state === 'success' ? '✅' : state === 'error' ? '❌' : '⏳'} ${escapeHtml(files[index].name)}: ${escapeHtml(text)}`;
+    };
+    const progressOf = (index) => (sent) => {
+        setStatus(index, 'loading', `${Math.min(100, Math.floor(sent * 100 / files[index].size))}%`);
+    };
+
+    // One request presigns every file small enough for a plain POST
+    const small = files.map((file, index) => index).filter(index => files[index].size <= SINGLE_UPLOAD_LIMIT);
+    let presigned = {};
+    if (small.length) {
+        try {
+            const batch = await postJSON('/upload-url', {
+                ...scope,
+                files: small.map(index => ({
+                    filename: files[index].name,
+                    contentType: files[index].type || 'application/octet-stream'
+                }))
+            });
+            small.forEach((index, position) => { presigned[index] = batch.results[position]; });
+        } catch (error) {
+            small.forEach(index => { presigned[index] = {success: false, error: error.message}; });
+        }
+    }
+
+    let succeeded = 0;
+    const tasks = files.map((file, index) => async () => {
+        try {
+            if (file.size > SINGLE_UPLOAD_LIMIT) {
+                await uploadMultipart(file, progressOf(index));
+            } else if (presigned[index].success) {
+                await postFile(presigned[index], file, progressOf(index));
+            } else {
+                throw new Error(presigned[index].error || 'Could not get an upload URL');
+            }
+            setStatus(index, 'success', 'uploaded');
+            succeeded++;
+        } catch (error) {
+            console.error('Upload error:', file.name, error);
+            setStatus(index, 'error', error.message);
+        }
+    });
+
+    await runWithLimit(tasks, UPLOAD_CONCURRENCY);
+    console.log(`Uploaded ${succeeded} of ${files.length} file(s)`);
+    if (succeeded) {
+        loadBucketContents();
+    }
+    if (succeeded === files.length) {
+        setTimeout(() => { uploadStatus.innerHTML = ''; }, 3000);
+    }
+}
+
+async function runWithLimit(tasks, limit) {
+    let next = 0;
+    const worker = async () => {
+        while (next < tasks.length) {
+            await tasks[next++]();
+        }
+    };
+    await Promise.all(Array.from({length: Math.min(limit, tasks.length)}, worker));
+}
+
+async function postJSON(path, payload) {
+    const response = await fetch(`${backendAPI}${path}`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(payload)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Request to ${path} failed`);
+    }
+    return data;
+}
+
+function postFile(upload, file, onProgress) {
+    // XMLHttpRequest rather than fetch: it reports upload progress
+    return new Promise((resolve, reject) => {
+        const formData = new FormData();
+        Object.keys(upload.fields).forEach(key => {
+            formData.append(key, upload.fields[key]);
+        });
+        formData.append('file', file);
+
+        const request = new XMLHttpRequest();
+        request.open('POST', upload.uploadUrl);
+        request.upload.onprogress = (event) => onProgress(event.loaded);
+        request.onload = () => {
+            if (request.status >= 200 && request.status < 300) {
+                resolve();
+            } else {
+                reject(new Error(`Upload failed: ${request.status}`));
+            }
+        };
+        request.onerror = () => reject(new Error('Upload failed: network error'));
+        request.send(formData);
+    });
+}
+
+async function uploadMultipart(file, onProgress) {
+    const upload = await postJSON('/multipart-upload', {
+        ...scope,
+        filename: file.name,
+        contentType: file.type || 'application/octet-stream',
+        fileSize: file.size,
+        partSize: Math.max(PART_SIZE, Math.ceil(file.size / MAX_PARTS))
+    });
+    const target = {...scope, key: upload.key, uploadId: upload.uploadId};
+    console.log(`Uploading ${upload.partCount} parts, ${PART_CONCURRENCY} at a time...`);
+
+    const etags = [];
+    let nextPart = 0;
+    let sent = 0;
+    let failed = false;
+
+    const worker = async () => {
+        while (!failed && nextPart < upload.parts.length) {
+            const part = upload.parts[nextPart++];
+            const start = (part.partNumber - 1) * upload.partSize;
+            try {
+                etags[part.partNumber - 1] = await uploadPart(part.url, file.slice(start, start + part.size));
+            } catch (error) {
+                failed = true;
+                throw error;
+            }
+            sent += part.size;
+            onProgress(sent);
+        }
+    };
+
+    try {
+        const workers = Math.min(PART_CONCURRENCY, upload.parts.length);
+        await Promise.all(Array.from({length: workers}, worker));
+        await postJSON('/multipart-upload/complete', {
+            ...target,
+            parts: etags.map((etag, index) => ({partNumber: index + 1, etag}))
+        });
+    } catch (error) {
+        // Don't leave orphaned parts behind
+        await postJSON('/multipart-upload/abort', target).catch(() => {});
+        throw error;
+    }
+}
+
+async function uploadPart(url, blob) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch(url, {method: 'PUT', body: blob});
+            if (!response.ok) {
+                throw new Error(`Part upload failed: ${response.status}`);
+            }
+            return response.headers.get('ETag');
+        } catch (error) {
+            if (attempt >= PART_ATTEMPTS) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (attempt - 1)));
+        }
+    }
+}
+
+const uploadArea = document.getElementById('uploadArea');
+
+uploadArea.addEventListener('dragover', (e) => {
+    e.preventDefault();
+    uploadArea.classList.add('dragover');
+});
+
+uploadArea.addEventListener('dragleave', () => {
+    uploadArea.classList.remove('dragover');
+});
+
+uploadArea.addEventListener('drop', (e) => {
+    e.preventDefault();
+    uploadArea.classList.remove('dragover');
+    uploadFiles(e.dataTransfer.files);
+});
+
+function formatBytes(bytes) {
+    if (bytes === 0) return '0 Bytes';
+    const k = 1024;
+    const sizes = ['Bytes', 'KB', 'MB', 'GB'];
+    const i = Math.floor(Math.log(bytes) / Math.log(k));
+    return Math.round(bytes / Math.pow(k, i) * 100) / 100 + ' ' + sizes[i];
+}
+
+function formatDate(dateString) {
+    const date = new Date(dateString);
+    return date.toLocaleDateString() + ' ' + date.toLocaleTimeString();
+}
+
+window.addEventListener('load', () => {
+    console.log('Dashboard loaded for bucket:', bucketName);
+    loadBucketContents();
+});
+'''
+
+ERROR_PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Error - Page Not Found</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            text-align: center;
+        }
+        h1 { font-size: 72px; margin: 0; }
+        p { font-size: 24px; margin: 20px 0; }
+        a { color: white; text-decoration: underline; }
+    </style>
+</head>
+<body>
+    <div>
+        <h1>404</h1>
+        <p>Page Not Found</p>
+        <a href="index.html">← Back to Dashboard</a>
+    </div>
+</body>
+</html>'''
+
+FIELD_PATTERN = re.compile(r'\{\{(\w+)_(html|js)\}\}')
+
+
+def compile_template(source):
+    """
+    Split a template into alternating literal chunks and (name, context) fields
+    so rendering is a single join with no parsing.
+    """
+    parts = FIELD_PATTERN.split(source)
+    literals = parts[0::3]
+    fields = list(zip(parts[1::3], parts[2::3]))
+    return literals, fields
+
+
+def escape_js(value):
+    # JSON string literals are valid JS; also keep '</script>' and friends inert
+    return (json.dumps('' if value is None else str(value))
+            .replace('<', '\\u003c')
+            .replace('>', '\\u003e')
+            .replace('&', '\\u0026'))
+
+
+def escape_html(value):
+    return html.escape('' if value is None else str(value), quote=True)
+
+
+ESCAPERS = {'html': escape_html, 'js': escape_js}
+
+
+def render(compiled, values):
+    literals, fields = compiled
+    out = [literals[0]]
+    for (name, context), literal in zip(fields, literals[1:]):
+        out.append(ESCAPERS[context](values[name]))
+        out.append(literal)
+    return ''.join(out)
+
+
+def compress(text):
+    """Gzip a rendered page; mtime is pinned so identical pages give identical bytes"""
+    return gzip.compress(text.encode('utf-8'), compresslevel=6, mtime=0)
+
+
+STYLES_MARKER = '<!-- dashboard-styles -->'
+SCRIPT_MARKER = '<!-- dashboard-script -->'
+
+
+class Asset:
+    """A static file published under a name derived from its content"""
+
+    def __init__(self, name, extension, content_type, text):
+        self.body = text.encode('utf-8')
+        self.content_type = content_type
+        self.digest = hashlib.sha256(self.body).hexdigest()[:16]
+        self.key = f"assets/{name}.{self.digest}.{extension}"
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+
+
+CSS_ASSET = Asset('dashboard', 'css', 'text/css', DASHBOARD_CSS)
+JS_ASSET = Asset('dashboard', 'js', 'application/javascript', DASHBOARD_JS)
+SHARED_ASSETS = (CSS_ASSET, JS_ASSET)
+
+INLINE_DASHBOARD = compile_template(
+    DASHBOARD_TEMPLATE
+    .replace(STYLES_MARKER, f"<style>\n{DASHBOARD_CSS}    </style>")
+    .replace(SCRIPT_MARKER, f"<script>\n{DASHBOARD_JS}    </script>")
+)
+
+ERROR_PAGE_BYTES = ERROR_PAGE.encode('utf-8')
+ERROR_PAGE_GZIP = gzip.compress(ERROR_PAGE_BYTES, compresslevel=9, mtime=0)
+
+
+@lru_cache(maxsize=4)
+def linked_dashboard(assets_base_url):
+    """Compiled shell referencing the shared assets under assets_base_url"""
+    base = escape_html(assets_base_url.rstrip('/'))
+    return compile_template(
+        DASHBOARD_TEMPLATE
+        .replace(STYLES_MARKER, f'<link rel="stylesheet" href="{base}/{CSS_ASSET.key}">')
+        .replace(SCRIPT_MARKER, f'<script src="{base}/{JS_ASSET.key}"></script>')
+    )
+
+
+def render_dashboard(username, bucket_name, region, environment, backend_api_url, assets_base_url=None, prefix=''):
+    """Render index.html; CSS/JS are inlined unless a shared assets URL is given"""
+    compiled = linked_dashboard(assets_base_url) if assets_base_url else INLINE_DASHBOARD
+    return render(compiled, {
+        'username': username,
+        'bucket_name': bucket_name,
+        'prefix': prefix,
+        'location': f'{bucket_name}/{prefix}' if prefix else bucket_name,
+        'region': region,
+        'environment': environment,
+        'backend_api': backend_api_url
+    })
@@ -0,0 +1,124 @@
+import functools
+import json
+import os
+import random
+import time
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+LOG_LEVEL = LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LEVELS['INFO'])
+# Fraction of requests whose (redacted) event is logged; 0 keeps payloads out of CloudWatch
+LOG_EVENT_SAMPLE_RATE = float(os.environ.get('LOG_EVENT_SAMPLE_RATE', '0'))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', '2048'))
+
+# Never logged: credentials and caller details API Gateway passes through
+REDACTED_EVENT_KEYS = ('headers', 'multiValueHeaders', 'cookies')
+
+# A container runs one invocation at a time, so the current request is module state
+current_request = {}
+# Called with the function name after each request's summary line, e.g. to flush metrics
+request_end_hooks = []
+
+
+def enabled(level):
+    return LEVELS[level] >= LOG_LEVEL
+
+
+def log(level, message, *args, **fields):
+    """
+    One JSON line. The message is %-formatted with args only when the level is
+    enabled, so disabled calls cost a comparison: log('DEBUG', 'Listed %s', bucket).
+    """
+    if LEVELS[level] < LOG_LEVEL:
+        return
+    record = {'level': level, 'message': message % args if args else message}
+    if current_request:
+        record['requestId'] = current_request.get('requestId')
+    record.update(fields)
+    print(json.dumps(record, default=str))
+
+
+def debug(message, *args, **fields):
+    log('DEBUG', message, *args, **fields)
+
+
+def info(message, *args, **fields):
+    log('INFO', message, *args, **fields)
+
+
+def warning(message, *args, **fields):
+    log('WARNING', message, *args, **fields)
+
+
+def error(message, *args, **fields):
+    log('ERROR', message, *args, **fields)
+
+
+def annotate(**fields):
+    """Add fields to the current request's summary line instead of logging a line of their own"""
+    if current_request:
+        current_request.setdefault('fields', {}).update(fields)
+
+
+def after_request(hook):
+    """Run hook(function_name) at the end of every request handled by request_handler"""
+    if hook not in request_end_hooks:
+        request_end_hooks.append(hook)
+
+
+def request_handler(function_name):
+    """
+    Wrap a lambda_handler: sample the incoming event, then write one summary line
+    per request with its id, route, status and duration.
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            # A router's handlers are wrapped too; only the outermost one reports
+            if current_request:
+                return handler(event, context)
+            started = time.perf_counter()
+            current_request['requestId'] = request_id(event, context)
+            if LOG_EVENT_SAMPLE_RATE and random.random() < LOG_EVENT_SAMPLE_RATE:
+                info('Sampled event', event=redact_event(event))
+            status = 'error'
+            try:
+                response = handler(event, context)
+                status = response.get('statusCode', 'ok') if isinstance(response, dict) else 'ok'
+                return response
+            finally:
+                duration_ms = round((time.perf_counter() - started) * 1000, 2)
+                info('Request complete', function=function_name, route=route_of(event), status=status,
+                     durationMs=duration_ms, **current_request.get('fields', {}))
+                for hook in request_end_hooks:
+                    try:
+                        hook(function_name)
+                    except Exception as e:
+                        warning('Request end hook failed: %s', e)
+                current_request.clear()
+        return wrapper
+    return decorate
+
+
+def request_id(event, context):
+    return getattr(context, 'aws_request_id', None) or (event.get('requestContext') or {}).get('requestId')
+
+
+def route_of(event):
+    if event.get('routeKey'):
+        return event['routeKey']
+    method = ((event.get('requestContext') or {}).get('http') or {}).get('method')
+    if method:
+        return f"{method} {event.get('rawPath', '')}".rstrip()
+    # Not from API Gateway: async job, schedule or S3 notification
+    return next(iter(event), None) if isinstance(event, dict) else None
+
+
+def redact_event(event):
+    redacted = {key: value for key, value in event.items() if key not in REDACTED_EVENT_KEYS}
+    request_context = redacted.get('requestContext')
+    if isinstance(request_context, dict) and 'authorizer' in request_context:
+        redacted['requestContext'] = {k: v for k, v in request_context.items() if k != 'authorizer'}
+    body = redacted.get('body')
+    if isinstance(body, str) and len(body) > LOG_PAYLOAD_MAX_CHARS:
+        redacted['body'] = body[:LOG_PAYLOAD_MAX_CHARS] + f'... ({len(body)} chars)'
+    return redacted
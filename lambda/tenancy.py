@@ -0,0 +1,75 @@
+import re
+import threading
+import time
+
+# Tenancy modes: a bucket per user, or a prefix per user in one shared, pre-configured website bucket
+BUCKET_MODE = 'bucket'
+PREFIX_MODE = 'prefix'
+MODES = (BUCKET_MODE, PREFIX_MODE)
+
+# users/{sanitized username}-{8 hex}/, mirroring the {environment}-spa-{user}-{id} bucket names
+USER_PREFIX_ROOT = 'users/'
+USER_PREFIX_PATTERN = re.compile(r'users/[a-z0-9-]{0,30}-[0-9a-f]{8}/')
+
+# A prefix found to have a tenant record is trusted for this long without asking DynamoDB again,
+# so a reaped or cleaned-up prefix stops being usable within a minute
+TENANT_CACHE_SECONDS = 60
+TENANT_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+# (bucket name, prefix) -> time.time() until which the prefix is known to be provisioned
+_known_tenants = {}
+
+
+def user_prefix(sanitized_username, unique_id):
+    return f'{USER_PREFIX_ROOT}{sanitized_username}-{unique_id}/'
+
+
+def is_user_prefix(prefix):
+    return bool(prefix) and USER_PREFIX_PATTERN.fullmatch(prefix) is not None
+
+
+def resolve_scope(bucket_name, prefix, environment, shared_bucket=None, table=None):
+    """
+    Key prefix a request naming bucket_name (and prefix) may touch: '' for a
+    user's own bucket, the user's prefix for the shared bucket, or None when
+    access is denied. The shared bucket as a whole is never in scope, so a
+    request must name one user's prefix (or a folder below it), and that
+    prefix must have a tenant record in table: one that merely looks like a
+    user prefix was never handed out and is refused.
+    """
+    if shared_bucket and bucket_name == shared_bucket:
+        match = USER_PREFIX_PATTERN.match(prefix or '')
+        if not match or table is None or not is_tenant(table, bucket_name, match.group(0)):
+            return None
+        return match.group(0)
+    if bucket_name.startswith(f'{environment}-spa-'):
+        return ''
+    return None
+
+
+def tenant_key(bucket_name, prefix):
+    """Record written when a prefix of the shared bucket is provisioned and deleted when it is torn down"""
+    return {'username': f'bucket#{bucket_name}/{prefix}', 'createdAt': 'tenant'}
+
+
+def is_tenant(table, bucket_name, prefix):
+    """Whether the prefix has a tenant record; a hit is remembered for TENANT_CACHE_SECONDS"""
+    now = time.time()
+    with _lock:
+        if _known_tenants.get((bucket_name, prefix), 0.0) > now:
+            return True
+    # Consistent, so a prefix can be used the moment its creation returns
+    if 'Item' not in table.get_item(Key=tenant_key(bucket_name, prefix), ConsistentRead=True):
+        return False
+    with _lock:
+        if len(_known_tenants) >= TENANT_CACHE_SIZE:
+            _known_tenants.clear()
+        _known_tenants[(bucket_name, prefix)] = now + TENANT_CACHE_SECONDS
+    return True
+
+
+def listing_version_key(bucket_name, prefix=''):
+    """Listing-version record of a bucket, or of one user's prefix so tenants of the shared bucket don't share it"""
+    scope = f'{bucket_name}/{prefix}' if prefix else bucket_name
+    return {'username': f'bucket#{scope}', 'createdAt': 'listing-version'}
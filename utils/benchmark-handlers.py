@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+# Offline benchmark for the Lambda handlers, run against the in-memory S3/DynamoDB
+# stand-ins in local_aws.py with an injected per-call latency.
+#
+#   python3 utils/benchmark-handlers.py
+#   python3 utils/benchmark-handlers.py --latency-ms 20 --iterations 50 --only list-bucket
+#   python3 utils/benchmark-handlers.py --save-baseline /tmp/before.json
+#   python3 utils/benchmark-handlers.py --compare /tmp/before.json --max-regression 10
+#   python3 utils/benchmark-handlers.py --log-level DEBUG --log-event-sample-rate 1
+#
+# For every scenario it reports p50/p95/p99 latency, AWS calls per request,
+# peak memory allocated per request (tracemalloc, measured in a separate pass),
+# the response body size, and the time spent in structured_log and the bytes it
+# wrote per request. Baselines are plain JSON tagged with the commit.
+# Timings include the stand-ins' own CPU time: compare them against a baseline
+# taken on the same machine, not against production.
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import boto3
+from botocore.config import Config
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(UTILS_DIR)
+LAMBDA_DIR = os.path.join(REPO_ROOT, 'lambda')
+sys.path.insert(0, UTILS_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+from local_aws import FakeDynamoDB, FakeS3, load_handler  # noqa: E402
+
+ENVIRONMENT = 'sandbox'
+REGION = 'us-east-1'
+RESOURCES_TABLE = f'{ENVIRONMENT}-spa-resources'
+MANIFEST_TABLE = f'{ENVIRONMENT}-spa-object-manifest'
+BUCKET = f'{ENVIRONMENT}-spa-john-doe-a1b2c3d4'
+SHARED_BUCKET = f'{ENVIRONMENT}-spa-shared-123456789012-a1b2c3d4'
+USERNAME = 'john.doe'
+# Presigning is local CPU work, not a request to AWS
+LOCAL_OPERATIONS = {'GeneratePresignedPost', 'GeneratePresignedUrl'}
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'calls_per_request', 'alloc_peak_kib', 'response_bytes', 'log_us', 'log_bytes')
+
+
+class Scenario:
+    """A handler plus the event to send it; setup runs untimed before every request"""
+
+    def __init__(self, name, handler, make_event, setup=None):
+        self.name = name
+        self.handler = handler
+        self.make_event = make_event
+        self.setup = setup
+
+
+class LogMeter:
+    """
+    Stands in for stdout and times every structured_log.log call, so each
+    request's logging cost is measured without writing anything.
+    """
+
+    def __init__(self, structured_log):
+        self.seconds = 0.0
+        self.bytes = 0
+        log = structured_log.log
+
+        def timed_log(*args, **fields):
+            start = time.perf_counter()
+            try:
+                log(*args, **fields)
+            finally:
+                self.seconds += time.perf_counter() - start
+
+        structured_log.log = timed_log
+
+    def write(self, text):
+        self.bytes += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        self.seconds = 0.0
+        self.bytes = 0
+
+
+def http_event(method, body=None, query=None, route=None, headers=None):
+    event = {'requestContext': {'http': {'method': method}}}
+    if headers is not None:
+        event['headers'] = headers
+    if body is not None:
+        event['body'] = json.dumps(body)
+    if query is not None:
+        event['queryStringParameters'] = query
+    if route:
+        event['routeKey'] = f'{method} {route}'
+    return event
+
+
+def build_environment(args):
+    """Stand-ins seeded with a bucket of args.objects objects and a user with a few resources"""
+    latency = args.latency_ms / 1000.0
+    # A real client with dummy credentials does the presigning, as in Lambda
+    signer = boto3.client(
+        's3', region_name=REGION, config=Config(signature_version='s3v4'),
+        aws_access_key_id='AKIABENCHMARK', aws_secret_access_key='benchmark'
+    )
+    s3 = FakeS3(latency=latency, region=REGION, signer=signer)
+    dynamodb = FakeDynamoDB(latency=latency)
+    resources = dynamodb.create_table(RESOURCES_TABLE, 'username', 'createdAt')
+    # Same key types as the stack's expiry-index, so a mistyped expiresAt fails here as it would in AWS
+    dynamodb.add_index(RESOURCES_TABLE, 'expiry-index', 'expiresAt')
+    manifest = dynamodb.create_table(MANIFEST_TABLE, 'bucket', 'key')
+
+    s3.create_bucket(Bucket=BUCKET)
+    s3.create_bucket(Bucket=SHARED_BUCKET)
+    for n in range(args.objects):
+        key = f'docs/file-{n:06d}.txt'
+        s3.add_object(BUCKET, key, b'x' * (n % 2048), 'text/plain')
+        obj = s3.buckets[BUCKET][key]
+        manifest.items[(BUCKET, key)] = {
+            'bucket': BUCKET, 'key': key, 'size': obj['Size'], 'etag': obj['ETag'].strip('"'),
+            'contentType': 'text/plain', 'lastModified': obj['LastModified'].isoformat()
+        }
+
+    for n in range(5):
+        created_at = f'2026-02-0{n + 1}T15:30:00.000000'
+        resources.items[(USERNAME, created_at)] = {
+            'username': USERNAME, 'createdAt': created_at, 'bucketName': f'{BUCKET}-{n}',
+            'websiteUrl': f'http://{BUCKET}-{n}.s3-website-{REGION}.amazonaws.com',
+            'region': REGION, 'environment': ENVIRONMENT, 'status': 'active'
+        }
+
+    # A user who has spent their admission tokens; full again only in a day, so nothing accrues during the run
+    resources.items[('rate#user#bench.flood', 'bucket')] = {
+        'username': 'rate#user#bench.flood', 'createdAt': 'bucket', 'tat': int(time.time()) + 86400
+    }
+
+    return s3, dynamodb, resources, manifest
+
+
+def load_handlers(s3, dynamodb, resources, manifest, args):
+    os.environ.update({
+        'LOG_LEVEL': args.log_level,
+        'LOG_EVENT_SAMPLE_RATE': str(args.log_event_sample_rate),
+        'AWS_REGION': REGION,
+        'AWS_DEFAULT_REGION': REGION,
+        'ENVIRONMENT_NAME': ENVIRONMENT,
+        'DYNAMODB_TABLE': RESOURCES_TABLE,
+        'MANIFEST_TABLE': MANIFEST_TABLE,
+        'BACKEND_API_URL': 'https://api.example.com/prod',
+        # Every benchmark request comes from one caller; only spa-creator/shed is meant to be refused
+        'ADMISSION_CALLER_RATE': '100000',
+        'ADMISSION_CALLER_BURST': '100000'
+    })
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        return {
+            'spa-creator': load_handler(os.path.join(LAMBDA_DIR, 'spa-creator-lambda.py'),
+                                        s3=s3, dynamodb=dynamodb, table=resources),
+            'spa-creator-shared': load_handler(os.path.join(LAMBDA_DIR, 'spa-creator-lambda.py'),
+                                               s3=s3, dynamodb=dynamodb, table=resources,
+                                               SPA_TENANCY_MODE='prefix', SHARED_SPA_BUCKET=SHARED_BUCKET),
+            'list-bucket': load_handler(os.path.join(LAMBDA_DIR, 'backend-list-bucket.py'),
+                                        s3=s3, dynamodb=dynamodb, table=resources, manifest=manifest),
+            'upload-url': load_handler(os.path.join(LAMBDA_DIR, 'backend-upload-url.py'),
+                                       s3=s3, dynamodb=dynamodb, table=resources),
+            'user-info': load_handler(os.path.join(LAMBDA_DIR, 'backend-user-info.py'),
+                                      dynamodb=dynamodb, table=resources),
+            'router': load_handler(os.path.join(LAMBDA_DIR, 'backend-router.py'),
+                                   s3=s3, dynamodb=dynamodb, table=resources, manifest=manifest)
+        }
+
+
+def build_scenarios(handlers, manifest):
+    creator = handlers['spa-creator']
+    lister = handlers['list-bucket']
+    uploader = handlers['upload-url']
+    user_info = handlers['user-info']
+    counter = iter(range(10 ** 9))
+
+    def uncached(source):
+        def setup():
+            lister.listing_cache.clear()
+            lister.manifest = manifest if source == 'manifest' else None
+        return setup
+
+    def cached():
+        lister.manifest = manifest
+
+    list_query = {'bucket': BUCKET, 'limit': '100'}
+    # What a dashboard does through the consolidated backend: load, upload, reload, user info
+    session_events = [
+        lambda: http_event('GET', query=list_query, route='/bucket-contents'),
+        lambda: http_event('POST', {'bucket': BUCKET, 'filename': 'notes.txt', 'contentType': 'text/plain'},
+                           route='/upload-url'),
+        lambda: http_event('GET', query=list_query, route='/bucket-contents'),
+        lambda: http_event('GET', query={'username': USERNAME}, route='/user-info')
+    ]
+    session_step = iter(range(10 ** 9))
+    return [
+        Scenario('spa-creator/create', creator.lambda_handler,
+                 lambda: http_event('POST', {'username': f'bench.user{next(counter)}'})),
+        # Prefix-per-user tenancy: an index.html in the shared bucket and the record
+        Scenario('spa-creator/create-shared', handlers['spa-creator-shared'].lambda_handler,
+                 lambda: http_event('POST', {'username': f'bench.user{next(counter)}'})),
+        # A ServiceNow retry of a create that already finished
+        Scenario('spa-creator/idempotent-retry', creator.lambda_handler,
+                 lambda: http_event('POST', {'username': 'bench.retry'}, headers={'Idempotency-Key': 'bench-retry'})),
+        # A client hammering the create endpoint for one user, answered with 429
+        Scenario('spa-creator/shed', creator.lambda_handler,
+                 lambda: http_event('POST', {'username': 'bench.flood'})),
+        Scenario('list-bucket/s3', lister.lambda_handler,
+                 lambda: http_event('GET', query=list_query), uncached('s3')),
+        Scenario('list-bucket/manifest', lister.lambda_handler,
+                 lambda: http_event('GET', query=list_query), uncached('manifest')),
+        Scenario('list-bucket/cached', lister.lambda_handler,
+                 lambda: http_event('GET', query=list_query), cached),
+        Scenario('upload-url/single', uploader.lambda_handler,
+                 lambda: http_event('POST', {'bucket': BUCKET, 'filename': 'report.pdf',
+                                             'contentType': 'application/pdf'}, route='/upload-url')),
+        Scenario('upload-url/batch-20', uploader.lambda_handler,
+                 lambda: http_event('POST', {'bucket': BUCKET, 'files': [
+                     {'filename': f'photo-{n}.png', 'contentType': 'image/png'} for n in range(20)
+                 ]}, route='/upload-url')),
+        Scenario('upload-url/multipart-100mb', uploader.lambda_handler,
+                 lambda: http_event('POST', {'bucket': BUCKET, 'filename': 'dataset.zip', 'fileSize': 100 * 1024 ** 2,
+                                             'partSize': 8 * 1024 ** 2}, route='/multipart-upload')),
+        Scenario('user-info/query', user_info.lambda_handler,
+                 lambda: http_event('GET', query={'username': USERNAME}), user_info.user_cache.clear),
+        Scenario('user-info/cached', user_info.lambda_handler,
+                 lambda: http_event('GET', query={'username': USERNAME})),
+        Scenario('user-info/projected', user_info.lambda_handler,
+                 lambda: http_event('GET', query={'username': USERNAME, 'fields': 'bucketName,websiteUrl,status',
+                                                  'status': 'active'})),
+        Scenario('router/dashboard-session', handlers['router'].lambda_handler,
+                 lambda: session_events[next(session_step) % len(session_events)]())
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(scenario, services, iterations, alloc_iterations, log_meter):
+    devnull = open(os.devnull, 'w')
+    timings, sizes, statuses = [], [], {}
+    for service in services:
+        service.reset_calls()
+    log_meter.reset()
+
+    for _ in range(iterations):
+        if scenario.setup:
+            scenario.setup()
+        event = scenario.make_event()
+        with contextlib.redirect_stdout(log_meter):
+            start = time.perf_counter()
+            response = scenario.handler(event, None)
+            timings.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(response.get('body') or ''))
+        statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+
+    calls = {}
+    for service in services:
+        for operation, count in service.calls.items():
+            if operation not in LOCAL_OPERATIONS:
+                calls[operation] = calls.get(operation, 0) + count
+
+    # tracemalloc slows everything down, so allocations get their own pass
+    peaks = []
+    tracemalloc.start()
+    for _ in range(alloc_iterations):
+        if scenario.setup:
+            scenario.setup()
+        event = scenario.make_event()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        with contextlib.redirect_stdout(devnull):
+            scenario.handler(event, None)
+        peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'calls_per_request': round(sum(calls.values()) / iterations, 2),
+        'calls': {operation: round(count / iterations, 2) for operation, count in sorted(calls.items())},
+        'alloc_peak_kib': round(statistics.median(peaks), 1) if peaks else None,
+        'response_bytes': round(statistics.fmean(sizes)),
+        'log_us': round(log_meter.seconds / iterations * 1e6, 1),
+        'log_bytes': round(log_meter.bytes / iterations)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':28s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'calls':>7s} {'alloc KiB':>10s} {'bytes':>8s} "
+          f"{'log us':>8s} {'log B':>7s}  statuses")
+    for name, r in results.items():
+        print(f"{name:28s} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['calls_per_request']:7.2f} "
+              f"{r['alloc_peak_kib'] or 0:10.1f} {r['response_bytes']:8d} {r['log_us']:8.1f} {r['log_bytes']:7d}  "
+              f"{r['statuses']}")
+
+
+def compare(results, baseline, max_regression):
+    """Print the change against a saved baseline; returns the scenarios whose p95 regressed too far"""
+    print()
+    print(f"Compared with {baseline.get('commit') or 'baseline'} ({baseline.get('latency_ms')} ms injected latency)")
+    regressed = []
+    for name, current in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            print(f"  {name:28s} (not in baseline)")
+            continue
+        changes = []
+        for metric in METRICS:
+            if before.get(metric) in (None, 0) or current.get(metric) is None:
+                continue
+            delta = (current[metric] - before[metric]) / before[metric] * 100
+            changes.append(f"{metric} {delta:+.1f}%")
+        print(f"  {name:28s} " + ', '.join(changes))
+        if before.get('p95_ms') and (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 > max_regression:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Lambda handlers against local S3/DynamoDB stand-ins')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--alloc-iterations', type=int, default=10, help='requests traced for allocations')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='injected latency per AWS call')
+    parser.add_argument('--objects', type=int, default=5000, help='objects in the benchmark bucket')
+    parser.add_argument('--log-level', default='INFO', help='LOG_LEVEL for the handlers')
+    parser.add_argument('--log-event-sample-rate', type=float, default=0.0,
+                        help='LOG_EVENT_SAMPLE_RATE for the handlers')
+    parser.add_argument('--only', help='run scenarios whose name starts with this')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as a baseline JSON file')
+    parser.add_argument('--compare', metavar='PATH', help='baseline JSON file to compare against')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='with --compare, exit 1 if any p95 regressed by more than this many percent')
+    args = parser.parse_args()
+
+    s3, dynamodb, resources, manifest = build_environment(args)
+    handlers = load_handlers(s3, dynamodb, resources, manifest, args)
+    log_meter = LogMeter(sys.modules['structured_log'])
+    scenarios = [s for s in build_scenarios(handlers, manifest) if not args.only or s.name.startswith(args.only)]
+
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(scenario, (s3, dynamodb), args.iterations, args.alloc_iterations,
+                                              log_meter)
+
+    print(f"{args.iterations} requests per scenario, {args.latency_ms} ms injected latency per AWS call, "
+          f"{args.objects} objects in the bucket, LOG_LEVEL {args.log_level}")
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'python': sys.version.split()[0],
+                'latency_ms': args.latency_ms,
+                'iterations': args.iterations,
+                'objects': args.objects,
+                'results': results
+            }, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(results, json.load(f), args.max_regression or float('inf'))
+        if args.max_regression is not None and regressed:
+            print(f"\np95 regressed by more than {args.max_regression}%: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
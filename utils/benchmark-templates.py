@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the SPA page renderer: render time and uploaded bytes per SPA.
+#
+#   python3 utils/benchmark-templates.py
+#   python3 utils/benchmark-templates.py --baseline-ref <commit before spa_templates.py>
+#
+# With --baseline-ref the f-string generate_html()/generate_error_html() from
+# that commit are measured as well ("before").
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambda'))
+
+import spa_templates  # noqa: E402
+
+USERNAME = 'john.doe'
+BUCKET = 'sandbox-spa-john-doe-a1b2c3d4'
+REGION = 'us-east-1'
+ENVIRONMENT = 'sandbox'
+BACKEND_API_URL = 'https://058g4uppkk.execute-api.us-east-1.amazonaws.com/prod'
+ASSETS_URL = 'https://sandbox-shared-assets.s3.us-east-1.amazonaws.com'
+
+
+def time_per_call(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def measure_current(iterations):
+    def render():
+        return spa_templates.render_dashboard(USERNAME, BUCKET, REGION, ENVIRONMENT, BACKEND_API_URL)
+
+    def render_and_compress():
+        return spa_templates.compress(render())
+
+    def render_linked():
+        return spa_templates.render_dashboard(USERNAME, BUCKET, REGION, ENVIRONMENT, BACKEND_API_URL, ASSETS_URL)
+
+    return {
+        'render_us': time_per_call(render, iterations),
+        'render_gzip_us': time_per_call(render_and_compress, iterations),
+        'index_bytes': len(render().encode('utf-8')),
+        'index_gzip_bytes': len(render_and_compress()),
+        'linked_render_us': time_per_call(render_linked, iterations),
+        'linked_gzip_bytes': len(spa_templates.compress(render_linked())),
+        'error_bytes': len(spa_templates.ERROR_PAGE_BYTES),
+        'error_gzip_bytes': len(spa_templates.ERROR_PAGE_GZIP)
+    }
+
+
+def load_baseline(ref):
+    source = subprocess.check_output(
+        ['git', 'show', f'{ref}:lambda/spa-creator-lambda.py'], cwd=REPO_ROOT, text=True
+    )
+    os.environ.setdefault('AWS_REGION', REGION)
+    os.environ.setdefault('AWS_DEFAULT_REGION', REGION)
+    os.environ.setdefault('DYNAMODB_TABLE', f'{ENVIRONMENT}-spa-resources')
+    os.environ.setdefault('BACKEND_API_URL', BACKEND_API_URL)
+    module = types.ModuleType('baseline_spa_creator')
+    exec(compile(source, f'{ref}:spa-creator-lambda.py', 'exec'), module.__dict__)
+    return module
+
+
+def measure_baseline(module, iterations):
+    def render():
+        return module.generate_html(USERNAME, 'john-doe', BUCKET)
+
+    return {
+        'render_us': time_per_call(render, iterations),
+        'error_render_us': time_per_call(module.generate_error_html, iterations),
+        'index_bytes': len(render().encode('utf-8')),
+        'error_bytes': len(module.generate_error_html().encode('utf-8'))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SPA page rendering and upload size')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--baseline-ref', help='git ref whose f-string renderer to compare against')
+    args = parser.parse_args()
+
+    current = measure_current(args.iterations)
+
+    if args.baseline_ref:
+        before = measure_baseline(load_baseline(args.baseline_ref), args.iterations)
+        print(f"Before ({args.baseline_ref})")
+        print(f"  render index.html:      {before['render_us']:8.1f} us")
+        print(f"  render error.html:      {before['error_render_us']:8.1f} us")
+        print(f"  uploaded bytes per SPA: {before['index_bytes'] + before['error_bytes']:8d}")
+        print()
+
+    print("After")
+    print(f"  render index.html:      {current['render_us']:8.1f} us")
+    print(f"  render + gzip:          {current['render_gzip_us']:8.1f} us")
+    print("  render error.html:      constant bytes")
+    print(f"  uploaded bytes per SPA: {current['index_gzip_bytes'] + current['error_gzip_bytes']:8d} "
+          f"(uncompressed {current['index_bytes'] + current['error_bytes']})")
+    print()
+    print("After, with shared assets")
+    print(f"  render index.html:      {current['linked_render_us']:8.1f} us")
+    print(f"  uploaded bytes per SPA: {current['linked_gzip_bytes'] + current['error_gzip_bytes']:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+# Tear down provisioned SPAs: every bucket recorded in the resources table is
+# emptied (all versions, DeleteObjects batches of 1000) and deleted, many at a
+# time, then its rows are removed with BatchWriteItem.
+#
+#   python3 utils/cleanup-resources.py --dry-run
+#   python3 utils/cleanup-resources.py --yes --workers 32
+#   python3 utils/cleanup-resources.py --status failed --yes
+#   python3 utils/cleanup-resources.py --local 200 --objects 50
+#   python3 utils/cleanup-resources.py --empty-bucket sandbox-shared-assets-... --yes
+#
+# Finished buckets are appended to a checkpoint file; rerunning after an
+# interruption skips them. The checkpoint is removed once a run finishes with
+# no failures. --local runs against the in-memory stand-ins in local_aws.py,
+# seeded with that many SPAs, instead of AWS. --empty-bucket only empties the
+# named buckets (the stack's own, before the stack is deleted) and keeps them.
+
+import argparse
+import os
+import sys
+import time
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(UTILS_DIR), 'lambda')
+sys.path.insert(0, UTILS_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+import cleanup_engine  # noqa: E402
+
+
+def local_services(args):
+    """Stand-ins holding args.local SPAs with args.objects objects each, plus a job record"""
+    from local_aws import FakeDynamoDB, FakeS3
+
+    latency = args.latency_ms / 1000.0
+    s3 = FakeS3(latency=latency)
+    dynamodb = FakeDynamoDB(latency=latency)
+    table = dynamodb.create_table(args.table, 'username', 'createdAt')
+    manifest = dynamodb.create_table(args.manifest_table, 'bucket', 'key')
+    for n in range(args.local):
+        bucket_name = f'{args.environment}-spa-user{n}-{n:08x}'
+        username = f'user{n}'
+        s3.create_bucket(Bucket=bucket_name)
+        for i in range(args.objects):
+            key = f'files/object-{i:05d}.txt'
+            s3.add_object(bucket_name, key, b'x')
+            manifest.items[(bucket_name, key)] = {'bucket': bucket_name, 'key': key}
+        table.items[(username, '2026-01-01T00:00:00')] = {
+            'username': username, 'createdAt': '2026-01-01T00:00:00', 'bucketName': bucket_name,
+            'websiteUrl': f'http://{bucket_name}.s3-website-us-east-1.amazonaws.com',
+            'environment': args.environment, 'status': 'active'
+        }
+        table.items[(f'user#{username}', 'resources-version')] = {
+            'username': f'user#{username}', 'createdAt': 'resources-version', 'version': 1
+        }
+    table.items[('job#local', '2026-01-01T00:00:00')] = {'username': 'job#local', 'createdAt': '2026-01-01T00:00:00'}
+    s3.reset_calls()
+    dynamodb.reset_calls()
+    return s3, table, manifest, (s3, dynamodb)
+
+
+def aws_services(args):
+    # The handlers' tuned clients: a pool big enough for --workers, paced DeleteBucket calls
+    os.environ.setdefault('AWS_MAX_POOL_CONNECTIONS', str(max(50, args.workers * 2)))
+    import aws_clients
+    manifest = aws_clients.get_table(args.manifest_table) if args.manifest_table else None
+    return aws_clients.get_client('s3'), aws_clients.get_table(args.table), manifest, ()
+
+
+def empty_buckets(s3, args):
+    """Empty args.empty_bucket, e.g. the stack-owned buckets CloudFormation cannot delete while they hold objects"""
+    if not args.dry_run and not args.yes:
+        print('Cleanup cancelled: pass --yes to empty buckets.')
+        sys.exit(1)
+    failed = False
+    for bucket_name in args.empty_bucket:
+        try:
+            versions = cleanup_engine.empty_bucket(s3, bucket_name, dry_run=args.dry_run)
+        except Exception as e:
+            print(f"   ❌ {bucket_name}: {e}")
+            failed = True
+            continue
+        print(f"{'Would delete' if args.dry_run else 'Deleted'} {versions} object versions from {bucket_name}")
+    if failed:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete provisioned SPA buckets and their records')
+    parser.add_argument('--environment', default='sandbox', help='only buckets named {environment}-spa-*')
+    parser.add_argument('--table', default=None, help='resources table (default {environment}-spa-resources)')
+    parser.add_argument('--manifest-table', default=None,
+                        help='object manifest table (default {environment}-spa-object-manifest)')
+    parser.add_argument('--status', help='only resources with this status; bookkeeping rows are kept')
+    parser.add_argument('--workers', type=int, default=16, help='buckets torn down at once')
+    parser.add_argument('--segments', type=int, default=8, help='Scan TotalSegments when finding buckets')
+    parser.add_argument('--checkpoint', help='progress file (default .cleanup-{table}.checkpoint)')
+    parser.add_argument('--empty-bucket', action='append', metavar='BUCKET',
+                        help='only delete every object version in this bucket (repeatable); records are kept')
+    parser.add_argument('--dry-run', action='store_true', help='count what would be deleted, delete nothing')
+    parser.add_argument('--yes', action='store_true', help='do not ask for confirmation')
+    parser.add_argument('--local', type=int, metavar='SPAS', help='run against stand-ins seeded with this many SPAs')
+    parser.add_argument('--objects', type=int, default=20, help='with --local, objects per bucket')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='with --local, injected latency per call')
+    args = parser.parse_args()
+    args.table = args.table or f'{args.environment}-spa-resources'
+    args.manifest_table = args.manifest_table or f'{args.environment}-spa-object-manifest'
+
+    s3, table, manifest, stand_ins = local_services(args) if args.local is not None else aws_services(args)
+    if args.empty_bucket:
+        empty_buckets(s3, args)
+        return
+    checkpoint_path = None if args.local is not None else (args.checkpoint or f'.cleanup-{args.table}.checkpoint')
+    checkpoint = cleanup_engine.Checkpoint(checkpoint_path)
+
+    started = time.perf_counter()
+    targets, skipped = cleanup_engine.find_targets(table, environment=args.environment, status=args.status,
+                                                   total_segments=args.segments)
+    for bucket_name in skipped:
+        print(f"   Skipping {bucket_name}: not an {args.environment}-spa-* bucket")
+    resuming = sum(1 for name in targets if name in checkpoint)
+    print(f"Found {len(targets)} buckets in {args.table}" + (f" ({resuming} already done)" if resuming else ''))
+
+    if not args.dry_run and not args.yes:
+        if not sys.stdin.isatty():
+            # CI, cron or a pipe: nobody can answer, so never delete without an explicit --yes
+            print('Cleanup cancelled: stdin is not a terminal; pass --yes to delete without confirmation.')
+            sys.exit(1)
+        try:
+            confirm = input(f"Delete {len(targets) - resuming} buckets and their records? (yes/no): ")
+        except EOFError:
+            confirm = ''
+        if confirm != 'yes':
+            print('Cleanup cancelled.')
+            return
+
+    done = [0]
+
+    def on_progress(bucket_name, versions, error):
+        done[0] += 1
+        if error:
+            print(f"   ❌ {bucket_name}: {error}")
+        elif done[0] % 100 == 0 or done[0] == len(targets) - resuming:
+            print(f"   {done[0]}/{len(targets) - resuming} buckets")
+
+    summary = cleanup_engine.teardown(s3, table, targets, manifest=manifest, max_workers=args.workers,
+                                      dry_run=args.dry_run, checkpoint=checkpoint, on_progress=on_progress)
+    # Jobs and version counters only go once nothing is left to describe
+    if not args.status and not summary['failed']:
+        summary['bookkeepingRows'] = cleanup_engine.purge_records(table, dry_run=args.dry_run)
+    if not summary['failed'] and not args.dry_run:
+        checkpoint.clear()
+
+    verb = 'Would delete' if args.dry_run else 'Deleted'
+    print(f"{verb} {summary['deleted']} buckets, {summary['objectVersions']} object versions, "
+          f"{summary['rows']} resource rows, {summary.get('bookkeepingRows', 0)} bookkeeping rows "
+          f"in {time.perf_counter() - started:.1f}s")
+    if stand_ins:
+        calls = {}
+        for service in stand_ins:
+            calls.update(service.calls)
+        print('AWS calls: ' + ', '.join(f'{op} {count}' for op, count in sorted(calls.items())))
+    if summary['failed']:
+        print(f"{len(summary['failed'])} buckets failed; rerun to retry them"
+              + (f" (progress kept in {checkpoint_path})" if checkpoint_path else ''))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,66 +2,80 @@
 
 # Cleanup Script for ServiceNow-AWS Integration Demo
 # WARNING: This will DELETE all sandbox-spa-* resources
+#
+# Buckets and records are removed by cleanup-resources.py (parallel, batched,
+# resumable); pass its options through, e.g. ./cleanup-resources.sh --dry-run
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+STACK_NAME="servicenow-spa-creator"
+
+DRY_RUN=false
+for arg in "$@"; do
+    if [ "$arg" == "--dry-run" ]; then
+        DRY_RUN=true
+    fi
+done
 
 echo "========================================"
 echo "ServiceNow-AWS Integration Cleanup"
 echo "========================================"
 echo ""
 
-read -p "Are you sure you want to delete ALL sandbox-spa resources? (yes/no): " confirm
+if [ "$DRY_RUN" != true ]; then
+    read -p "Are you sure you want to delete ALL sandbox-spa resources? (yes/no): " confirm
 
-if [ "$confirm" != "yes" ]; then
-    echo "Cleanup cancelled."
-    exit 0
+    if [ "$confirm" != "yes" ]; then
+        echo "Cleanup cancelled."
+        exit 0
+    fi
 fi
 
 echo ""
 echo "Starting cleanup..."
 echo ""
 
-# 1. List and delete all SPA buckets
-echo "1. Finding SPA buckets..."
-BUCKETS=$(aws s3 ls | grep sandbox-spa | awk '{print $3}')
-
-if [ -z "$BUCKETS" ]; then
-    echo "   No SPA buckets found"
-else
-    for bucket in $BUCKETS; do
-        echo "   Deleting bucket: $bucket"
-        # Delete all objects first
-        aws s3 rm s3://$bucket --recursive --quiet
-        # Delete bucket
-        aws s3 rb s3://$bucket --force
-    done
-    echo "   ✅ All SPA buckets deleted"
+# 1. Delete every SPA bucket recorded in DynamoDB, then the records themselves
+echo "1. Deleting SPA buckets and DynamoDB records..."
+if ! python3 "$SCRIPT_DIR/cleanup-resources.py" --yes "$@"; then
+    echo "   ❌ Some buckets could not be deleted; rerun to resume"
+    exit 1
 fi
 
-# 2. Clear DynamoDB table
-echo ""
-echo "2. Clearing DynamoDB table..."
-TABLE_NAME="sandbox-spa-resources"
-
-# Scan and delete all items
-aws dynamodb scan --table-name $TABLE_NAME --query 'Items[*].[username.S, createdAt.S]' --output text | \
-while read username createdAt; do
-    if [ -n "$username" ]; then
-        echo "   Deleting record: $username"
-        aws dynamodb delete-item \
-            --table-name $TABLE_NAME \
-            --key "{\"username\": {\"S\": \"$username\"}, \"createdAt\": {\"S\": \"$createdAt\"}}"
-    fi
-done
-echo "   ✅ DynamoDB table cleared"
+if [ "$DRY_RUN" == true ]; then
+    echo ""
+    echo "Dry run: nothing was deleted; the stack was left alone."
+    exit 0
+fi
+echo "   ✅ SPA buckets and records deleted"
 
-# 3. Optional: Delete CloudFormation stack
+# 2. Optional: Delete CloudFormation stack
 echo ""
 read -p "Delete the entire CloudFormation stack? (yes/no): " delete_stack
 
 if [ "$delete_stack" == "yes" ]; then
+    # CloudFormation cannot delete a bucket that still holds objects: empty the
+    # stack's own buckets (Lambda code, shared assets, shared SPAs, inventory exports) first
+    stack_buckets=$(aws cloudformation describe-stack-resources --stack-name "$STACK_NAME" \
+        --query "StackResources[?ResourceType=='AWS::S3::Bucket'].PhysicalResourceId" --output text)
+    if [ -n "$stack_buckets" ]; then
+        echo "   Emptying stack buckets..."
+        empty_args=()
+        for bucket in $stack_buckets; do
+            empty_args+=(--empty-bucket "$bucket")
+        done
+        if ! python3 "$SCRIPT_DIR/cleanup-resources.py" --yes "${empty_args[@]}"; then
+            echo "   ❌ Stack buckets could not be emptied; the stack was not deleted"
+            exit 1
+        fi
+    fi
+
     echo "   Deleting CloudFormation stack..."
-    aws cloudformation delete-stack --stack-name servicenow-spa-creator
+    aws cloudformation delete-stack --stack-name "$STACK_NAME"
     echo "   ⏳ Waiting for stack deletion..."
-    aws cloudformation wait stack-delete-complete --stack-name servicenow-spa-creator
+    if ! aws cloudformation wait stack-delete-complete --stack-name "$STACK_NAME"; then
+        echo "   ❌ Stack deletion failed; see the stack events"
+        exit 1
+    fi
     echo "   ✅ CloudFormation stack deleted"
 fi
 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Full inventory of provisioned SPAs for ServiceNow CMDB reconciliation, read
+# from the resources table with a parallel segmented Scan and streamed out as
+# NDJSON or CSV while the scan runs.
+#
+#   python3 utils/fleet-inventory.py > inventory.ndjson
+#   python3 utils/fleet-inventory.py --format csv --status active --output inventory.csv
+#   python3 utils/fleet-inventory.py --table dev-spa-resources --segments 32 --workers 16
+#
+# Memory stays flat however large the table is: each worker buffers at most a
+# couple of Scan pages and every page is written out as soon as it arrives.
+# The deployed equivalent is GET /inventory on the SPA Creator API.
+
+import argparse
+import os
+import sys
+import time
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(UTILS_DIR), 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+
+import aws_clients  # noqa: E402
+import inventory  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export every provisioned SPA as NDJSON or CSV')
+    parser.add_argument('--table', default='sandbox-spa-resources')
+    parser.add_argument('--format', choices=inventory.FORMATS, default='ndjson')
+    parser.add_argument('--environment', help='only resources in this environment')
+    parser.add_argument('--status', help='only resources with this status, e.g. active')
+    parser.add_argument('--segments', type=int, default=16, help='Scan TotalSegments')
+    parser.add_argument('--workers', type=int, default=8, help='segments scanned at once')
+    parser.add_argument('--page-size', type=int, default=None, help='Scan Limit per page')
+    parser.add_argument('--output', help='file to write (default: stdout)')
+    args = parser.parse_args()
+
+    table = aws_clients.get_table(args.table)
+    pages = inventory.scan_resources(table, environment=args.environment, status=args.status,
+                                     total_segments=args.segments, max_workers=args.workers,
+                                     page_size=args.page_size)
+
+    counted = {'resources': 0}
+
+    def counting(pages):
+        for page in pages:
+            counted['resources'] += len(page)
+            yield page
+
+    started = time.perf_counter()
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in inventory.format_chunks(counting(pages), args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"{counted['resources']} resources in {time.perf_counter() - started:.1f}s "
+          f"({args.segments} segments, {args.workers} workers)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,939 @@
+"""
+In-memory stand-ins for the S3 client and DynamoDB resource used by the Lambda
+handlers, for offline replays and benchmarks.
+
+Only the operations and expression syntax the handlers use are supported.
+Every call is counted, and an optional latency (seconds, or a callable taking
+the operation name) is injected before each operation so timings resemble
+the real services.
+"""
+
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+
+def client_error(code, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}}, operation)
+
+
+class StandIn:
+    """Call counting and latency injection shared by the fake services"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.RLock()
+
+    def _call(self, operation, remote=True):
+        with self.lock:
+            self.calls[operation] += 1
+        if not remote:
+            return
+        delay = self.latency(operation) if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+
+# ----------------------------------------
+# S3
+# ----------------------------------------
+
+class FakeS3(StandIn):
+    """
+    Subset of the boto3 S3 client backed by dicts. Presigning is local work in
+    the real client too; pass a real boto3 S3 client as signer to measure it.
+    """
+
+    def __init__(self, latency=0.0, region='us-east-1', signer=None):
+        super().__init__(latency)
+        self.region = region
+        self.signer = signer
+        self.buckets = {}
+        self.bucket_config = {}
+        self.uploads = {}
+
+    def _bucket(self, bucket, operation):
+        if bucket not in self.buckets:
+            raise client_error('NoSuchBucket', operation, 'The specified bucket does not exist')
+        return self.buckets[bucket]
+
+    def add_object(self, bucket, key, body=b'', content_type='binary/octet-stream'):
+        """Seed an object without counting a call"""
+        self.buckets.setdefault(bucket, {})
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.buckets[bucket][key] = {
+            'Body': body,
+            'Size': len(body),
+            'ContentType': content_type,
+            'ETag': '"%s"' % hashlib.md5(body).hexdigest(),
+            'LastModified': datetime.now(timezone.utc).replace(microsecond=0)
+        }
+
+    def create_bucket(self, Bucket, CreateBucketConfiguration=None, **kwargs):
+        self._call('CreateBucket')
+        with self.lock:
+            if Bucket in self.buckets:
+                raise client_error('BucketAlreadyOwnedByYou', 'CreateBucket')
+            self.buckets[Bucket] = {}
+            self.bucket_config[Bucket] = {}
+        return {'Location': f'/{Bucket}'}
+
+    def head_bucket(self, Bucket):
+        self._call('HeadBucket')
+        self._bucket(Bucket, 'HeadBucket')
+        return {}
+
+    def delete_bucket(self, Bucket):
+        self._call('DeleteBucket')
+        with self.lock:
+            if self._bucket(Bucket, 'DeleteBucket'):
+                raise client_error('BucketNotEmpty', 'DeleteBucket')
+            del self.buckets[Bucket]
+            self.bucket_config.pop(Bucket, None)
+        return {}
+
+    def _put_config(self, operation, Bucket, **config):
+        self._call(operation)
+        self._bucket(Bucket, operation)
+        with self.lock:
+            self.bucket_config.setdefault(Bucket, {})[operation] = config
+        return {}
+
+    def put_bucket_tagging(self, Bucket, **kwargs):
+        return self._put_config('PutBucketTagging', Bucket, **kwargs)
+
+    def put_bucket_website(self, Bucket, **kwargs):
+        return self._put_config('PutBucketWebsite', Bucket, **kwargs)
+
+    def put_public_access_block(self, Bucket, **kwargs):
+        return self._put_config('PutPublicAccessBlock', Bucket, **kwargs)
+
+    def put_bucket_cors(self, Bucket, **kwargs):
+        return self._put_config('PutBucketCors', Bucket, **kwargs)
+
+    def put_bucket_policy(self, Bucket, **kwargs):
+        return self._put_config('PutBucketPolicy', Bucket, **kwargs)
+
+    def put_bucket_notification_configuration(self, Bucket, **kwargs):
+        return self._put_config('PutBucketNotificationConfiguration', Bucket, **kwargs)
+
+    def put_bucket_lifecycle_configuration(self, Bucket, **kwargs):
+        return self._put_config('PutBucketLifecycleConfiguration', Bucket, **kwargs)
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType='binary/octet-stream', **kwargs):
+        self._call('PutObject')
+        self._bucket(Bucket, 'PutObject')
+        with self.lock:
+            self.add_object(Bucket, Key, Body, ContentType)
+        return {'ETag': self.buckets[Bucket][Key]['ETag']}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        objects = self._bucket(Bucket, 'HeadObject')
+        if Key not in objects:
+            raise client_error('404', 'HeadObject', 'Not Found')
+        obj = objects[Key]
+        return {
+            'ContentLength': obj['Size'],
+            'ContentType': obj['ContentType'],
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified']
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call('DeleteObject')
+        with self.lock:
+            self._bucket(Bucket, 'DeleteObject').pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        deleted = []
+        with self.lock:
+            objects = self._bucket(Bucket, 'DeleteObjects')
+            for entry in Delete['Objects']:
+                objects.pop(entry['Key'], None)
+                deleted.append({'Key': entry['Key']})
+        return {'Deleted': deleted}
+
+    def list_object_versions(self, Bucket, Prefix='', KeyMarker=None, MaxKeys=1000, **kwargs):
+        """Buckets here are unversioned, so every object is its single 'null' version"""
+        self._call('ListObjectVersions')
+        with self.lock:
+            keys = sorted(k for k in self._bucket(Bucket, 'ListObjectVersions') if k.startswith(Prefix))
+            objects = self.buckets[Bucket]
+            if KeyMarker:
+                keys = [k for k in keys if k > KeyMarker]
+            page = keys[:MaxKeys]
+            versions = [{
+                'Key': key,
+                'VersionId': 'null',
+                'IsLatest': True,
+                'Size': objects[key]['Size'],
+                'ETag': objects[key]['ETag'],
+                'LastModified': objects[key]['LastModified']
+            } for key in page]
+        response = {'IsTruncated': len(keys) > MaxKeys, 'Prefix': Prefix}
+        if versions:
+            response['Versions'] = versions
+        if response['IsTruncated']:
+            response['NextKeyMarker'] = page[-1]
+            response['NextVersionIdMarker'] = 'null'
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, ContentType='binary/octet-stream', **kwargs):
+        self._call('CreateMultipartUpload')
+        self._bucket(Bucket, 'CreateMultipartUpload')
+        with self.lock:
+            upload_id = hashlib.md5(f'{Bucket}/{Key}/{time.time_ns()}'.encode()).hexdigest()
+            self.uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'ContentType': ContentType, 'Parts': {}}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b'', **kwargs):
+        """What a browser PUT to a presigned UploadPart URL does"""
+        self._call('UploadPart')
+        upload = self._upload(UploadId, 'UploadPart')
+        etag = '"%s"' % hashlib.md5(Body).hexdigest()
+        with self.lock:
+            upload['Parts'][PartNumber] = (etag, Body)
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call('CompleteMultipartUpload')
+        upload = self._upload(UploadId, 'CompleteMultipartUpload')
+        body = b''
+        for part in MultipartUpload['Parts']:
+            stored = upload['Parts'].get(part['PartNumber'])
+            if stored is None or stored[0].strip('"') != part['ETag'].strip('"'):
+                raise client_error('InvalidPart', 'CompleteMultipartUpload')
+            body += stored[1]
+        with self.lock:
+            self.add_object(Bucket, Key, body, upload['ContentType'])
+            del self.uploads[UploadId]
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': self.buckets[Bucket][Key]['ETag']}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload')
+        self._upload(UploadId, 'AbortMultipartUpload')
+        with self.lock:
+            del self.uploads[UploadId]
+        return {}
+
+    def _upload(self, upload_id, operation):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise client_error('NoSuchUpload', operation, 'The specified upload does not exist')
+        return upload
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000,
+                        ContinuationToken=None, StartAfter=None, **kwargs):
+        self._call('ListObjectsV2')
+        with self.lock:
+            keys = sorted(k for k in self._bucket(Bucket, 'ListObjectsV2') if k.startswith(Prefix))
+            objects = self.buckets[Bucket]
+        start_after = ContinuationToken or StartAfter
+        if start_after:
+            keys = [k for k in keys if k > start_after]
+
+        contents, prefixes, last = [], [], None
+        truncated = False
+        for key in keys:
+            if Delimiter and Delimiter in key[len(Prefix):]:
+                common = key[:len(Prefix) + key[len(Prefix):].index(Delimiter) + len(Delimiter)]
+                if prefixes and prefixes[-1] == common:
+                    last = key
+                    continue
+                if len(contents) + len(prefixes) >= MaxKeys:
+                    truncated = True
+                    break
+                prefixes.append(common)
+            else:
+                if len(contents) + len(prefixes) >= MaxKeys:
+                    truncated = True
+                    break
+                obj = objects[key]
+                contents.append({
+                    'Key': key,
+                    'Size': obj['Size'],
+                    'LastModified': obj['LastModified'],
+                    'ETag': obj['ETag']
+                })
+            last = key
+
+        response = {'IsTruncated': truncated, 'KeyCount': len(contents) + len(prefixes), 'Prefix': Prefix}
+        if contents:
+            response['Contents'] = contents
+        if prefixes:
+            response['CommonPrefixes'] = [{'Prefix': p} for p in prefixes]
+        if truncated:
+            response['NextContinuationToken'] = last
+        return response
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        self._call('GeneratePresignedPost', remote=False)
+        if self.signer:
+            return self.signer.generate_presigned_post(Bucket=Bucket, Key=Key, Fields=Fields,
+                                                       Conditions=Conditions, ExpiresIn=ExpiresIn)
+        return {
+            'url': f'https://{Bucket}.s3.amazonaws.com/',
+            'fields': dict(Fields or {}, key=Key, policy='local', **{'x-amz-signature': 'local'})
+        }
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, HttpMethod=None):
+        self._call('GeneratePresignedUrl', remote=False)
+        if self.signer:
+            return self.signer.generate_presigned_url(ClientMethod, Params=Params, ExpiresIn=ExpiresIn,
+                                                      HttpMethod=HttpMethod)
+        params = Params or {}
+        return f"https://{params.get('Bucket')}.s3.amazonaws.com/{params.get('Key', '')}?X-Amz-Signature=local"
+
+
+# ----------------------------------------
+# DynamoDB expressions
+# ----------------------------------------
+
+TOKEN_PATTERN = re.compile(r'\s*(<>|<=|>=|[=<>(),+\-]|[#:]?[A-Za-z_][A-Za-z0-9_.\-]*)')
+KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+
+
+def tokenize(expression):
+    tokens, pos = [], 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if not match:
+            raise ValueError(f'Cannot parse expression near: {expression[pos:]!r}')
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class Expression:
+    """Recursive-descent evaluator for condition, key and update expressions"""
+
+    def __init__(self, expression, names=None, values=None):
+        self.tokens = tokenize(expression)
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def peek_keyword(self):
+        token = self.peek()
+        return token.upper() if token and token.upper() in KEYWORDS else None
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token is None or (expected and token.upper() != expected):
+            raise ValueError(f'Expected {expected or "token"}, got {token!r}')
+        self.pos += 1
+        return token
+
+    def attribute_name(self, token):
+        return self.names[token] if token.startswith('#') else token
+
+    # --- conditions ---
+
+    def evaluate_condition(self, item):
+        self.pos = 0
+        result = self.condition_or(item)
+        if self.peek() is not None:
+            raise ValueError(f'Unexpected token {self.peek()!r}')
+        return result
+
+    def condition_or(self, item):
+        result = self.condition_and(item)
+        while self.peek_keyword() == 'OR':
+            self.take()
+            right = self.condition_and(item)
+            result = result or right
+        return result
+
+    def condition_and(self, item):
+        result = self.condition_not(item)
+        while self.peek_keyword() == 'AND':
+            self.take()
+            right = self.condition_not(item)
+            result = result and right
+        return result
+
+    def condition_not(self, item):
+        if self.peek_keyword() == 'NOT':
+            self.take()
+            return not self.condition_not(item)
+        return self.condition_primary(item)
+
+    def condition_primary(self, item):
+        token = self.peek()
+        if token == '(':
+            self.take()
+            result = self.condition_or(item)
+            self.take(')')
+            return result
+
+        if token in ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains'):
+            self.take()
+            self.take('(')
+            name = self.attribute_name(self.take())
+            argument = None
+            if self.peek() == ',':
+                self.take()
+                argument = self.operand(item)
+            self.take(')')
+            value = item.get(name)
+            if token == 'attribute_exists':
+                return name in item
+            if token == 'attribute_not_exists':
+                return name not in item
+            if value is None:
+                return False
+            if token == 'begins_with':
+                return isinstance(value, str) and value.startswith(argument)
+            return argument in value
+
+        left = self.operand(item)
+        keyword = self.peek_keyword()
+        if keyword == 'BETWEEN':
+            self.take()
+            low = self.operand(item)
+            self.take('AND')
+            high = self.operand(item)
+            return left is not None and low <= left <= high
+        if keyword == 'IN':
+            self.take()
+            self.take('(')
+            options = [self.operand(item)]
+            while self.peek() == ',':
+                self.take()
+                options.append(self.operand(item))
+            self.take(')')
+            return left in options
+
+        operator = self.take()
+        right = self.operand(item)
+        if operator == '=':
+            return left == right
+        if operator == '<>':
+            return left != right
+        if left is None or right is None:
+            return False
+        try:
+            return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[operator]
+        except TypeError:
+            return False
+
+    def operand(self, item):
+        token = self.take()
+        if token.startswith(':'):
+            return self.values[token]
+        if token == 'size':
+            self.take('(')
+            value = item.get(self.attribute_name(self.take()))
+            self.take(')')
+            return len(value) if value is not None else None
+        return item.get(self.attribute_name(token))
+
+    # --- updates ---
+
+    def apply_update(self, item):
+        self.pos = 0
+        while self.peek() is not None:
+            clause = self.take().upper()
+            while True:
+                name = self.attribute_name(self.take())
+                if clause == 'SET':
+                    self.take('=')
+                    item[name] = self.update_value(item)
+                elif clause == 'REMOVE':
+                    item.pop(name, None)
+                elif clause == 'ADD':
+                    value = self.operand(item)
+                    if isinstance(value, set):
+                        item[name] = set(item.get(name, set())) | value
+                    else:
+                        item[name] = item.get(name, 0) + value
+                elif clause == 'DELETE':
+                    item[name] = set(item.get(name, set())) - self.operand(item)
+                else:
+                    raise ValueError(f'Unknown update clause {clause}')
+                if self.peek() != ',':
+                    break
+                self.take()
+
+    def update_value(self, item):
+        value = self.update_term(item)
+        while self.peek() in ('+', '-'):
+            operator = self.take()
+            right = self.update_term(item)
+            value = value + right if operator == '+' else value - right
+        return value
+
+    def update_term(self, item):
+        token = self.peek()
+        if token == 'if_not_exists':
+            self.take()
+            self.take('(')
+            name = self.attribute_name(self.take())
+            self.take(',')
+            default = self.operand(item)
+            self.take(')')
+            return item[name] if name in item else default
+        if token == 'list_append':
+            self.take()
+            self.take('(')
+            first = self.operand(item)
+            self.take(',')
+            second = self.operand(item)
+            self.take(')')
+            return list(first or []) + list(second or [])
+        return self.operand(item)
+
+
+def build_expression(expression, names, values, is_key_condition=False):
+    """Turn boto3 condition objects into (expression, names, values)"""
+    if isinstance(expression, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(expression, is_key_condition)
+        return (
+            built.condition_expression,
+            dict(names or {}, **built.attribute_name_placeholders),
+            dict(values or {}, **built.attribute_value_placeholders)
+        )
+    return expression, names or {}, values or {}
+
+
+def normalize(value):
+    """Numbers come back as Decimal, like the real resource API"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    return value
+
+
+def sort_value(value):
+    return (0, value) if isinstance(value, (int, float, Decimal)) else (1, str(value))
+
+
+# ----------------------------------------
+# DynamoDB
+# ----------------------------------------
+
+class FakeTable:
+    """Subset of the boto3 DynamoDB Table resource"""
+
+    def __init__(self, service, name, hash_key, range_key=None):
+        self.service = service
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.items = {}
+
+    def key_of(self, item):
+        return (item[self.hash_key], item[self.range_key] if self.range_key else None)
+
+    def key_dict(self, item):
+        key = {self.hash_key: item[self.hash_key]}
+        if self.range_key:
+            key[self.range_key] = item[self.range_key]
+        return key
+
+    def check_condition(self, existing, condition, names, values, operation):
+        if condition is None:
+            return
+        expression, names, values = build_expression(condition, names, values)
+        if not Expression(expression, names, normalize(values)).evaluate_condition(existing or {}):
+            raise client_error('ConditionalCheckFailedException', operation, 'The conditional request failed')
+
+    def check_index_keys(self, item, operation):
+        """Like DynamoDB, refuse a write whose index sort key has the wrong type (the item is left out of the index if absent)"""
+        for (table_name, index_name), (sort_key, key_type) in self.service.index_keys.items():
+            if table_name == self.name and sort_key in item and not isinstance(item[sort_key], key_type):
+                raise client_error('ValidationException', operation,
+                                   f'One or more parameter values were invalid: Type mismatch for Index Key '
+                                   f'{sort_key} IndexName: {index_name}')
+
+    def project(self, item, projection, names):
+        if not projection:
+            return copy.deepcopy(item)
+        fields = [names.get(f.strip(), f.strip()) for f in projection.split(',')]
+        return {f: copy.deepcopy(item[f]) for f in fields if f in item}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **kwargs):
+        self.service._call('PutItem')
+        with self.service.lock:
+            key = self.key_of(Item)
+            self.check_condition(self.items.get(key), ConditionExpression, ExpressionAttributeNames,
+                                 ExpressionAttributeValues, 'PutItem')
+            self.check_index_keys(Item, 'PutItem')
+            self.items[key] = normalize(copy.deepcopy(Item))
+        return {}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self.service._call('GetItem')
+        with self.service.lock:
+            item = self.items.get(self.key_of(Key))
+            if item is None:
+                return {}
+            return {'Item': self.project(item, ProjectionExpression, ExpressionAttributeNames or {})}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, **kwargs):
+        self.service._call('DeleteItem')
+        with self.service.lock:
+            key = self.key_of(Key)
+            self.check_condition(self.items.get(key), ConditionExpression, ExpressionAttributeNames,
+                                 ExpressionAttributeValues, 'DeleteItem')
+            self.items.pop(key, None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        self.service._call('UpdateItem')
+        names = ExpressionAttributeNames or {}
+        values = normalize(ExpressionAttributeValues or {})
+        with self.service.lock:
+            key = self.key_of(Key)
+            existing = self.items.get(key)
+            self.check_condition(existing, ConditionExpression, names, values, 'UpdateItem')
+            item = copy.deepcopy(existing) if existing else dict(normalize(Key))
+            Expression(UpdateExpression, names, values).apply_update(item)
+            self.check_index_keys(item, 'UpdateItem')
+            self.items[key] = item
+            if ReturnValues in ('ALL_NEW', 'UPDATED_NEW'):
+                return {'Attributes': copy.deepcopy(item)}
+            if ReturnValues in ('ALL_OLD', 'UPDATED_OLD') and existing:
+                return {'Attributes': copy.deepcopy(existing)}
+        return {}
+
+    def _page(self, operation, candidates, Limit=None, ExclusiveStartKey=None, FilterExpression=None,
+              ProjectionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              Select=None):
+        names = ExpressionAttributeNames or {}
+        candidates = self._after(candidates, ExclusiveStartKey)
+        evaluated = candidates[:Limit] if Limit else candidates
+        if FilterExpression is not None:
+            expression, f_names, f_values = build_expression(FilterExpression, names, ExpressionAttributeValues)
+            matcher = Expression(expression, f_names, normalize(f_values))
+            matched = [item for item in evaluated if matcher.evaluate_condition(item)]
+        else:
+            matched = evaluated
+
+        response = {'Count': len(matched), 'ScannedCount': len(evaluated)}
+        if Select != 'COUNT':
+            response['Items'] = [self.project(item, ProjectionExpression, names) for item in matched]
+        if Limit and len(candidates) > Limit:
+            response['LastEvaluatedKey'] = self.key_dict(evaluated[-1])
+        return response
+
+    def _after(self, candidates, start_key):
+        if not start_key:
+            return candidates
+        start = self.key_of(start_key)
+        position = next((i for i, item in enumerate(candidates) if self.key_of(item) == start), None)
+        return candidates if position is None else candidates[position + 1:]
+
+    def query(self, KeyConditionExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              ScanIndexForward=True, IndexName=None, ConsistentRead=False, ExclusiveStartKey=None,
+              Limit=None, **kwargs):
+        self.service._call('Query')
+        expression, names, values = build_expression(
+            KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, is_key_condition=True
+        )
+        values = normalize(values)
+        matcher = Expression(expression, names, values)
+        # The key condition pins the partition key to one of the values; skip other partitions cheaply
+        partitions = {v for v in values.values() if isinstance(v, (str, Decimal))}
+        with self.service.lock:
+            candidates = [item for item in self.items.values() if IndexName or item[self.hash_key] in partitions]
+            sort_key = self.range_key
+            if IndexName:
+                sort_key = self.service.index_sort_keys.get((self.name, IndexName))
+            if sort_key:
+                candidates.sort(key=lambda item: sort_value(item.get(sort_key, '')), reverse=not ScanIndexForward)
+
+            # Evaluate the key condition only until the page (plus one, to know there is more) is full
+            matched = []
+            for item in self._after(candidates, ExclusiveStartKey):
+                if matcher.evaluate_condition(item):
+                    matched.append(item)
+                    if Limit and len(matched) > Limit:
+                        break
+            # Items are copied as they are returned (project), so no copy of the whole partition
+            return self._page('Query', matched, Limit=Limit, ExpressionAttributeNames=names,
+                              ExpressionAttributeValues=values, **kwargs)
+
+    def scan(self, Segment=None, TotalSegments=None, **kwargs):
+        self.service._call('Scan')
+        with self.service.lock:
+            candidates = sorted(self.items.values(), key=lambda item: tuple(sort_value(k) for k in self.key_of(item)))
+            if TotalSegments:
+                candidates = [
+                    item for item in candidates
+                    if int(hashlib.md5(str(item[self.hash_key]).encode()).hexdigest(), 16) % TotalSegments == Segment
+                ]
+            return self._page('Scan', candidates, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return FakeBatchWriter(self)
+
+
+class FakeBatchWriter:
+    """Buffers writes and flushes them 25 at a time, like the real batch writer"""
+
+    def __init__(self, table):
+        self.table = table
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        while self.buffer:
+            self.flush()
+
+    def put_item(self, Item):
+        self.buffer.append({'PutRequest': {'Item': Item}})
+        if len(self.buffer) >= 25:
+            self.flush()
+
+    def delete_item(self, Key):
+        self.buffer.append({'DeleteRequest': {'Key': Key}})
+        if len(self.buffer) >= 25:
+            self.flush()
+
+    def flush(self):
+        batch, self.buffer = self.buffer[:25], self.buffer[25:]
+        self.table.service._call('BatchWriteItem')
+        with self.table.service.lock:
+            for request in batch:
+                if 'PutRequest' in request:
+                    self.table.check_index_keys(request['PutRequest']['Item'], 'BatchWriteItem')
+            for request in batch:
+                if 'PutRequest' in request:
+                    item = request['PutRequest']['Item']
+                    self.table.items[self.table.key_of(item)] = normalize(copy.deepcopy(item))
+                else:
+                    self.table.items.pop(self.table.key_of(request['DeleteRequest']['Key']), None)
+
+
+class FakeDynamoDBClient:
+    """Low-level client operations reached through dynamodb.meta.client"""
+
+    def __init__(self, service):
+        self.service = service
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+
+    def plain(self, typed):
+        return {k: self.deserializer.deserialize(v) for k, v in (typed or {}).items()}
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        self.service._call('TransactWriteItems')
+        with self.service.lock:
+            # Check every condition first so the transaction is all-or-nothing
+            reasons, writes = [], []
+            for entry in TransactItems:
+                (kind, request), = entry.items()
+                table = self.service.tables[request['TableName']]
+                key = self.plain(request.get('Key')) or table.key_dict(self.plain(request['Item']))
+                existing = table.items.get(table.key_of(key))
+                try:
+                    table.check_condition(existing, request.get('ConditionExpression'),
+                                          request.get('ExpressionAttributeNames'),
+                                          self.plain(request.get('ExpressionAttributeValues')), kind)
+                    reasons.append({'Code': 'None'})
+                except ClientError:
+                    reasons.append({'Code': 'ConditionalCheckFailed'})
+                writes.append((kind, request, table, key, existing))
+
+            if any(reason['Code'] != 'None' for reason in reasons):
+                error = client_error('TransactionCanceledException', 'TransactWriteItems', 'Transaction cancelled')
+                error.response['CancellationReasons'] = reasons
+                raise error
+
+            # A malformed write fails the whole transaction too, before anything is applied
+            results = []
+            for kind, request, table, key, existing in writes:
+                item = None
+                if kind == 'Put':
+                    item = normalize(self.plain(request['Item']))
+                elif kind == 'Update':
+                    item = copy.deepcopy(existing) if existing else dict(normalize(key))
+                    Expression(request['UpdateExpression'], request.get('ExpressionAttributeNames'),
+                               normalize(self.plain(request.get('ExpressionAttributeValues')))).apply_update(item)
+                if item is not None:
+                    table.check_index_keys(item, 'TransactWriteItems')
+                results.append((kind, table, key, item))
+
+            for kind, table, key, item in results:
+                if kind == 'Delete':
+                    table.items.pop(table.key_of(key), None)
+                elif item is not None:
+                    table.items[table.key_of(key)] = item
+        return {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self.service._call('BatchWriteItem')
+        with self.service.lock:
+            for table_name, requests in RequestItems.items():
+                table = self.service.tables[table_name]
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = self.plain(request['PutRequest']['Item'])
+                        table.check_index_keys(item, 'BatchWriteItem')
+                        table.items[table.key_of(item)] = normalize(item)
+                    else:
+                        table.items.pop(table.key_of(self.plain(request['DeleteRequest']['Key'])), None)
+        return {'UnprocessedItems': {}}
+
+
+class FakeDynamoDB(StandIn):
+    """Subset of the boto3 DynamoDB service resource"""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.tables = {}
+        self.index_sort_keys = {}
+        self.index_keys = {}
+        self.meta = type('Meta', (), {})()
+        self.meta.client = FakeDynamoDBClient(self)
+
+    def create_table(self, name, hash_key, range_key=None):
+        self.tables[name] = FakeTable(self, name, hash_key, range_key)
+        return self.tables[name]
+
+    def add_index(self, table_name, index_name, sort_key, key_type=str):
+        """
+        Queries on the index are matched by their key condition and sorted by
+        sort_key; writes giving sort_key a value that is not a key_type fail
+        """
+        self.index_sort_keys[(table_name, index_name)] = sort_key
+        self.index_keys[(table_name, index_name)] = (sort_key, key_type)
+
+    def Table(self, name):
+        if name not in self.tables:
+            raise client_error('ResourceNotFoundException', 'DescribeTable', f'Table {name} not found')
+        return self.tables[name]
+
+
+# ----------------------------------------
+# Throttling
+# ----------------------------------------
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+class ThrottlingEndpoint(StandIn):
+    """
+    Answers a real boto3 client's requests in place of AWS, through botocore's
+    before-send hook, so the client's own retries and pacing run for real.
+    Calls to the operations in limited share a server-side limit of rate per
+    second (bursts of up to burst); beyond it they get 503 SlowDown, like S3's
+    control plane under load. Every other request succeeds with an empty 200.
+    calls counts every attempt and throttled the ones that were refused.
+    """
+
+    THROTTLE_BODY = (b'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>SlowDown</Code>'
+                     b'<Message>Please reduce your request rate.</Message></Error>')
+
+    def __init__(self, rate, burst=None, limited=(), latency=0.0):
+        super().__init__(latency)
+        self.rate = float(rate)
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.limited = frozenset(limited)
+        self.throttled = Counter()
+
+    def attach(self, client):
+        client.meta.events.register('before-send', self.respond, unique_id=f'throttling-endpoint-{id(self)}')
+        return client
+
+    def admit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def respond(self, request, event_name, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        operation = event_name.rsplit('.', 1)[-1]
+        self._call(operation)
+        if operation in self.limited and not self.admit():
+            with self.lock:
+                self.throttled[operation] += 1
+            return AWSResponse(request.url, 503, {'Content-Type': 'application/xml'}, _Body(self.THROTTLE_BODY))
+        return AWSResponse(request.url, 200, {'ETag': '"0"'}, _Body(b''))
+
+    def reset_calls(self):
+        super().reset_calls()
+        with self.lock:
+            self.throttled.clear()
+
+
+# ----------------------------------------
+# Loading handlers
+# ----------------------------------------
+
+def load_handler(path, **stand_ins):
+    """
+    Import a Lambda handler file (their names are not valid module names) and
+    swap its module-level clients, e.g. load_handler(path, s3=fake_s3, table=fake_table).
+    Prewarming is turned off first, so the real boto3 clients are never built.
+    """
+    import importlib.util
+    import os
+    import sys
+
+    # Shared modules (aws_clients, provisioning_engine, ...) sit next to the handlers
+    handler_dir = os.path.dirname(os.path.abspath(path))
+    if handler_dir not in sys.path:
+        sys.path.insert(0, handler_dir)
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_DEFAULT_REGION', os.environ['AWS_REGION'])
+    os.environ.setdefault('AWS_CLIENTS_PREWARM', 'false')
+    name = os.path.splitext(os.path.basename(path))[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for attribute, value in stand_ins.items():
+        setattr(module, attribute, value)
+    # The backend router dispatches to handler modules of its own; they get the same stand-ins
+    for handler in getattr(module, 'HANDLER_MODULES', ()):
+        for attribute, value in stand_ins.items():
+            if hasattr(handler, attribute):
+                setattr(handler, attribute, value)
+    return module
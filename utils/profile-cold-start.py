@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# Cold-start profile of the Lambda handlers. Each handler is imported in a fresh
+# interpreter under `python -X importtime`, and the cold start is split into:
+#
+#   init            importing the handler module (what Lambda bills as Init Duration),
+#                   which creates the clients it prewarms - real boto3, dummy credentials
+#   lazy clients    the clients the handler leaves to first use
+#   first request   the first invocation, against the in-memory stand-ins
+#   warm request    the second invocation, for comparison
+#
+# The cold start total is the sum of the first three, i.e. what the first caller waits for.
+#
+#   python3 utils/profile-cold-start.py
+#   python3 utils/profile-cold-start.py --handler backend-list-bucket --top 15
+#   python3 utils/profile-cold-start.py --lazy     # AWS_CLIENTS_PREWARM=false, for comparison
+#
+# The slowest imports of each phase come from the importtime report. Run the
+# same handler a few times: the first run also pays for cold .pyc and disk caches.
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(UTILS_DIR), 'lambda')
+
+ENVIRONMENT = 'sandbox'
+REGION = 'us-east-1'
+RESOURCES_TABLE = f'{ENVIRONMENT}-spa-resources'
+MANIFEST_TABLE = f'{ENVIRONMENT}-spa-object-manifest'
+BUCKET = f'{ENVIRONMENT}-spa-john-doe-a1b2c3d4'
+USERNAME = 'john.doe'
+HANDLERS = ('spa-creator-lambda', 'backend-list-bucket', 'backend-upload-url', 'backend-user-info',
+            'backend-router', 'manifest-indexer')
+MARKER = 'cold-start-phase:'
+
+
+def http_event(method, body=None, query=None, route=None):
+    event = {'requestContext': {'http': {'method': method}}}
+    if body is not None:
+        event['body'] = json.dumps(body)
+    if query is not None:
+        event['queryStringParameters'] = query
+    if route:
+        event['routeKey'] = f'{method} {route}'
+    return event
+
+
+def first_events(name):
+    """Two requests of the kind the handler mostly serves (different, so nothing is cached)"""
+    if name == 'spa-creator-lambda':
+        return [http_event('POST', {'username': f'cold.start{n}'}) for n in range(2)]
+    if name == 'backend-list-bucket':
+        return [http_event('GET', query={'bucket': BUCKET, 'prefix': prefix}) for prefix in ('docs/', 'img/')]
+    if name == 'backend-upload-url':
+        return [http_event('POST', {'bucket': BUCKET, 'filename': f'report-{n}.pdf', 'contentType': 'application/pdf'},
+                           route='/upload-url') for n in range(2)]
+    if name == 'backend-user-info':
+        return [http_event('GET', query={'username': USERNAME}) for _ in range(2)]
+    if name == 'backend-router':
+        return [http_event('GET', query={'bucket': BUCKET}, route='/bucket-contents'),
+                http_event('POST', {'bucket': BUCKET, 'filename': 'report.pdf'}, route='/upload-url')]
+    return [{'Records': [{
+        'eventName': 'ObjectCreated:Put', 'eventTime': '2026-02-06T15:30:00.000Z',
+        's3': {'bucket': {'name': BUCKET}, 'object': {'key': key, 'size': 5, 'eTag': 'e', 'sequencer': '0A'}}
+    }]} for key in ('docs/a.txt', 'docs/b.txt')]
+
+
+def mark(phase):
+    sys.stderr.write(f"{MARKER}{phase}\n")
+    sys.stderr.flush()
+
+
+def profile_child(name):
+    """Runs in the fresh interpreter; prints the phase timings as JSON"""
+    sys.path.insert(0, LAMBDA_DIR)
+    mark('init')
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(LAMBDA_DIR, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    init_ms = (time.perf_counter() - started) * 1000
+
+    # What the first request would otherwise create on first use; prewarmed clients are already memoized
+    mark('clients')
+    aws_clients = sys.modules['aws_clients']
+    clients = {}
+    # A router's handlers share memoized clients, so their second S3 client or table costs nothing
+    for prefix, declaring in [('', module)] + [(f"{handler.__name__}.", handler)
+                                               for handler in getattr(module, 'HANDLER_MODULES', ())]:
+        for attribute, value in vars(declaring).items():
+            if isinstance(value, aws_clients.Lazy):
+                started = time.perf_counter()
+                value.resolve()
+                clients[prefix + attribute] = (time.perf_counter() - started) * 1000
+    mark('done')
+
+    # Everything below is harness, not cold start
+    sys.path.insert(0, UTILS_DIR)
+    from local_aws import FakeDynamoDB, FakeS3
+    s3 = FakeS3(region=REGION)
+    dynamodb = FakeDynamoDB()
+    resources = dynamodb.create_table(RESOURCES_TABLE, 'username', 'createdAt')
+    manifest = dynamodb.create_table(MANIFEST_TABLE, 'bucket', 'key')
+    s3.create_bucket(Bucket=BUCKET)
+    for key in ('docs/a.txt', 'docs/b.txt', 'img/logo.png'):
+        s3.add_object(BUCKET, key, b'hello')
+    resources.put_item(Item={'username': USERNAME, 'createdAt': '2026-02-06T15:30:00.000000',
+                             'bucketName': BUCKET, 'status': 'active'})
+    stand_ins = {'s3': s3, 'dynamodb': dynamodb, 'table': resources, 'manifest': manifest}
+    for target in (module,) + tuple(getattr(module, 'HANDLER_MODULES', ())):
+        for attribute, value in stand_ins.items():
+            if hasattr(target, attribute):
+                setattr(target, attribute, value)
+
+    requests = []
+    for event in first_events(name):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = module.lambda_handler(event, None)
+        requests.append({'ms': (time.perf_counter() - started) * 1000,
+                         'status': response.get('statusCode') if isinstance(response, dict) else None})
+
+    print(json.dumps({'init_ms': init_ms, 'clients': clients, 'requests': requests}))
+
+
+def parse_importtime(stderr):
+    """Top-level imports per phase from the -X importtime report: {phase: [(module, ms)]}"""
+    phases, phase = {}, None
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            phase = line[len(MARKER):]
+            continue
+        if phase not in ('init', 'clients') or not line.startswith('import time:'):
+            continue
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        module = parts[2].rstrip()
+        # Nested imports are indented; their time is already in their parent's cumulative
+        if module.startswith('  '):
+            continue
+        phases.setdefault(phase, []).append((module.strip(), int(parts[1]) / 1000))
+    return phases
+
+
+def profile(name, lazy=False):
+    env = dict(os.environ)
+    env.update({
+        'AWS_REGION': REGION,
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'AKIACOLDSTART',
+        'AWS_SECRET_ACCESS_KEY': 'cold-start',
+        'ENVIRONMENT_NAME': ENVIRONMENT,
+        'DYNAMODB_TABLE': RESOURCES_TABLE,
+        'MANIFEST_TABLE': MANIFEST_TABLE,
+        'BACKEND_API_URL': 'https://api.example.com/prod',
+        'PYTHONDONTWRITEBYTECODE': '1',
+        'AWS_CLIENTS_PREWARM': 'false' if lazy else 'true'
+    })
+    result = subprocess.run([sys.executable, '-X', 'importtime', __file__, '--child', name],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_importtime(result.stderr)
+    return timings
+
+
+def print_profile(name, timings, top):
+    clients_ms = sum(timings['clients'].values())
+    first, warm = timings['requests'][0], timings['requests'][1]
+    print(f"{name}.py")
+    print(f"  {'init (import, prewarm)':24s} {timings['init_ms']:8.1f} ms")
+    print(f"  {'lazy clients':24s} {clients_ms:8.1f} ms   " +
+          ', '.join(f"{attribute} {ms:.1f}" for attribute, ms in timings['clients'].items()))
+    status = f"status {first['status']}, " if first['status'] else ''
+    print(f"  {'first request':24s} {first['ms']:8.1f} ms   ({status}stand-ins)")
+    print(f"  {'warm request':24s} {warm['ms']:8.1f} ms")
+    print(f"  {'cold start total':24s} {timings['init_ms'] + clients_ms + first['ms']:8.1f} ms")
+    for phase in ('init', 'clients'):
+        slowest = sorted(timings['imports'].get(phase, []), key=lambda entry: -entry[1])[:top]
+        if slowest:
+            print(f"  slowest imports during {phase}: " + ', '.join(f"{module} {ms:.1f}" for module, ms in slowest))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile handler cold starts: imports, client creation, first request')
+    parser.add_argument('--handler', action='append', help='handler name (or prefix); repeatable, default all')
+    parser.add_argument('--top', type=int, default=8, help='slowest imports to show per phase')
+    parser.add_argument('--json', action='store_true', help='print the raw timings as JSON')
+    parser.add_argument('--lazy', action='store_true', help='leave every client to first use (AWS_CLIENTS_PREWARM=false)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        profile_child(args.child)
+        return
+
+    names = [name for name in HANDLERS if not args.handler or any(name.startswith(h) for h in args.handler)]
+    results = {name: profile(name, args.lazy) for name in names}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, timings in results.items():
+        print_profile(name, timings, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+# Rebuild the object manifest of SPA buckets from a full S3 listing
+#
+#   ./reconcile-manifest.sh                      every sandbox-spa-* bucket
+#   ./reconcile-manifest.sh sandbox-spa-john-... only the given buckets
+#
+# Run it once after enabling the manifest for buckets created before it existed,
+# and for any bucket whose listing has drifted from its contents.
+
+FUNCTION_NAME="sandbox-manifest-indexer"
+
+if [ $# -gt 0 ]; then
+    BUCKETS="$*"
+else
+    BUCKETS=$(aws s3 ls | grep sandbox-spa | awk '{print $3}')
+fi
+
+if [ -z "$BUCKETS" ]; then
+    echo "No SPA buckets found"
+    exit 0
+fi
+
+for bucket in $BUCKETS; do
+    echo "Reconciling manifest of: $bucket"
+    aws lambda invoke \
+        --function-name "$FUNCTION_NAME" \
+        --cli-binary-format raw-in-base64-out \
+        --payload "{\"reconcile\": {\"buckets\": [\"$bucket\"]}}" \
+        /tmp/reconcile-manifest.json > /dev/null
+    cat /tmp/reconcile-manifest.json
+    echo ""
+done
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Replay S3 event fixtures through the manifest indexer against the in-memory
+# S3/DynamoDB stand-ins, reconcile, then list the bucket from the manifest.
+#
+#   python3 utils/replay-manifest-events.py
+#   python3 utils/replay-manifest-events.py --objects 20000 utils/fixtures/s3-01-object-created.json
+#
+# Without fixture arguments every file in utils/fixtures/s3-*.json is replayed
+# in name order.
+
+import argparse
+import glob
+import json
+import os
+import sys
+from urllib.parse import unquote_plus
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(UTILS_DIR), 'lambda')
+sys.path.insert(0, UTILS_DIR)
+
+from local_aws import FakeDynamoDB, FakeS3, load_handler  # noqa: E402
+
+BUCKET = 'sandbox-spa-john-doe-a1b2c3d4'
+CONTENT_TYPES = {'.html': 'text/html', '.pdf': 'application/pdf', '.png': 'image/png'}
+
+
+def content_type_for(key):
+    return CONTENT_TYPES.get(os.path.splitext(key)[1], 'binary/octet-stream')
+
+
+def mirror_in_s3(s3, event, sequencers):
+    """Make the fake bucket match what the events describe; redelivered older events change nothing"""
+    for record in event.get('Records', []):
+        key = unquote_plus(record['s3']['object']['key'])
+        sequencer = record['s3']['object']['sequencer'].rjust(32, '0')
+        if sequencer <= sequencers.get(key, ''):
+            continue
+        sequencers[key] = sequencer
+        if record['eventName'].startswith('ObjectCreated:'):
+            s3.add_object(BUCKET, key, b'x' * record['s3']['object']['size'], content_type_for(key))
+            s3.buckets[BUCKET][key]['ETag'] = '"%s"' % record['s3']['object']['eTag']
+        else:
+            s3.buckets[BUCKET].pop(key, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay S3 events into the object manifest')
+    parser.add_argument('fixtures', nargs='*')
+    parser.add_argument('--objects', type=int, default=0, help='extra objects to seed before reconciling')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    fixtures = args.fixtures or sorted(glob.glob(os.path.join(UTILS_DIR, 'fixtures', 's3-*.json')))
+
+    s3 = FakeS3()
+    dynamodb = FakeDynamoDB()
+    resources = dynamodb.create_table('sandbox-spa-resources', 'username', 'createdAt')
+    manifest = dynamodb.create_table('sandbox-spa-object-manifest', 'bucket', 'key')
+
+    # Uploaded during provisioning, before anything was indexed - reconcile picks them up
+    s3.create_bucket(Bucket=BUCKET)
+    s3.add_object(BUCKET, 'index.html', b'<html></html>', 'text/html')
+    s3.add_object(BUCKET, 'error.html', b'<html></html>', 'text/html')
+    for n in range(args.objects):
+        s3.add_object(BUCKET, f'bulk/object-{n:06d}.bin', b'x' * (n % 4096))
+
+    os.environ['MANIFEST_TABLE'] = manifest.name
+    os.environ['DYNAMODB_TABLE'] = resources.name
+    indexer = load_handler(os.path.join(LAMBDA_DIR, 'manifest-indexer.py'), s3=s3, manifest=manifest)
+    lister = load_handler(os.path.join(LAMBDA_DIR, 'backend-list-bucket.py'),
+                          s3=s3, table=resources, manifest=manifest)
+
+    sequencers = {}
+    for path in fixtures:
+        with open(path) as f:
+            event = json.load(f)
+        mirror_in_s3(s3, event, sequencers)
+        print(f"{os.path.basename(path)}: {indexer.lambda_handler(event, None)}")
+
+    print(f"reconcile: {indexer.lambda_handler({'reconcile': {'buckets': [BUCKET]}}, None)}")
+
+    s3.reset_calls()
+    dynamodb.reset_calls()
+    response = lister.lambda_handler(
+        {'queryStringParameters': {'bucket': BUCKET, 'limit': str(args.limit)}}, None
+    )
+    body = json.loads(response['body'])
+    print()
+    print(f"GET /bucket-contents -> {response['statusCode']}, {body['fileCount']} file(s), hasMore={body['hasMore']}")
+    for entry in body['files'][:10]:
+        print(f"  {entry['name']:40s} {entry['size']:8d}  {entry['lastModified']}")
+    print(f"S3 calls: {dict(s3.calls)}  DynamoDB calls: {dict(dynamodb.calls)}")
+
+
+if __name__ == '__main__':
+    main()
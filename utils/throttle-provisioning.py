@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Batch SPA provisioning against an S3 control plane that throttles. The creator
+# runs unchanged with a real boto3 S3 client from aws_clients.py, whose requests are
+# answered by local_aws.ThrottlingEndpoint: bucket-configuration calls beyond
+# --limit per second get 503 SlowDown, so retries and control-plane pacing run
+# for real. DynamoDB is the in-memory stand-in.
+#
+#   python3 utils/throttle-provisioning.py
+#   python3 utils/throttle-provisioning.py --users 100 --limit 10 --vs-defaults
+#   python3 utils/throttle-provisioning.py --pacing-rate 0 --retry-mode standard
+#
+# --vs-defaults runs the same batch a second time with boto3's own defaults
+# (legacy retries, 5 attempts, 10 connections, no pacing) for comparison.
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(UTILS_DIR), 'lambda')
+sys.path.insert(0, UTILS_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+REGION = 'us-east-1'
+TABLE = 'sandbox-spa-resources'
+
+
+def configure(args):
+    """aws_clients reads its tuning at import, so the environment is set first"""
+    os.environ.update({
+        'AWS_REGION': REGION,
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'AKIATHROTTLETEST',
+        'AWS_SECRET_ACCESS_KEY': 'throttle-test',
+        'ENVIRONMENT_NAME': 'sandbox',
+        'DYNAMODB_TABLE': TABLE,
+        'LOG_LEVEL': 'ERROR',
+        'GZIP_UPLOADS': 'false',
+        'BATCH_MAX_USERS': str(args.users),
+        'BATCH_MAX_CONCURRENCY': str(args.concurrency),
+        'AWS_RETRY_MODE': args.retry_mode,
+        'AWS_MAX_ATTEMPTS': str(args.max_attempts),
+        'AWS_MAX_POOL_CONNECTIONS': str(args.pool),
+        'S3_CONTROL_PLANE_RATE': str(args.pacing_rate),
+        'S3_CONTROL_PLANE_BURST': str(args.pacing_burst)
+    })
+
+
+def run(args):
+    configure(args)
+    import aws_clients
+    import aws_metrics
+    from local_aws import FakeDynamoDB, ThrottlingEndpoint, load_handler
+
+    endpoint = ThrottlingEndpoint(args.limit, burst=args.burst, limited=aws_clients.S3_CONTROL_PLANE_OPERATIONS,
+                                  latency=args.latency_ms / 1000.0)
+    s3 = endpoint.attach(aws_clients.get_client('s3'))
+    dynamodb = FakeDynamoDB()
+    table = dynamodb.create_table(TABLE, 'username', 'createdAt')
+    dynamodb.add_index(TABLE, 'expiry-index', 'expiresAt')
+    metrics = aws_metrics.LocalExporter()
+    aws_metrics.set_exporter(metrics)
+
+    creator = load_handler(os.path.join(LAMBDA_DIR, 'spa-creator-lambda.py'), s3=s3, dynamodb=dynamodb, table=table)
+    event = {
+        'requestContext': {'http': {'method': 'POST'}},
+        'body': json.dumps({'usernames': [f'load.user{n}' for n in range(args.users)]})
+    }
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        response = creator.lambda_handler(event, None)
+    elapsed = time.perf_counter() - started
+
+    body = json.loads(response['body'])
+    operations = metrics.invocations[-1]['operations'] if metrics.invocations else {}
+    return {
+        'label': args.label,
+        'succeeded': body.get('succeeded', 0),
+        'failed': body.get('failed', args.users),
+        'seconds': round(elapsed, 2),
+        'spasPerSecond': round(body.get('succeeded', 0) / elapsed, 2),
+        'attempts': sum(count for operation, count in endpoint.calls.items() if operation in endpoint.limited),
+        'throttled': sum(endpoint.throttled.values()),
+        'retries': sum(stats['retries'] for stats in operations.values())
+    }
+
+
+def print_result(result):
+    print(f"{result['label']:10s} {result['succeeded']:5d} ok {result['failed']:5d} failed "
+          f"{result['seconds']:8.2f}s {result['spasPerSecond']:7.2f} SPAs/s  "
+          f"{result['attempts']} control-plane attempts, {result['throttled']} throttled, "
+          f"{result['retries']} retries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch provisioning against a throttling S3 control plane')
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8, help='BATCH_MAX_CONCURRENCY')
+    parser.add_argument('--limit', type=float, default=20, help='control-plane calls per second S3 accepts')
+    parser.add_argument('--burst', type=int, default=None, help='calls S3 accepts at once (default --limit)')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='latency of every S3 request')
+    parser.add_argument('--retry-mode', default='adaptive')
+    parser.add_argument('--max-attempts', type=int, default=8)
+    parser.add_argument('--pool', type=int, default=50, help='AWS_MAX_POOL_CONNECTIONS')
+    parser.add_argument('--pacing-rate', type=float, default=20, help='S3_CONTROL_PLANE_RATE (0 disables pacing)')
+    parser.add_argument('--pacing-burst', type=int, default=20, help='S3_CONTROL_PLANE_BURST')
+    parser.add_argument('--vs-defaults', action='store_true', help='also run with boto3 defaults and no pacing')
+    parser.add_argument('--label', default='tuned', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result))
+        return
+
+    print(f"{args.users} SPAs, {args.concurrency} at a time; S3 accepts {args.limit:g} control-plane calls/s")
+    print_result(result)
+    if args.vs_defaults:
+        # The tuning is read at import, so the other configuration gets a fresh interpreter
+        command = [sys.executable, os.path.abspath(__file__), '--json', '--label', 'defaults',
+                   '--users', str(args.users), '--concurrency', str(args.concurrency), '--limit', str(args.limit),
+                   '--latency-ms', str(args.latency_ms), '--retry-mode', 'legacy', '--max-attempts', '5',
+                   '--pool', '10', '--pacing-rate', '0']
+        if args.burst:
+            command += ['--burst', str(args.burst)]
+        print_result(json.loads(subprocess.check_output(command, text=True).strip().splitlines()[-1]))
+
+
+if __name__ == '__main__':
+    main()